@@ -14,6 +14,36 @@ app.conf.beat_schedule = {
         "schedule": crontab(minute="*/10"),
         "options": {"queue": "expired"},
     },
+    # keep PayMob auth token warm before CACHE_LIFETIME (30m) runs out
+    "refresh-paymob-token-every-20m": {
+        "task": "zoolflow.transactions.tasks.refresh_paymob_token_task",
+        "schedule": crontab(minute="*/20"),
+        "options": {"queue": "provider"},
+    },
+    # safety net for webhook events whose drain was not scheduled or failed
+    "drain-webhook-inbox-every-30s": {
+        "task": "zoolflow.transactions.tasks.drain_webhook_inbox_task",
+        "schedule": 30.0,
+        "options": {"queue": "provider"},
+    },
+    # transactions that never received a webhook, runs within RECONCILE_TIME_BUDGET
+    "reconcile-stuck-transactions-every-5m": {
+        "task": "zoolflow.transactions.tasks.reconcile_stuck_transactions_task",
+        "schedule": crontab(minute="*/5"),
+        "options": {"queue": "provider"},
+    },
+    # staff analytics totals lag transitions by at most this interval
+    "fold-transaction-rollups-every-15s": {
+        "task": "zoolflow.transactions.tasks.fold_transaction_rollups_task",
+        "schedule": 15.0,
+        "options": {"queue": "celery"},
+    },
+    # keep the live transactions table small, off-peak
+    "archive-transactions-daily": {
+        "task": "zoolflow.transactions.tasks.archive_transactions_task",
+        "schedule": crontab(hour=3, minute=30),
+        "options": {"queue": "celery"},
+    },
 }
 app.autodiscover_tasks()
 
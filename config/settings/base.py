@@ -205,7 +205,7 @@ SIMPLE_JWT = {
 }
 
 # MailGun Configuration
-MAILGUN_BASE_URL = "https://api.mailgun.net"
+MAILGUN_BASE_URL = env("MAILGUN_BASE_URL", default="https://api.mailgun.net")
 MAILGUN_API_KEY = env("MAILGUN_API_KEY")
 EMAIL_DOMAIN = env("EMAIL_DOMAIN")
 MAILGUN_WEBHOOK_SIGINING_KEY = env("MAILGUN_WEBHOOK_SIGINING_KEY")
@@ -228,9 +228,78 @@ AUTH_PAYMOB_TOKEN = env("AUTH_PAYMOB_TOKEN")
 ORDER_PAYMOB_URL = env("ORDER_PAYMOB_URL")
 PAYMOB_PAYMENT_URL_KEY = env("PAYMOB_PAYMENT_URL_KEY")
 PAYMOB_PAYMENT_KEY = env("PAYMOB_PAYMENT_KEY")
+PAYMOB_PAYMENT_KEY_EXPIRATION = 60 * 60  # payment key lifetime asked from PayMob
+PAYMOB_PAYMENT_KEY_MIN_LIFETIME = 60 * 5  # older keys are reissued on resume
+PAYMOB_TRANSACTION_URL = env(
+    "PAYMOB_TRANSACTION_URL",
+    default="https://accept.paymob.com/api/acceptance/transactions/{transaction_id}",
+)
+PAYMOB_INQUIRY_URL = env(
+    "PAYMOB_INQUIRY_URL",
+    default="https://accept.paymob.com/api/ecommerce/orders/transaction_inquiry",
+)
 HMAC_SECRET_KEY = env("HMAC_SECRET_KEY")
+# webhook inbox drained in batches, events left after max attempts fail.
+# A drain starts no provider lookup after its time budget, the rest of the
+# inbox goes to the next drain
+PAYMOB_WEBHOOK_BATCH_SIZE = 100
+PAYMOB_WEBHOOK_MAX_ATTEMPTS = 5
+PAYMOB_WEBHOOK_DRAIN_DELAY = 1
+PAYMOB_WEBHOOK_DRAIN_TIME_BUDGET = 30
+# redeliveries of an accepted callback are ignored for this long
+PAYMOB_WEBHOOK_DEDUPE_TTL = 60 * 60 * 24
+# compute webhook state from the verified payload, re-fetch a sampled share
+PAYMOB_WEBHOOK_TRUST_PAYLOAD = env.bool("PAYMOB_WEBHOOK_TRUST_PAYLOAD", default=True)
+PAYMOB_WEBHOOK_CROSS_CHECK_RATE = env.float(
+    "PAYMOB_WEBHOOK_CROSS_CHECK_RATE", default=0.0
+)
+# reconciliation sweep of INITIATED/PENDING transactions without webhook
+RECONCILE_STUCK_AFTER = 60 * 30
+RECONCILE_ABANDON_AFTER = 60 * 60 * 24  # unpaid orders become FAILED
+RECONCILE_RESUME_WINDOW = 60 * 45  # INITIATED rows younger than this are resumed
+RECONCILE_CHUNK_SIZE = 200
+RECONCILE_CONCURRENCY = 8
+RECONCILE_RATE_LIMIT = 10  # provider requests per second
+RECONCILE_TIME_BUDGET = 60 * 4
+# rollup outbox rows folded per DB transaction
+ROLLUP_FOLD_BATCH_SIZE = 5000
+# terminal transactions untouched this long move to the archive table,
+# in batches within ARCHIVE_TIME_BUDGET per run
+ARCHIVE_AFTER = 60 * 60 * 24 * 90
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_TIME_BUDGET = 60 * 10
 CACHE_LIFETIME = 60 * 30
+# refresh the auth token during its last 5 minutes and let cold-cache
+# callers wait this long for the process fetching it
+PAYMOB_TOKEN_REFRESH_AHEAD = 60 * 5
+PAYMOB_TOKEN_WAIT_TIMEOUT = 5
+# process-local tier in front of redis for provider data, a rotation in
+# redis reaches every process within PROVIDER_CACHE_VERSION_CHECK seconds
+PROVIDER_LOCAL_CACHE_SIZE = 128
+PROVIDER_LOCAL_CACHE_TTL = 60
+PROVIDER_CACHE_VERSION_CHECK = 5
 CONNECTION_TIMEOUT = (5, 15)
+# PayMob time budgets, retries included: token + order + payment key of one
+# checkout, any other single call. Retries use full-jitter backoff (or the
+# Retry-After answer) and never start with less than MIN_ATTEMPT seconds left
+PAYMOB_CHECKOUT_DEADLINE = 8
+PAYMOB_CALL_DEADLINE = 10
+PROVIDER_RETRY_ATTEMPTS = 3
+PROVIDER_RETRY_BACKOFF = 0.2
+PROVIDER_RETRY_BACKOFF_CAP = 2.0
+PROVIDER_RETRY_MIN_ATTEMPT = 0.5
+# Idempotency-Key on transaction create: first response kept this long,
+# duplicates wait up to IDEMPOTENCY_WAIT_TIMEOUT for the in-flight one
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+# run order/payment-key creation on the "provider" celery queue
+# instead of the request thread (POST answers 202 with INITIATED state)
+PROVIDER_ASYNC_ORCHESTRATION = env.bool("PROVIDER_ASYNC_ORCHESTRATION", default=False)
+# bulk create endpoint, provider steps share the "paymob" connection pool
+# so keep the concurrency below its POOL_MAXSIZE
+BULK_TRANSACTION_MAX_ITEMS = 500
+BULK_TRANSACTION_CONCURRENCY = 16
 SUPPORTED_COUNTRIES = {
     "Egypt": "EGP",
     "Jordan": "JOD",
@@ -238,6 +307,56 @@ SUPPORTED_COUNTRIES = {
     "Pakistan": "PKR",
     "United Arab Emirates": "AED",
 }
+# Outbound HTTP transport, one keep-alive pool per upstream host
+HTTP_TRANSPORT = {
+    "default": {
+        "POOL_CONNECTIONS": 4,
+        "POOL_MAXSIZE": 10,
+        "POOL_BLOCK": True,
+        "POOL_TIMEOUT": 5,
+        "TIMEOUT": (5, 15),
+    },
+    "paymob": {"POOL_MAXSIZE": 20, "TIMEOUT": CONNECTION_TIMEOUT},
+    "mailgun": {"TIMEOUT": (5, 5)},
+}
+# Circuit breakers shared through redis, missing keys use DEFAULT_BREAKER
+# (transactions/services/circuit_breaker.py). PayMob opens when half of
+# the calls of a 30s window fail or 80% take longer than SLOW_CALL_SECONDS.
+CIRCUIT_BREAKERS = {
+    "paymob": {
+        "WINDOW": 30,
+        "MIN_CALLS": 10,
+        "FAILURE_RATE": 0.5,
+        "SLOW_CALL_SECONDS": 5,
+        "SLOW_RATE": 0.8,
+        "OPEN_SECONDS": 30,
+        "PROBE_INTERVAL": 5,
+        "PROBE_CALLS": 3,
+        "CLOSE_AFTER": 3,
+    },
+}
+# Token buckets shared through redis for outbound PayMob calls, one per
+# endpoint class (transactions/services/rate_limit.py): RATE requests per
+# second, bursts of BURST. Background jobs (reconciler, bulk create) leave
+# BACKGROUND_RESERVE of each bucket to live checkouts, nobody waits more
+# than MAX_WAIT seconds for a token. Buckets left out are not limited.
+PAYMOB_RATE_LIMITS = {
+    "auth": {"RATE": 1, "BURST": 5},
+    "order": {"RATE": 20, "BURST": 40, "BACKGROUND_RESERVE": 0.5, "MAX_WAIT": 2},
+    "payment_key": {"RATE": 20, "BURST": 40, "BACKGROUND_RESERVE": 0.5, "MAX_WAIT": 2},
+    "lookup": {"RATE": 10, "BURST": 20, "BACKGROUND_RESERVE": 0.5, "MAX_WAIT": 2},
+}
+# Concurrent calls coalesced into one upstream call per key, missing keys
+# use DEFAULT_SINGLE_FLIGHT (transactions/services/single_flight.py).
+# Transaction state lookups share their answer for RESULT_TTL seconds,
+# LEASE outlives one PayMob call.
+SINGLE_FLIGHTS = {
+    "paymob_flags": {
+        "RESULT_TTL": 1,
+        "LEASE": PAYMOB_CALL_DEADLINE + 1,
+        "POLL_INTERVAL": 0.05,
+    },
+}
 # Redis cache config
 REDIS_URL_CACHE = "redis://localhost:6379/1"
 CACHES = {
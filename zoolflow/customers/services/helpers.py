@@ -31,13 +31,84 @@ def country_and_currency(customer_id, username):
     address = Address.objects.filter(
         customer_id=customer_id,
         main_address=True,
+    ).first()
+    currency = _main_address_currency(address, username)
+    logger.info(
+        f"Customer {username} local currency has been successfully determined",
     )
+
+    return currency, address
+
+
+def billing_snapshot(customer_id):
+    """
+    Return the currency and provider billing data of the customer's main
+    address. Address, customer and user come from a single query, the result
+    is frozen on the transaction so provider calls never re-read them.
+    """
+    address = (
+        Address.objects.select_related("customer__user")
+        .filter(customer_id=customer_id, main_address=True)
+        .first()
+    )
+    return _address_snapshot(address, customer_id)
+
+
+def billing_snapshots(customer_ids):
+    """
+    billing_snapshot of many customers in one query.
+
+    Return ``{customer_id: snapshot}``, customers without a usable main
+    address map to their SupportedCountryError instead.
+    """
+    addresses = {
+        address.customer_id: address
+        for address in Address.objects.select_related("customer__user").filter(
+            customer_id__in=customer_ids, main_address=True
+        )
+    }
+    snapshots = {}
+    for customer_id in set(customer_ids):
+        try:
+            snapshots[customer_id] = _address_snapshot(
+                addresses.get(customer_id), customer_id
+            )
+        except SupportedCountryError as e:
+            snapshots[customer_id] = e
+    return snapshots
+
+
+def _address_snapshot(address, customer_id):
+    customer = address.customer if address else None
+    username = customer.user.username if customer else customer_id
+    currency = _main_address_currency(address, username)
+    return {
+        "currency": currency,
+        "billing_data": {
+            "apartment": address.apartment_number or "NA",
+            "email": customer.user.email or "Na",
+            "first_name": customer.first_name or "NA",
+            "last_name": customer.last_name or "un-known",
+            "street": address.line or "NA",
+            "building": address.building_number or "NA",
+            "phone_number": customer.phone_number or "NA",
+            "postal_code": address.postal_code or "NA",
+            "city": address.city or "NA",
+            "country": address.country.name or "NA",
+            "state": address.state or "NA",
+        },
+    }
+
+
+def _main_address_currency(address, username):
+    """
+    Return the currency of our supported countries for the main address
+    """
     if not address:
         logger.error(f"There is no main address specified for {username}.")
         raise SupportedCountryError(
             message="There is no main address specified", details="Address"
         )
-    address = address.first()
     # Get currency for that country based on our supported countries
     currency = getattr(settings, "SUPPORTED_COUNTRIES", {}).get(address.country.name)
     if not currency:
@@ -46,8 +117,4 @@ def country_and_currency(customer_id, username):
             f"Country {address.country.name} not supported",
             details="Currency",
         )
-    logger.info(
-        f"Customer {username} local currency has been successfully determined",
-    )
-
-    return currency, address
+    return currency
@@ -0,0 +1,79 @@
+"""
+Local Mailgun stand-in for offline load tests.
+
+Accepts ``POST /v3/<domain>/messages`` like the Mailgun API, answers
+"Queued." and keeps the messages in memory so tests can read what was
+mailed (e.g. verification codes). Point MAILGUN_BASE_URL at it.
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from zoolflow.transactions.emulator import LatencyModel
+
+logger = logging.getLogger(__name__)
+
+
+class MailgunHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        parts = self.path.split("?", 1)[0].strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "v3" or parts[2] != "messages":
+            self._reply(404, json.dumps({"message": "Not found"}).encode("utf-8"))
+            return
+        time.sleep(self.server.latency.sample())
+        fields = {key: values[0] for key, values in parse_qs(body).items()}
+        message_id = self.server.store(fields)
+        content = {"id": f"<{message_id}@emulator>", "message": "Queued. Thank you."}
+        self._reply(200, json.dumps(content).encode("utf-8"))
+
+    def _reply(self, status, content):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class MailgunEmulator(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency="fixed:0"):
+        self.latency = LatencyModel(latency)
+        self.messages = []
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        super().__init__(address, MailgunHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def store(self, fields):
+        with self.lock:
+            message_id = next(self.ids)
+            self.messages.append({"id": message_id, **fields})
+        return message_id
+
+    def messages_to(self, email):
+        """Messages whose recipient contains ``email``, oldest first"""
+        with self.lock:
+            return [m for m in self.messages if email in m.get("to", "")]
+
+    def start_in_thread(self):
+        thread = threading.Thread(
+            target=self.serve_forever, name="mailgun-emulator", daemon=True
+        )
+        thread.start()
+        return thread
@@ -3,7 +3,10 @@ import logging
 import requests
 from django.conf import settings
 from requests.exceptions import HTTPError
-from zoolflow.transactions.services.http_client import get_session_with_retries
+from zoolflow.transactions.services.http_client import (
+    get_session_with_retries,
+    get_timeout,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +24,7 @@ class MailGunProvider:
         self.api_key = getattr(settings, "MAILGUN_API_KEY")
         self.base_url = getattr(settings, "MAILGUN_BASE_URL")
         self.mailgun_domain = getattr(settings, "EMAIL_DOMAIN")
-        self.session = get_session_with_retries()
+        self.session = get_session_with_retries("mailgun")
 
     def send_email(self, recipient, email_subject, email_body):
         """
@@ -38,7 +41,7 @@ class MailGunProvider:
         # call MailGun API to send email
         try:
             response = self.session.post(
-                url=endpoint, auth=auth, data=data, timeout=(5, 5)
+                url=endpoint, auth=auth, data=data, timeout=get_timeout("mailgun")
             )
             response.raise_for_status()
             if response.status_code and response.status_code != 200:
@@ -19,7 +19,7 @@ def mail_verify_code(user_code: VerificationCode):
     verification_code = user_code.code
     # email_from = DEFAULT_FROM_EMAIL
     email_body = render_to_string(
-        "notifications/templates/verification_code.html",
+        "verification_code.html",
         {"user": user_code.user, "code": verification_code},
     )
     _send_idempotent_email(
@@ -71,7 +71,9 @@ def _send_idempotent_email(email_body, subject, send_to, purpose, key=None):
             to_email=send_to,
             purpose=purpose,
         )
-        if not created:
+        # an event still initiated was never queued by mailgun, a retry
+        # of the task sends it again
+        if not created and event.status != EmailEvent.MessageStatus.INITIATED:
             logger.warning(
                 f"""
                 Email for {purpose} with key {key}
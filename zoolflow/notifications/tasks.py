@@ -1,5 +1,6 @@
 import logging
 from celery import shared_task
+from .mailers.providers import MailGunProviderError
 from .mailers.senders import mail_transaction_state, mail_verify_code
 from zoolflow.users.models import VerificationCode
 
@@ -20,10 +21,17 @@ def verification_code_mail_task(self, emailcode_id):
         raise
 
 
-@shared_task
-def transaction_state_email_task(transaction_id):
+@shared_task(
+    bind=True,
+    autoretry_for=(MailGunProviderError,),
+    retry_backoff=30,
+    retry_jitter=True,
+    max_retries=3,
+)
+def transaction_state_email_task(self, transaction_id):
     """
-    Background task for mailing transaction state to user email
+    Background task for mailing transaction state to user email,
+    mailgun failures are retried with backoff (the session doesn't retry)
     """
     logger.info(f"Start mailing transaction {transaction_id} state...")
     # Assuming mail_transaction_state is a function that sends the email
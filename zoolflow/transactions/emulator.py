@@ -0,0 +1,415 @@
+"""
+Local PayMob stand-in for offline load tests and benchmarks.
+
+Implements the endpoints the PayMob clients call (auth token, order,
+payment key, transaction lookup, order inquiry) with configurable latency,
+error rate, 429 bursts and token expiry, and sends HMAC signed callbacks
+like PayMob does once an order is paid. Point the PayMob URL settings at it:
+
+    AUTH_PAYMOB_TOKEN=http://127.0.0.1:8090/api/auth/tokens
+    ORDER_PAYMOB_URL=http://127.0.0.1:8090/api/ecommerce/orders
+    PAYMOB_PAYMENT_URL_KEY=http://127.0.0.1:8090/api/acceptance/payment_keys
+    PAYMOB_TRANSACTION_URL=http://127.0.0.1:8090/api/acceptance/transactions/{transaction_id}
+    PAYMOB_INQUIRY_URL=http://127.0.0.1:8090/api/ecommerce/orders/transaction_inquiry
+
+Not meant for production, everything is kept in memory.
+"""
+
+import itertools
+import json
+import logging
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+from django.utils import timezone
+from .services.http_client import get_session_with_retries
+from .services.webhook import WebhookService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMULATOR = {
+    # ms, fixed:<ms> uniform:<low>,<high> normal:<mean>,<std>
+    # or lognormal:<median>,<sigma>
+    "LATENCY": "fixed:0",
+    "ERROR_RATE": 0.0,  # share of requests answered with 500
+    "BURST_EVERY": 0,  # seconds between 429 bursts, 0 disables them
+    "BURST_LENGTH": 0,  # seconds every burst lasts
+    "TOKEN_TTL": 60 * 60,  # auth token lifetime in seconds
+    "CALLBACK_URL": None,  # webhook endpoint called when an order is paid
+    "SEED": None,
+}
+
+OUTCOMES = {
+    "success": {"success": True, "pending": False},
+    "declined": {"success": False, "pending": False},
+    "pending": {"success": False, "pending": True},
+    "error": {"success": False, "pending": False, "error_occured": True},
+    "refunded": {"success": True, "pending": False, "is_refunded": True},
+    "voided": {"success": True, "pending": False, "is_voided": True},
+    "authorized": {
+        "success": True,
+        "pending": False,
+        "is_auth": True,
+        "is_standalone_payment": False,
+    },
+}
+
+
+def emulator_config(**overrides):
+    config = {**DEFAULT_EMULATOR, **getattr(settings, "PAYMOB_EMULATOR", {})}
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+class LatencyModel:
+    """Delay distribution parsed from ``<kind>:<params>`` (milliseconds)"""
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal")
+
+    def __init__(self, spec, rng=None):
+        kind, _, params = str(spec).partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution {spec!r}")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p] or [0.0]
+        self.rng = rng or random.Random()
+
+    def sample(self):
+        """Return a delay in seconds"""
+        p = self.params
+        if self.kind == "fixed":
+            ms = p[0]
+        elif self.kind == "uniform":
+            ms = self.rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            ms = self.rng.gauss(p[0], p[1])
+        else:
+            # median and sigma of the underlying normal, long tail
+            ms = p[0] * self.rng.lognormvariate(0, p[1])
+        return max(ms, 0.0) / 1000
+
+
+def build_transaction(order, outcome="success", transaction_id=None):
+    """
+    Return a PayMob transaction object for an emulated order, with every
+    field the callback HMAC covers.
+    """
+    if outcome not in OUTCOMES:
+        raise ValueError(f"Unknown outcome {outcome!r}")
+    data = {
+        "id": transaction_id,
+        "amount_cents": order["amount_cents"],
+        "created_at": timezone.now().replace(tzinfo=None).isoformat(),
+        "currency": order.get("currency", "EGP"),
+        "error_occured": False,
+        "has_parent_transaction": False,
+        "integration_id": order.get("integration_id", 1),
+        "is_3d_secure": True,
+        "is_auth": False,
+        "is_capture": False,
+        "is_refunded": False,
+        "is_standalone_payment": True,
+        "is_voided": False,
+        "order": {"id": order["id"], "merchant_order_id": order["merchant_order_id"]},
+        "owner": 1,
+        "pending": False,
+        "source_data": {"pan": "2346", "sub_type": "MasterCard", "type": "card"},
+        "success": False,
+    }
+    data.update(OUTCOMES[outcome])
+    return data
+
+
+def signed_callback(transaction, secret_key=None):
+    """Return ``(body, hmac)`` of the processed callback PayMob would post"""
+    body = {"type": "TRANSACTION", "obj": transaction}
+    return body, WebhookService.sign(transaction, secret_key=secret_key)
+
+
+def send_callback(url, transaction, secret_key=None, timeout=10):
+    """Post a signed callback to our webhook endpoint, return the response"""
+    body, signature = signed_callback(transaction, secret_key=secret_key)
+    return get_session_with_retries("default").post(
+        url, params={"hmac": signature}, json=body, timeout=timeout
+    )
+
+
+class PayMobEmulator:
+    """
+    In-memory PayMob state and fault injection, shared by the handler
+    threads of EmulatorServer.
+    """
+
+    def __init__(self, **config):
+        self.config = emulator_config(**config)
+        self.rng = random.Random(self.config["SEED"])
+        self.latency = LatencyModel(self.config["LATENCY"], self.rng)
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.orders = {}
+        self.transactions = {}
+        self.order_ids = itertools.count(100000)
+        self.transaction_ids = itertools.count(500000)
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "unauthorized": 0}
+
+    # fault injection
+
+    def in_burst(self, now=None):
+        every, length = self.config["BURST_EVERY"], self.config["BURST_LENGTH"]
+        if not every or not length:
+            return False
+        now = time.monotonic() if now is None else now
+        return (now - self.started) % every < length
+
+    def fault(self):
+        """Return the status code of an injected fault, or None"""
+        time.sleep(self.latency.sample())
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.in_burst():
+                self.stats["throttled"] += 1
+                return 429
+            if self.rng.random() < self.config["ERROR_RATE"]:
+                self.stats["errors"] += 1
+                return 500
+        return None
+
+    # endpoints
+
+    def issue_token(self, payload):
+        token = secrets.token_urlsafe(24)
+        with self.lock:
+            self.tokens[token] = time.monotonic() + self.config["TOKEN_TTL"]
+        return 201, {"token": token}
+
+    def token_valid(self, token):
+        with self.lock:
+            expires_at = self.tokens.get(token)
+            valid = expires_at is not None and expires_at > time.monotonic()
+            if not valid:
+                self.stats["unauthorized"] += 1
+        return valid
+
+    def create_order(self, payload):
+        if not self.token_valid(payload.get("auth_token")):
+            return 401, {"detail": "Invalid or expired token."}
+        with self.lock:
+            order = {
+                "id": next(self.order_ids),
+                "merchant_order_id": payload.get("merchant_order_id"),
+                "amount_cents": payload.get("amount_cents"),
+                "currency": payload.get("currency", "EGP"),
+                "payment_keys": [],
+            }
+            self.orders[order["id"]] = order
+        return 201, {
+            key: value for key, value in order.items() if key != "payment_keys"
+        }
+
+    def payment_key(self, payload):
+        if not self.token_valid(payload.get("auth_token")):
+            return 401, {"detail": "Invalid or expired token."}
+        order = self.orders.get(_int(payload.get("order_id")))
+        if order is None:
+            return 404, {"detail": "Order not found."}
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            order["payment_keys"].append(token)
+            order["integration_id"] = payload.get("integration_id", 1)
+        return 201, {"token": token}
+
+    def transaction(self, transaction_id, bearer):
+        if not self.token_valid(bearer):
+            return 401, {"detail": "Invalid or expired token."}
+        transaction = self.transactions.get(_int(transaction_id))
+        if transaction is None:
+            return 404, {"detail": "Not found."}
+        return 200, transaction
+
+    def inquiry(self, payload):
+        if not self.token_valid(payload.get("auth_token")):
+            return 401, {"detail": "Invalid or expired token."}
+        order_id = _int(payload.get("order_id"))
+        with self.lock:
+            matches = [
+                tx
+                for tx in self.transactions.values()
+                if tx["order"]["id"] == order_id
+            ]
+        if not matches:
+            return 404, {"detail": "Not found."}
+        return 200, matches[-1]
+
+    def pay(self, order_id, outcome="success"):
+        """
+        Settle an order like a customer checkout would, then send the signed
+        callback when CALLBACK_URL is set.
+        """
+        order = self.orders.get(_int(order_id))
+        if order is None:
+            return 404, {"detail": "Order not found."}
+        with self.lock:
+            transaction = build_transaction(
+                order, outcome, transaction_id=next(self.transaction_ids)
+            )
+            self.transactions[transaction["id"]] = transaction
+        callback_url = self.config["CALLBACK_URL"]
+        if callback_url:
+            try:
+                send_callback(callback_url, transaction)
+            except Exception as e:
+                logger.warning(f"emulator callback to {callback_url} failed: {e}")
+        return 201, transaction
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                **self.stats,
+                "orders": len(self.orders),
+                "transactions": len(self.transactions),
+                "in_burst": self.in_burst(),
+            }
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive like the real API
+
+    routes = (
+        ("POST", re.compile(r"^/api/auth/tokens/?$"), "auth"),
+        ("POST", re.compile(r"^/api/ecommerce/orders/?$"), "order"),
+        ("POST", re.compile(r"^/api/acceptance/payment_keys/?$"), "payment_key"),
+        (
+            "GET",
+            re.compile(r"^/api/acceptance/transactions/(?P<id>\w+)/?$"),
+            "transaction",
+        ),
+        (
+            "POST",
+            re.compile(r"^/api/ecommerce/orders/transaction_inquiry/?$"),
+            "inquiry",
+        ),
+        ("POST", re.compile(r"^/_emulator/orders/(?P<id>\w+)/pay/?$"), "pay"),
+        ("GET", re.compile(r"^/_emulator/stats/?$"), "stats"),
+    )
+
+    @property
+    def emulator(self):
+        return self.server.emulator
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method):
+        # always consume the body so the keep-alive connection stays usable
+        payload = self._read_json()
+        path = self.path.split("?", 1)[0]
+        for route_method, pattern, name in self.routes:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            self._reply(404, {"detail": "Not found."})
+            return
+
+        if name in ("pay", "stats"):
+            # control endpoints never get faults injected
+            status, body = (
+                self.emulator.pay(match["id"], payload.get("outcome", "success"))
+                if name == "pay"
+                else (200, self.emulator.snapshot())
+            )
+            self._reply(status, body)
+            return
+
+        fault = self.emulator.fault()
+        if fault == 429:
+            self._reply(
+                429, {"detail": "Request was throttled."}, {"Retry-After": "1"}
+            )
+            return
+        if fault:
+            self._reply(fault, {"detail": "Internal server error."})
+            return
+
+        if name == "auth":
+            status, body = self.emulator.issue_token(payload)
+        elif name == "order":
+            status, body = self.emulator.create_order(payload)
+        elif name == "payment_key":
+            status, body = self.emulator.payment_key(payload)
+        elif name == "transaction":
+            bearer = self.headers.get("Authorization", "").removeprefix("Bearer ")
+            status, body = self.emulator.transaction(match["id"], bearer)
+        else:
+            status, body = self.emulator.inquiry(payload)
+        self._reply(status, body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _reply(self, status, body, headers=None):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class EmulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 8090), emulator=None, **config):
+        self.emulator = emulator or PayMobEmulator(**config)
+        super().__init__(address, EmulatorHandler)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self):
+        """PayMob URL settings pointing at this server"""
+        base = self.base_url
+        return {
+            "AUTH_PAYMOB_TOKEN": f"{base}/api/auth/tokens",
+            "ORDER_PAYMOB_URL": f"{base}/api/ecommerce/orders",
+            "PAYMOB_PAYMENT_URL_KEY": f"{base}/api/acceptance/payment_keys",
+            "PAYMOB_TRANSACTION_URL": (
+                f"{base}/api/acceptance/transactions/" + "{transaction_id}"
+            ),
+            "PAYMOB_INQUIRY_URL": f"{base}/api/ecommerce/orders/transaction_inquiry",
+        }
+
+    def start_in_thread(self):
+        thread = threading.Thread(
+            target=self.serve_forever, name="paymob-emulator", daemon=True
+        )
+        thread.start()
+        return thread
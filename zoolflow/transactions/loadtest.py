@@ -0,0 +1,360 @@
+"""
+End-to-end load generator for the signup-to-payment flow.
+
+Every virtual user drives the real API with the DRF test client:
+sign-up, verify-code/validate (code read from the Mailgun stand-in),
+obtain-token, profile, address, KYC upload, transaction create and the
+signed PayMob webhook. PayMob and Mailgun are the local emulators, celery
+tasks run eagerly in the calling thread.
+
+Per endpoint it reports throughput, p50/p95/p99 latency and DB queries per
+request, used by the ``loadtest`` management command.
+"""
+
+import math
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, connections
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from rest_framework.throttling import SimpleRateThrottle
+from zoolflow.customers.models import KnowYourCustomer
+from zoolflow.notifications.emulator import MailgunEmulator
+from .emulator import EmulatorServer, signed_callback
+from .services.paymob import paymob_breaker
+from .services.tokens import token_manager
+
+SIGN_UP = "/api/v1/users/sign-up/"
+VERIFY_CODE = "/api/v1/users/verify-code/validate/"
+OBTAIN_TOKEN = "/api/v1/users/obtain-token/"
+PROFILE = "/api/v1/customers/profile/"
+ADDRESSES = "/api/v1/customers/address/"
+KYC_UPLOAD = "/api/v1/customers/profile/upload-docs/"
+TRANSACTIONS = "/api/v1/transactions/transaction/"
+WEBHOOK = "/api/v1/transactions/webhook/"
+
+PASSWORD = "Load-test#2025"
+# smallest file the KYC validator accepts as pdf
+KYC_DOCUMENT = b"%PDF-1.4\n%load test\n"
+
+
+class FlowError(Exception):
+    # Raised when a step answers an unexpected status, ends that user flow
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+class EndpointStats:
+    """Thread-safe latency, status and query samples per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, endpoint, seconds, status, queries):
+        with self._lock:
+            sample = self._samples.setdefault(
+                endpoint, {"latencies": [], "errors": 0, "queries": 0}
+            )
+            sample["latencies"].append(seconds)
+            sample["queries"] += queries
+            if status >= 400:
+                sample["errors"] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        with self._lock:
+            samples = {name: dict(sample) for name, sample in self._samples.items()}
+        for name, sample in samples.items():
+            latencies = sorted(sample["latencies"])
+            count = len(latencies)
+            rows[name] = {
+                "requests": count,
+                "errors": sample["errors"],
+                "rps": round(count / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "queries_per_request": round(sample["queries"] / count, 2),
+            }
+        return rows
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run by the current thread's connection"""
+    counter = {"queries": 0}
+
+    def wrapper(execute, sql, params, many, context):
+        counter["queries"] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+class VirtualUser:
+    def __init__(self, number, run_id, stats, paymob, mailgun, outcome):
+        self.number = number
+        self.stats = stats
+        self.paymob = paymob
+        self.mailgun = mailgun
+        self.outcome = outcome
+        self.client = APIClient()
+        self.username = f"load{run_id}{number}"
+        self.email = f"{self.username}@loadtest.local"
+        self.phone = f"+2010{(int(run_id, 16) + number) % 10**8:08d}"
+
+    def call(self, endpoint, method, path, expected, **kwargs):
+        with count_queries() as counter:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, **kwargs)
+            elapsed = time.perf_counter() - started
+        self.stats.record(endpoint, elapsed, response.status_code, counter["queries"])
+        if response.status_code not in expected:
+            raise FlowError(
+                f"{endpoint} answered {response.status_code}",
+                details=getattr(response, "data", None),
+            )
+        return response
+
+    def run(self):
+        json_api = {"format": "json"}
+        self.call(
+            "sign-up",
+            "post",
+            SIGN_UP,
+            (201,),
+            data={"username": self.username, "email": self.email, "password": PASSWORD},
+            **json_api,
+        )
+        access = self.call(
+            "verify-code/validate",
+            "post",
+            VERIFY_CODE,
+            (200,),
+            data={"email": self.email, "code": self.mailed_code()},
+            **json_api,
+        ).data["access"]
+        access = self.call(
+            "obtain-token",
+            "post",
+            OBTAIN_TOKEN,
+            (200,),
+            data={"username": self.username, "password": PASSWORD},
+            **json_api,
+        ).data["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+        self.call(
+            "customer profile",
+            "patch",
+            PROFILE,
+            (200,),
+            data={
+                "first_name": "Loadtest",
+                "last_name": "User",
+                "phone_number": self.phone,
+                "dob": "1990-01-01",
+            },
+            **json_api,
+        )
+        addresses = self.call("address list", "get", ADDRESSES, (200,)).data
+        address = addresses["results"] if isinstance(addresses, dict) else addresses
+        self.call(
+            "address update",
+            "patch",
+            f"{ADDRESSES}{address[0]['id']}/",
+            (200,),
+            data={
+                "state": "Cairo",
+                "city": "Nasr City",
+                "line": "Abbas El Akkad",
+                "building_number": "12",
+                "apartment_number": "4",
+                "postal_code": "11765",
+            },
+            **json_api,
+        )
+        self.call(
+            "kyc upload",
+            "patch",
+            KYC_UPLOAD,
+            (200,),
+            data={
+                "document_type": KnowYourCustomer.DocumentType.NATIONAL_ID,
+                "document_id": f"{29001010000000 + self.number}",
+                "document_file": SimpleUploadedFile(
+                    "national-id.pdf", KYC_DOCUMENT, "application/pdf"
+                ),
+            },
+            format="multipart",
+        )
+        self.approve_kyc()
+
+        transaction = self.call(
+            "transaction create",
+            "post",
+            TRANSACTIONS,
+            (201, 202),
+            data={"amount": "150.00"},
+            **json_api,
+        ).data
+        self.deliver_webhook(transaction)
+
+    def mailed_code(self):
+        code_length = getattr(settings, "CODE_LENGTH", 6)
+        # the code is the only text node made of CODE_LENGTH digits
+        pattern = re.compile(rf">\s*(\d{{{code_length}}})\s*<")
+        for message in reversed(self.mailgun.messages_to(self.email)):
+            match = pattern.search(message.get("text", ""))
+            if match:
+                return match.group(1)
+        raise FlowError(f"no verification code mailed to {self.email}")
+
+    def approve_kyc(self):
+        # staff review, not part of the measured API traffic
+        kyc = KnowYourCustomer.objects.get(customer__user__username=self.username)
+        kyc.status_tracking = KnowYourCustomer.Status.APPROVED
+        kyc.save()
+
+    def deliver_webhook(self, transaction):
+        order_id = transaction.get("order_id")
+        if not order_id:
+            # asynchronous orchestration, the provider worker owns the order
+            return
+        status, paid = self.paymob.emulator.pay(order_id, self.outcome)
+        if status != 201:
+            raise FlowError(f"emulator could not pay order {order_id}")
+        body, signature = signed_callback(paid)
+        self.call(
+            "webhook",
+            "post",
+            f"{WEBHOOK}?hmac={signature}",
+            (200,),
+            data=body,
+            format="json",
+        )
+
+
+class LoadTest:
+    """
+    Run ``users`` flows with ``concurrency`` threads against the emulators.
+
+    Expects an already migrated (test) database, the ``loadtest`` command
+    creates and drops it.
+    """
+
+    def __init__(
+        self,
+        users=20,
+        concurrency=4,
+        outcome="success",
+        paymob_config=None,
+        mail_latency="fixed:0",
+    ):
+        self.users = users
+        self.concurrency = concurrency
+        self.outcome = outcome
+        self.paymob_config = paymob_config or {}
+        self.mail_latency = mail_latency
+        self.stats = EndpointStats()
+        self.failures = []
+
+    def run(self):
+        run_id = uuid.uuid4().hex[:6]
+        with self.environment() as (paymob, mailgun):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="loadtest"
+            ) as executor:
+                futures = [
+                    executor.submit(self._run_user, n, run_id, paymob, mailgun)
+                    for n in range(self.users)
+                ]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - started
+            emulator_stats = paymob.emulator.snapshot()
+
+        return {
+            "users": self.users,
+            "concurrency": self.concurrency,
+            "completed": self.users - len(self.failures),
+            "failures": self.failures[:20],
+            "elapsed_s": round(elapsed, 3),
+            "flows_per_s": round((self.users - len(self.failures)) / elapsed, 2),
+            "endpoints": self.stats.report(elapsed),
+            "paymob_emulator": emulator_stats,
+        }
+
+    def _run_user(self, number, run_id, paymob, mailgun):
+        user = VirtualUser(number, run_id, self.stats, paymob, mailgun, self.outcome)
+        try:
+            user.run()
+        except FlowError as e:
+            self.failures.append({"user": user.username, "error": e.message})
+        except Exception as e:
+            # a crashed flow is a result too, keep the others running
+            self.failures.append({"user": user.username, "error": repr(e)})
+        finally:
+            # one connection per worker thread, never left open
+            connections.close_all()
+
+    @contextmanager
+    def environment(self):
+        """Emulators, eager celery and settings pointing at them"""
+        from config.celery import app
+
+        paymob = EmulatorServer(("127.0.0.1", 0), **self.paymob_config)
+        mailgun = MailgunEmulator(("127.0.0.1", 0), latency=self.mail_latency)
+        paymob.start_in_thread()
+        mailgun.start_in_thread()
+
+        eager = app.conf.task_always_eager
+        rates = SimpleRateThrottle.THROTTLE_RATES
+        with ExitStack() as stack:
+            media_root = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(
+                override_settings(
+                    **paymob.urls(),
+                    MAILGUN_BASE_URL=mailgun.base_url,
+                    MEDIA_ROOT=media_root,
+                    ALLOWED_HOSTS=["*"],
+                    # the emulator has no PayMob quota to protect
+                    PAYMOB_RATE_LIMITS={},
+                )
+            )
+            app.conf.task_always_eager = True
+            # a cached token belongs to the real PayMob
+            token_manager.invalidate()
+            paymob_breaker.reset()
+            # throttling would measure the limits, not the application
+            SimpleRateThrottle.THROTTLE_RATES = {scope: None for scope in rates}
+            try:
+                yield paymob, mailgun
+            finally:
+                app.conf.task_always_eager = eager
+                SimpleRateThrottle.THROTTLE_RATES = rates
+                token_manager.invalidate()
+                paymob_breaker.reset()
+                for server in (paymob, mailgun):
+                    server.shutdown()
+                    server.server_close()
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from zoolflow.transactions.services.archive import archive_transactions
+
+
+class Command(BaseCommand):
+    help = (
+        "Move terminal transactions older than ARCHIVE_AFTER from the live "
+        "transactions table to the archive table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=None,
+            help="Archive transactions untouched for this many days.",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--time-budget",
+            type=int,
+            default=None,
+            help="Stop starting new batches after this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        days = options["older_than_days"]
+        report = archive_transactions(
+            older_than=days * 60 * 60 * 24 if days else None,
+            batch_size=options["batch_size"],
+            time_budget=options["time_budget"],
+        )
+        if report is None:
+            raise CommandError("Another archive run is in progress.")
+        message = (
+            f"Archived {report['archived']} transactions "
+            f"in {report['batches']} batches."
+        )
+        if not report["finished"]:
+            message += " Time budget spent, run again to continue."
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,102 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+from rest_framework.renderers import JSONRenderer
+from zoolflow.customers.models import Customer
+from zoolflow.transactions.models import Transaction
+from zoolflow.transactions.serializers import (
+    TransactionListSerializer,
+    TransactionSerializer,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/second of TransactionSerializer and the values() based "
+        "TransactionListSerializer. Sample rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--customer", type=int, help="customer id owning the rows")
+
+    def handle(self, *args, **options):
+        customer = (
+            Customer.objects.filter(id=options["customer"]).first()
+            if options["customer"]
+            else Customer.objects.first()
+        )
+        if customer is None:
+            raise CommandError("No customer found to own the sample transactions.")
+
+        try:
+            with db_transaction.atomic():
+                self._run(customer, options["rows"], options["repeat"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _run(self, customer, rows, repeat):
+        states = Transaction.TransactionState.values
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    customer=customer,
+                    amount=f"{10 + i % 997}.{i % 100:02d}",
+                    state=states[i % len(states)],
+                    order_id=str(1000 + i) if i % 3 else None,
+                    transaction_id=str(5000 + i) if i % 2 else None,
+                )
+                for i in range(rows)
+            ],
+            batch_size=500,
+        )
+        queryset = Transaction.objects.filter(customer=customer)[:rows]
+        renderer = JSONRenderer()
+
+        def model_path():
+            return renderer.render(
+                TransactionSerializer(queryset.all(), many=True).data
+            )
+
+        def values_path():
+            values_rows = queryset.values(*TransactionListSerializer.columns())
+            return renderer.render(TransactionListSerializer(values_rows).data)
+
+        if model_path() != values_path():
+            raise CommandError("Serializers output differs, benchmark aborted.")
+
+        # serialization only, rows fetched once
+        instances = list(queryset)
+        values = list(queryset.values(*TransactionListSerializer.columns()))
+        results = {
+            "TransactionSerializer (db + serialize)": self._measure(model_path, repeat),
+            "TransactionListSerializer (db + serialize)": self._measure(
+                values_path, repeat
+            ),
+            "TransactionSerializer (serialize only)": self._measure(
+                lambda: TransactionSerializer(instances, many=True).data, repeat
+            ),
+            "TransactionListSerializer (serialize only)": self._measure(
+                lambda: TransactionListSerializer(values).data, repeat
+            ),
+        }
+        count = len(instances)
+        self.stdout.write(f"{count} rows, best of {repeat} runs, identical output")
+        for name, seconds in results.items():
+            self.stdout.write(f"{name:<45} {count / seconds:>12,.0f} rows/s")
+
+    @staticmethod
+    def _measure(func, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
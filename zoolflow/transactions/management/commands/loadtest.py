@@ -0,0 +1,71 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from zoolflow.transactions.emulator import OUTCOMES
+from zoolflow.transactions.loadtest import LoadTest
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive sign-up -> verify -> token -> profile/address/KYC -> transaction "
+        "-> webhook concurrently against the local PayMob and Mailgun "
+        "emulators, on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--outcome", choices=sorted(OUTCOMES), default="success")
+        parser.add_argument("--paymob-latency", default="fixed:0")
+        parser.add_argument("--paymob-error-rate", type=float, default=0.0)
+        parser.add_argument("--mailgun-latency", default="fixed:0")
+        parser.add_argument(
+            "--keepdb", action="store_true", help="keep the test database"
+        )
+        parser.add_argument("--json", dest="json_path", help="write the report here")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"]
+        )
+        try:
+            report = LoadTest(
+                users=options["users"],
+                concurrency=options["concurrency"],
+                outcome=options["outcome"],
+                paymob_config={
+                    "LATENCY": options["paymob_latency"],
+                    "ERROR_RATE": options["paymob_error_rate"],
+                },
+                mail_latency=options["mailgun_latency"],
+            ).run()
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+        self.print_report(report)
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['completed']}/{report['users']} flows in "
+            f"{report['elapsed_s']}s with {report['concurrency']} threads "
+            f"({report['flows_per_s']} flows/s)"
+        )
+        header = (
+            f"{'endpoint':<22}{'reqs':>6}{'errs':>6}{'rps':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        self.stdout.write(header)
+        for name, row in report["endpoints"].items():
+            self.stdout.write(
+                f"{name:<22}{row['requests']:>6}{row['errors']:>6}{row['rps']:>9}"
+                f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+                f"{row['queries_per_request']:>9}"
+            )
+        for failure in report["failures"]:
+            self.stdout.write(self.style.WARNING(f"{failure['user']}: {failure['error']}"))
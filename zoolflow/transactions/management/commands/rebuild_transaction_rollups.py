@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from zoolflow.transactions.services.rollups import RollupBusyError, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily and customer transaction rollups from the "
+        "transactions table (after a backfill or if totals drifted)."
+    )
+
+    def handle(self, *args, **options):
+        try:
+            daily, customers = rebuild_rollups()
+        except RollupBusyError as e:
+            raise CommandError(e.message)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {daily} daily and {customers} customer rollup rows."
+            )
+        )
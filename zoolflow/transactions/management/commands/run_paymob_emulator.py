@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from zoolflow.transactions.emulator import EmulatorServer, LatencyModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the local PayMob emulator (auth, order, payment key, transaction "
+        "and inquiry endpoints) with latency and fault injection."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8090)
+        parser.add_argument(
+            "--latency",
+            help="fixed:<ms>, uniform:<low>,<high>, normal:<mean>,<std> "
+            "or lognormal:<median>,<sigma>",
+        )
+        parser.add_argument("--error-rate", type=float, help="share of 500 answers")
+        parser.add_argument(
+            "--burst-every", type=float, help="seconds between 429 bursts"
+        )
+        parser.add_argument("--burst-length", type=float, help="seconds per burst")
+        parser.add_argument("--token-ttl", type=int, help="auth token lifetime")
+        parser.add_argument(
+            "--callback-url", help="webhook endpoint called when an order is paid"
+        )
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        if options["latency"]:
+            try:
+                LatencyModel(options["latency"])
+            except ValueError as e:
+                raise CommandError(str(e))
+        server = EmulatorServer(
+            (options["host"], options["port"]),
+            LATENCY=options["latency"],
+            ERROR_RATE=options["error_rate"],
+            BURST_EVERY=options["burst_every"],
+            BURST_LENGTH=options["burst_length"],
+            TOKEN_TTL=options["token_ttl"],
+            CALLBACK_URL=options["callback_url"],
+            SEED=options["seed"],
+        )
+        self.stdout.write(f"PayMob emulator listening on {server.base_url}")
+        for name, url in server.urls().items():
+            self.stdout.write(f"  {name}={url}")
+        self.stdout.write(
+            f"  pay an order: POST {server.base_url}/_emulator/orders/<order_id>/pay"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
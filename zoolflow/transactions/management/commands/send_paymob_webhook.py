@@ -0,0 +1,50 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from zoolflow.transactions.emulator import (
+    OUTCOMES,
+    build_transaction,
+    send_callback,
+    signed_callback,
+)
+from zoolflow.transactions.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Send a PayMob transaction callback signed with HMAC_SECRET_KEY to the "
+        "webhook endpoint, or print it with --dry-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("merchant_order_id")
+        parser.add_argument(
+            "--url", default="http://127.0.0.1:8000/api/v1/transactions/webhook/"
+        )
+        parser.add_argument("--outcome", choices=sorted(OUTCOMES), default="success")
+        parser.add_argument("--transaction-id", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        tx = Transaction.objects.filter(
+            merchant_order_id=options["merchant_order_id"]
+        ).first()
+        if tx is None:
+            raise CommandError(f"Transaction {options['merchant_order_id']} not found.")
+
+        order = {
+            "id": tx.order_id or 0,
+            "merchant_order_id": tx.merchant_order_id,
+            "amount_cents": int(tx.amount * 100),
+        }
+        transaction_id = options["transaction_id"] or tx.transaction_id or tx.id
+        callback = build_transaction(
+            order, options["outcome"], transaction_id=int(transaction_id)
+        )
+
+        if options["dry_run"]:
+            body, signature = signed_callback(callback)
+            self.stdout.write(json.dumps({"hmac": signature, "body": body}, indent=2))
+            return
+
+        response = send_callback(options["url"], callback)
+        self.stdout.write(f"{response.status_code} {response.text}")
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0008_rename_appartment_number_address_apartment_number'),
+        ('transactions', '0006_alter_transaction_state_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='transaction',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='tx_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['state', 'created_at', 'id'], name='tx_state_created_idx'),
+        ),
+    ]
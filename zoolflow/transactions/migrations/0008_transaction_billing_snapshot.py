@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_transaction_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='billing_snapshot',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
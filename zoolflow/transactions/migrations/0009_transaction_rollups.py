@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0008_rename_appartment_number_address_apartment_number'),
+        ('transactions', '0008_transaction_billing_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('state', models.CharField(choices=[('initiated', 'Initiated'), ('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('error', 'Error'), ('voided', 'Voided'), ('authorized', 'Authorized')], max_length=20)),
+                ('currency', models.CharField(blank=True, default='', max_length=8)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'ordering': ['day', 'state', 'currency'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'state', 'currency'), name='daily_rollup_key')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(blank=True, default='', max_length=8)),
+                ('from_state', models.CharField(choices=[('initiated', 'Initiated'), ('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('error', 'Error'), ('voided', 'Voided'), ('authorized', 'Authorized')], max_length=20, null=True)),
+                ('to_state', models.CharField(choices=[('initiated', 'Initiated'), ('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('error', 'Error'), ('voided', 'Voided'), ('authorized', 'Authorized')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='customers.customer')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerTransactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('initiated', 'Initiated'), ('pending', 'Pending'), ('succeeded', 'Succeeded'), ('failed', 'Failed'), ('refunded', 'Refunded'), ('error', 'Error'), ('voided', 'Voided'), ('authorized', 'Authorized')], max_length=20)),
+                ('currency', models.CharField(blank=True, default='', max_length=8)),
+                ('count', models.BigIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_rollups', to='customers.customer')),
+            ],
+            options={
+                'ordering': ['customer', 'state', 'currency'],
+                'constraints': [models.UniqueConstraint(fields=('customer', 'state', 'currency'), name='customer_rollup_key')],
+            },
+        ),
+    ]
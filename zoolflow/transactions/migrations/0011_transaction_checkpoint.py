@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+def backfill_checkpoints(apps, schema_editor):
+    Transaction = apps.get_model("transactions", "Transaction")
+    Transaction.objects.filter(payment_token__isnull=False).update(
+        checkpoint="key_issued"
+    )
+    Transaction.objects.filter(
+        order_id__isnull=False, payment_token__isnull=True
+    ).update(checkpoint="order_created")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_archived_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='checkpoint',
+            field=models.CharField(choices=[('none', 'None'), ('order_created', 'Order created'), ('key_issued', 'Payment key issued')], default='none', editable=False, max_length=20),
+        ),
+        migrations.RunPython(backfill_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_transaction_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='payment_token_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
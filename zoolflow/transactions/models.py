@@ -25,6 +25,12 @@ class Transaction(models.Model):
         VOIDED = "voided", "Voided"
         AUTHORIZED = "authorized", "Authorized"
 
+    class Checkpoint(models.TextChoices):
+        # last provider step completed, a retried checkout resumes after it
+        NONE = "none", "None"
+        ORDER_CREATED = "order_created", "Order created"
+        KEY_ISSUED = "key_issued", "Payment key issued"
+
     customer = models.ForeignKey(
         Customer, on_delete=models.CASCADE, related_name="customer_transaction"
     )
@@ -55,6 +61,18 @@ class Transaction(models.Model):
     )
     order_id = models.CharField(max_length=200, null=True, blank=True)
     payment_token = models.TextField(null=True, blank=True)
+    # when PayMob stops accepting payment_token, None for unknown
+    payment_token_expires_at = models.DateTimeField(
+        null=True, blank=True, editable=False
+    )
+    checkpoint = models.CharField(
+        max_length=20,
+        editable=False,
+        choices=Checkpoint.choices,
+        default=Checkpoint.NONE,
+    )
+    # currency and billing data frozen at creation, read by the provider calls
+    billing_snapshot = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -62,4 +80,149 @@ class Transaction(models.Model):
         return f"Transaction {self.merchant_order_id} ({self.state})"
 
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        # keyset pages per customer and per state (staff listings)
+        indexes = [
+            models.Index(
+                fields=["customer", "created_at", "id"],
+                name="tx_customer_created_idx",
+            ),
+            models.Index(
+                fields=["state", "created_at", "id"],
+                name="tx_state_created_idx",
+            ),
+        ]
+
+
+class ArchivedTransaction(models.Model):
+    """
+    Cold copy of terminal transactions moved out of the live table by the
+    archiver. Same columns and id, the payment token is dropped.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="archived_transactions"
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_provider = models.CharField(
+        max_length=50, choices=Transaction.SupportedPaymentProviders.choices
+    )
+    state = models.CharField(max_length=20, choices=Transaction.TransactionState.choices)
+    merchant_order_id = models.CharField(max_length=40, unique=True)
+    transaction_id = models.CharField(
+        max_length=64, db_index=True, null=True, blank=True
+    )
+    order_id = models.CharField(max_length=200, null=True, blank=True)
+    payment_token = models.TextField(null=True, blank=True)
+    billing_snapshot = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived transaction {self.merchant_order_id} ({self.state})"
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            models.Index(
+                fields=["customer", "created_at", "id"],
+                name="archived_customer_created_idx",
+            ),
+            models.Index(
+                fields=["state", "created_at", "id"],
+                name="archived_state_created_idx",
+            ),
+        ]
+
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of verified PayMob callbacks, appended by the webhook view and
+    drained in batches by a worker.
+    """
+
+    class EventStatus(models.TextChoices):
+        RECEIVED = "received", "Received"
+        PROCESSED = "processed", "Processed"
+        FAILED = "failed", "Failed"
+
+    transaction_id = models.CharField(max_length=64, db_index=True)
+    merchant_order_id = models.CharField(max_length=40, null=True, blank=True)
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=20,
+        choices=EventStatus.choices,
+        default=EventStatus.RECEIVED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Webhook {self.transaction_id} ({self.status})"
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["status", "id"], name="webhook_status_id_idx")]
+
+
+class TransactionRollupDelta(models.Model):
+    """
+    Outbox of rollup changes, one row per created or moved transaction,
+    written in the same DB transaction as the state change and folded into
+    the rollup tables by a worker.
+    """
+
+    day = models.DateField()
+    currency = models.CharField(max_length=8, blank=True, default="")
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="+")
+    from_state = models.CharField(
+        max_length=20, choices=Transaction.TransactionState.choices, null=True
+    )
+    to_state = models.CharField(
+        max_length=20, choices=Transaction.TransactionState.choices
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ["id"]
+
+
+class DailyTransactionRollup(models.Model):
+    """Transactions count and volume per creation day, state and currency"""
+
+    day = models.DateField()
+    state = models.CharField(max_length=20, choices=Transaction.TransactionState.choices)
+    currency = models.CharField(max_length=8, blank=True, default="")
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["day", "state", "currency"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "state", "currency"], name="daily_rollup_key"
+            )
+        ]
+
+
+class CustomerTransactionRollup(models.Model):
+    """Transactions count and volume per customer, state and currency"""
+
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="transaction_rollups"
+    )
+    state = models.CharField(max_length=20, choices=Transaction.TransactionState.choices)
+    currency = models.CharField(max_length=8, blank=True, default="")
+    count = models.BigIntegerField(default=0)
+    amount = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["customer", "state", "currency"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "state", "currency"], name="customer_rollup_key"
+            )
+        ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
 from .models import Transaction
 
 
@@ -32,3 +34,137 @@ class TransactionSerializer(serializers.ModelSerializer):
         if value <= 0:
             raise serializers.ValidationError("Invalid amount")
         return value
+
+
+class TransactionListSerializer:
+    """
+    Read-only list serializer working on ``.values()`` rows.
+
+    The field plan is compiled once from TransactionSerializer so the output
+    is identical, rows skip model instances and the per-field DRF lookups,
+    and state labels come from a precomputed table.
+    """
+
+    base_serializer = TransactionSerializer
+    _plan = None
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def plan(cls):
+        """(field name, values() column, converter or None) per readable field"""
+        if cls._plan is None:
+            cls._plan = tuple(
+                cls._compile(field)
+                for field in cls.base_serializer()._readable_fields
+            )
+        return cls._plan
+
+    @classmethod
+    def columns(cls):
+        """Columns to pass to ``.values()``, id is kept for cursor pages"""
+        return tuple(dict.fromkeys(column for _, column, _ in cls.plan())) + ("id",)
+
+    @classmethod
+    def _compile(cls, field):
+        model = cls.base_serializer.Meta.model
+        source = field.source
+        if source.startswith("get_") and source.endswith("_display"):
+            column = source[len("get_") : -len("_display")]
+            labels = dict(model._meta.get_field(column).flatchoices)
+            return field.field_name, column, lambda value: str(labels.get(value, value))
+        if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+            # values() already returns the pk
+            return field.field_name, source, None
+        if type(field) is serializers.CharField:
+            return field.field_name, source, str
+        to_representation = field.to_representation
+        if isinstance(field, PrimaryKeyRelatedField):
+            return field.field_name, source, lambda pk: to_representation(
+                PKOnlyObject(pk=pk)
+            )
+        return field.field_name, source, to_representation
+
+    @property
+    def data(self):
+        plan = self.plan()
+        data = []
+        for row in self.rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                item[name] = value if value is None or convert is None else convert(value)
+            data.append(item)
+        return data
+
+
+class TransactionStatusSerializer(serializers.ModelSerializer):
+    state_display = serializers.CharField(source="get_state_display", read_only=True)
+
+    class Meta:
+        model = Transaction
+        fields = (
+            "merchant_order_id",
+            "state",
+            "state_display",
+            "order_id",
+            "payment_token",
+            "payment_token_expires_at",
+        )
+        read_only_fields = fields
+
+
+class BulkTransactionItemSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    # staff create on behalf of customers, customers only for themselves
+    customer = serializers.IntegerField(required=False)
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Invalid amount")
+        return value
+
+
+class BulkTransactionSerializer(serializers.Serializer):
+    items = BulkTransactionItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        limit = getattr(settings, "BULK_TRANSACTION_MAX_ITEMS", 500)
+        if len(items) > limit:
+            raise serializers.ValidationError(f"At most {limit} items per request.")
+        return items
+
+
+class TransactionAnalyticsQuerySerializer(serializers.Serializer):
+    DAILY_DIMENSIONS = ("day", "state", "currency")
+    CUSTOMER_DIMENSIONS = ("customer", "state", "currency")
+
+    group_by = serializers.CharField(required=False, default="day")
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    state = serializers.ChoiceField(
+        choices=Transaction.TransactionState.choices, required=False
+    )
+    currency = serializers.CharField(required=False, max_length=8)
+
+    def validate_group_by(self, value):
+        dimensions = [name.strip() for name in value.split(",") if name.strip()]
+        allowed = set(self.DAILY_DIMENSIONS) | set(self.CUSTOMER_DIMENSIONS)
+        unknown = [name for name in dimensions if name not in allowed]
+        if unknown or not dimensions:
+            raise serializers.ValidationError(
+                f"Group by any of {', '.join(sorted(allowed))}."
+            )
+        if "day" in dimensions and "customer" in dimensions:
+            raise serializers.ValidationError("Can't group by day and customer.")
+        return dimensions
+
+    def validate(self, attrs):
+        if "customer" in attrs["group_by"] and (
+            attrs.get("date_from") or attrs.get("date_to")
+        ):
+            raise serializers.ValidationError(
+                "Date filters only apply to daily groupings."
+            )
+        return attrs
@@ -0,0 +1,164 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction as db_transaction
+from django.utils import timezone
+from redis.exceptions import LockError
+from .state_machine import TRANSITIONS
+from ..models import ArchivedTransaction, Transaction
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_LOCK_KEY = "transactions:archive:lock"
+# states without outgoing transitions, plus SUCCEEDED once ARCHIVE_AFTER is
+# past any refund/void window
+ARCHIVABLE_STATES = [state for state, targets in TRANSITIONS.items() if not targets] + [
+    Transaction.TransactionState.SUCCEEDED
+]
+# columns shared by the live and archive tables, in select order
+COLUMNS = tuple(
+    field.attname
+    for field in ArchivedTransaction._meta.concrete_fields
+    if field.attname != "archived_at"
+)
+
+
+def archive_transactions(older_than=None, batch_size=None, time_budget=None):
+    """
+    Move archivable transactions untouched for ``older_than`` seconds into
+    ArchivedTransaction.
+
+    Every batch is one DB transaction: the rows are locked (skipping rows
+    other writers hold), copied with one bulk_create and deleted from the
+    live table. Runs until nothing is left or the time budget is spent.
+    Return a report dict, None when another run holds the lock.
+    """
+    older_than = older_than or getattr(settings, "ARCHIVE_AFTER", 60 * 60 * 24 * 90)
+    batch_size = batch_size or getattr(settings, "ARCHIVE_BATCH_SIZE", 1000)
+    time_budget = time_budget or getattr(settings, "ARCHIVE_TIME_BUDGET", 60 * 10)
+
+    lock = cache.lock(ARCHIVE_LOCK_KEY, timeout=time_budget + 60, blocking=False)
+    if not lock.acquire():
+        logger.info("archiver already running.")
+        return None
+
+    deadline = time.monotonic() + time_budget
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    report = {"archived": 0, "batches": 0, "finished": False}
+    try:
+        while time.monotonic() < deadline:
+            with db_transaction.atomic():
+                rows = list(
+                    Transaction.objects.filter(
+                        state__in=ARCHIVABLE_STATES,
+                        created_at__lt=cutoff,
+                        updated_at__lt=cutoff,
+                    )
+                    .order_by("id")
+                    .select_for_update(skip_locked=True)
+                    .values(*COLUMNS)[:batch_size]
+                )
+                if not rows:
+                    report["finished"] = True
+                    break
+                ArchivedTransaction.objects.bulk_create(
+                    [ArchivedTransaction(**{**row, "payment_token": None}) for row in rows]
+                )
+                Transaction.objects.filter(id__in=[row["id"] for row in rows]).delete()
+            report["archived"] += len(rows)
+            report["batches"] += 1
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("archive lock expired before release.")
+
+    logger.info(f"Archive report: {report}")
+    return report
+
+
+class TransactionHistory:
+    """
+    Read-only, queryset-like view over live and archived transactions.
+
+    ``filter()``, ``exclude()`` and ``order_by()`` apply to both tables,
+    rows come back as ``values()`` dicts from one ``UNION ALL`` query and
+    ``count()`` adds both counts. Enough of the QuerySet API for the
+    paginators and django-filter.
+    """
+
+    model = Transaction
+
+    def __init__(self, live=None, archived=None, fields=COLUMNS, ordering=()):
+        self.live = Transaction.objects.all() if live is None else live
+        self.archived = ArchivedTransaction.objects.all() if archived is None else archived
+        self.fields = tuple(fields)
+        self.ordering = tuple(ordering)
+
+    def _clone(self, **changes):
+        kwargs = {
+            "live": self.live,
+            "archived": self.archived,
+            "fields": self.fields,
+            "ordering": self.ordering,
+            **changes,
+        }
+        return TransactionHistory(**kwargs)
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            live=self.live.filter(*args, **kwargs),
+            archived=self.archived.filter(*args, **kwargs),
+        )
+
+    def exclude(self, *args, **kwargs):
+        return self._clone(
+            live=self.live.exclude(*args, **kwargs),
+            archived=self.archived.exclude(*args, **kwargs),
+        )
+
+    def order_by(self, *fields):
+        return self._clone(ordering=fields)
+
+    def values(self, *fields):
+        return self._clone(fields=fields or COLUMNS)
+
+    @property
+    def ordered(self):
+        return bool(self.ordering)
+
+    def count(self):
+        return self.live.count() + self.archived.count()
+
+    def first(self):
+        rows = self[:1]
+        return rows[0] if rows else None
+
+    def _union(self, limit=None):
+        live = self.live.values(*self.fields)
+        archived = self.archived.values(*self.fields)
+        if limit is not None and connection.features.supports_slicing_ordering_in_compound:
+            # each side needs at most ``limit`` rows, read from its own index
+            live = live.order_by(*self.ordering)[:limit]
+            archived = archived.order_by(*self.ordering)[:limit]
+        else:
+            live, archived = live.order_by(), archived.order_by()
+        return live.union(archived, all=True).order_by(*self.ordering)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError("TransactionHistory doesn't support slice steps.")
+            return list(self._union(limit=key.stop)[key])
+        return self._union(limit=key + 1)[key]
+
+    def __iter__(self):
+        return iter(self._union())
+
+    def __len__(self):
+        return self.count()
@@ -0,0 +1,156 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction as db_transaction
+from zoolflow.customers.services.helpers import SupportedCountryError, billing_snapshots
+from .orchestration import checkout_deadline, payment_token_expiry
+from .paymob import PayMobClient, ProviderServiceError, ensure_provider_available
+from .rate_limit import BACKGROUND
+from .rollups import record_deltas
+from .state_machine import transition_many
+from ..models import Transaction
+
+logger = logging.getLogger(__name__)
+
+
+def create_transactions_bulk(items, asynchronous=None, concurrency=None):
+    """
+    Create one transaction per ``{"customer_id", "amount"}`` item.
+
+    Billing snapshots come from one query and the rows from one
+    ``bulk_create`` (plus one read of their ids where the backend doesn't
+    return them). PayMob order and payment key steps run on a bounded
+    thread pool over the shared ``paymob`` connection pool (threads only do
+    HTTP), then every row with a payment key is moved to PENDING with one
+    conditional update, failed ones stay INITIATED to be resumed. In
+    asynchronous mode the provider steps go to the provider queue.
+
+    Return one result dict per item, in order. Items that failed carry an
+    ``error`` and, when no row was created, no ``merchant_order_id``.
+    Raises ProviderUnavailableError while the PayMob circuit breaker is open.
+    """
+    ensure_provider_available()
+    if asynchronous is None:
+        asynchronous = getattr(settings, "PROVIDER_ASYNC_ORCHESTRATION", False)
+    concurrency = concurrency or getattr(settings, "BULK_TRANSACTION_CONCURRENCY", 16)
+
+    snapshots = billing_snapshots([item["customer_id"] for item in items])
+    results = [{"index": index} for index in range(len(items))]
+    rows = []
+    for result, item in zip(results, items):
+        billing = snapshots[item["customer_id"]]
+        if isinstance(billing, SupportedCountryError):
+            result.update(state=None, error=f"{billing.details}:{billing.message}")
+            continue
+        rows.append(
+            (
+                result,
+                Transaction(
+                    customer_id=item["customer_id"],
+                    amount=item["amount"],
+                    billing_snapshot=billing,
+                ),
+            )
+        )
+
+    with db_transaction.atomic():
+        Transaction.objects.bulk_create([tx for _, tx in rows])
+        _fill_ids([tx for _, tx in rows])
+        record_deltas([(tx, None, tx.state) for _, tx in rows])
+    logger.info(f"Bulk created {len(rows)} of {len(items)} transactions.")
+
+    if asynchronous:
+        from ..tasks import interact_with_provider_task
+
+        for _, tx in rows:
+            db_transaction.on_commit(
+                lambda tx_id=tx.id: interact_with_provider_task.delay(tx_id)
+            )
+    elif rows:
+        with ThreadPoolExecutor(
+            max_workers=min(concurrency, len(rows)),
+            thread_name_prefix="paymob-bulk",
+        ) as executor:
+            outcomes = list(executor.map(_provider_steps, [tx for _, tx in rows]))
+        _apply_outcomes(rows, outcomes)
+
+    for result, tx in rows:
+        result.update(
+            merchant_order_id=tx.merchant_order_id,
+            customer=tx.customer_id,
+            amount=str(tx.amount),
+            state=tx.state,
+            order_id=tx.order_id,
+            payment_token=tx.payment_token,
+        )
+    return results
+
+
+def _fill_ids(transactions):
+    """
+    Set the ids bulk_create leaves empty on backends that can't return them
+    (MySQL), read back by the unique merchant_order_id
+    """
+    missing = {tx.merchant_order_id: tx for tx in transactions if tx.id is None}
+    if not missing:
+        return
+    for merchant_id, tx_id in Transaction.objects.filter(
+        merchant_order_id__in=missing
+    ).values_list("merchant_order_id", "id"):
+        missing[merchant_id].id = tx_id
+
+
+def _provider_steps(tx):
+    """
+    Return ``(order_id, (payment_token, expires_at))``, the second item is
+    the ProviderServiceError when a step failed. Never touches the database.
+    """
+    provider = PayMobClient(
+        amount_cents=int(tx.amount * 100),
+        billing=tx.billing_snapshot,
+        deadline=checkout_deadline(),
+        # live checkouts keep part of the rate limit during a batch
+        priority=BACKGROUND,
+    )
+    order_id = None
+    try:
+        order_id = provider.create_order(merchant_id=tx.merchant_order_id)
+        expires_at = payment_token_expiry()
+        return order_id, (provider.payment_key_token(order_id=order_id), expires_at)
+    except ProviderServiceError as e:
+        logger.error(
+            f"Transaction {tx.merchant_order_id} failed during provider interaction: {e.message}"
+        )
+        return order_id, e
+
+
+def _apply_outcomes(rows, outcomes):
+    """
+    Move rows with a payment token to PENDING. Failed rows stay INITIATED
+    with their order checkpoint, to be resumed like a single checkout.
+    """
+    changes, checkpoints = [], []
+    for (result, tx), (order_id, outcome) in zip(rows, outcomes):
+        if isinstance(outcome, ProviderServiceError):
+            result["error"] = f"Provider interaction failed:{outcome.message}"
+            if order_id:
+                tx.order_id = str(order_id)
+                tx.checkpoint = Transaction.Checkpoint.ORDER_CREATED
+                checkpoints.append(tx)
+        else:
+            payment_token, expires_at = outcome
+            changes.append(
+                (
+                    tx,
+                    Transaction.TransactionState.PENDING,
+                    {
+                        "order_id": str(order_id),
+                        "payment_token": payment_token,
+                        "payment_token_expires_at": expires_at,
+                        "checkpoint": Transaction.Checkpoint.KEY_ISSUED,
+                    },
+                )
+            )
+    with db_transaction.atomic():
+        Transaction.objects.bulk_update(checkpoints, ["order_id", "checkpoint"])
+        transition_many(changes)
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTTLCache:
+    """
+    Bounded in-process cache, entries expire after their ttl and the least
+    recently used entry is evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the stored entry dict or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, ttl, version=None):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = {
+                "value": value,
+                "version": version,
+                "expires_at": now + ttl,
+                "checked_at": now,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, key):
+        """Mark the entry version as just confirmed against redis"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                entry["checked_at"] = time.monotonic()
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    Process-local tier in front of the shared redis cache.
+
+    Every key has a companion ``<key>:version`` counter in redis bumped on
+    each write. A local entry is served without touching redis for
+    PROVIDER_CACHE_VERSION_CHECK seconds, after that its version is compared
+    with redis, so a rotation made by any process reaches all the others
+    within that delay.
+    """
+
+    def __init__(self, max_entries=None):
+        self.local = LocalTTLCache(
+            max_entries or getattr(settings, "PROVIDER_LOCAL_CACHE_SIZE", 128)
+        )
+        self._counters = {
+            "local": {"hits": 0, "misses": 0},
+            "redis": {"hits": 0, "misses": 0},
+        }
+        self._counters_lock = threading.Lock()
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, "PROVIDER_LOCAL_CACHE_TTL", 60)
+
+    @property
+    def version_check(self):
+        return getattr(settings, "PROVIDER_CACHE_VERSION_CHECK", 5)
+
+    @staticmethod
+    def version_key(key):
+        return f"{key}:version"
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is not None:
+            if time.monotonic() - entry["checked_at"] < self.version_check:
+                self._count("local", "hits")
+                return entry["value"]
+            if cache.get(self.version_key(key)) == entry["version"]:
+                self.local.touch(key)
+                self._count("local", "hits")
+                return entry["value"]
+            # rotated by another process
+            self.local.delete(key)
+        self._count("local", "misses")
+
+        found = cache.get_many([key, self.version_key(key)])
+        value = found.get(key)
+        if value is None:
+            self._count("redis", "misses")
+            return None
+        self._count("redis", "hits")
+        self.local.set(
+            key, value, self.local_ttl, version=found.get(self.version_key(key))
+        )
+        return value
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout=timeout)
+        version = self._bump_version(key)
+        self.local.set(key, value, min(self.local_ttl, timeout), version=version)
+
+    def delete(self, key):
+        cache.delete(key)
+        self._bump_version(key)
+        self.local.delete(key)
+
+    def stats(self):
+        """Hit/miss counters per tier"""
+        with self._counters_lock:
+            stats = {tier: dict(counts) for tier, counts in self._counters.items()}
+        stats["local"]["size"] = len(self.local)
+        return stats
+
+    def reset_stats(self):
+        with self._counters_lock:
+            for counts in self._counters.values():
+                counts.update(hits=0, misses=0)
+
+    def _bump_version(self, key):
+        version_key = self.version_key(key)
+        # version counters outlive the values they guard
+        cache.add(version_key, 0, timeout=None)
+        try:
+            return cache.incr(version_key)
+        except ValueError:
+            logger.warning(f"cache version {version_key} vanished, resetting.")
+            cache.set(version_key, 1, timeout=None)
+            return 1
+
+    def _count(self, tier, outcome):
+        with self._counters_lock:
+            self._counters[tier][outcome] += 1
+
+
+provider_cache = TieredCache()
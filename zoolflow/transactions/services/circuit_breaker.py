@@ -0,0 +1,252 @@
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_BREAKER = {
+    "WINDOW": 30,  # seconds of calls the rates are computed on
+    "MIN_CALLS": 10,  # calls in the window before the breaker may trip
+    "FAILURE_RATE": 0.5,  # share of failed calls that trips it
+    "SLOW_CALL_SECONDS": 5,  # a call slower than this counts as slow
+    "SLOW_RATE": 0.8,  # share of slow calls that trips it
+    "OPEN_SECONDS": 30,  # fail fast this long before probing
+    "PROBE_INTERVAL": 5,  # half-open lets PROBE_CALLS through per interval
+    "PROBE_CALLS": 3,
+    "CLOSE_AFTER": 3,  # successful probes in a row that close it again
+}
+
+
+class CircuitOpenError(Exception):
+    # Raised instead of calling an upstream the breaker considers down,
+    # ``retry_after`` is the number of seconds before the next probe
+    def __init__(self, message, details=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state lives in redis, shared by every process.
+
+    Calls are counted in fixed WINDOW buckets. Once MIN_CALLS were made and
+    the failure or slow call rate reaches its threshold the breaker opens:
+    calls fail with CircuitOpenError for OPEN_SECONDS without touching the
+    network. It then turns half-open and lets PROBE_CALLS calls through per
+    PROBE_INTERVAL, CLOSE_AFTER successes close it and a failure reopens it.
+
+    Only ``failures`` exceptions count as failed calls. Redis errors never
+    block a call, the breaker just stops counting.
+    """
+
+    def __init__(self, name, failures=(Exception,), config=None):
+        self.name = name
+        self.failures = failures
+        self._config = config or {}
+        self.prefix = f"circuit:{name}"
+
+    @property
+    def config(self):
+        breakers = getattr(settings, "CIRCUIT_BREAKERS", {})
+        return {**DEFAULT_BREAKER, **breakers.get(self.name, {}), **self._config}
+
+    @property
+    def redis(self):
+        return get_redis_connection("default")
+
+    def _key(self, suffix):
+        return f"{self.prefix}:{suffix}"
+
+    def _window_key(self, now=None):
+        bucket = int((now or time.time()) // self.config["WINDOW"])
+        return self._key(f"window:{bucket}")
+
+    def state(self):
+        """Current state and the seconds left before the next probe"""
+        opened, half_open, probes = self.redis.mget(
+            self._key("open"), self._key("half_open"), self._key("probes")
+        )
+        if opened:
+            return OPEN, max(self.redis.ttl(self._key("open")), 1)
+        if half_open:
+            if int(probes or 0) >= self.config["PROBE_CALLS"]:
+                return HALF_OPEN, max(self.redis.ttl(self._key("probes")), 1)
+            return HALF_OPEN, 0
+        return CLOSED, 0
+
+    def ensure_closed(self):
+        """
+        Raise CircuitOpenError when no call would be let through right now,
+        used to refuse new work before it starts.
+        """
+        try:
+            state, retry_after = self.state()
+        except RedisError as e:
+            logger.warning(f"circuit {self.name} state unavailable: {e}")
+            return
+        if retry_after:
+            raise CircuitOpenError(
+                f"{self.name} is unavailable, retry in {retry_after} seconds.",
+                details=state,
+                retry_after=retry_after,
+            )
+
+    def before_call(self):
+        """
+        Let a call through or raise CircuitOpenError.
+        Return True when the call is a half-open probe.
+        """
+        try:
+            state, retry_after = self.state()
+            if state == HALF_OPEN and not retry_after:
+                with self.redis.pipeline() as pipe:
+                    # the counter starts a new PROBE_INTERVAL once it expired
+                    pipe.set(
+                        self._key("probes"),
+                        0,
+                        ex=self.config["PROBE_INTERVAL"],
+                        nx=True,
+                    )
+                    pipe.incr(self._key("probes"))
+                    _, probes = pipe.execute()
+                if probes <= self.config["PROBE_CALLS"]:
+                    return True
+                retry_after = max(self.redis.ttl(self._key("probes")), 1)
+        except RedisError as e:
+            logger.warning(f"circuit {self.name} state unavailable: {e}")
+            return False
+        if state == CLOSED:
+            return False
+        raise CircuitOpenError(
+            f"{self.name} is unavailable, retry in {retry_after} seconds.",
+            details=state,
+            retry_after=retry_after,
+        )
+
+    def record(self, failed, elapsed, probe=False):
+        """Count a finished call and trip, reopen or close the breaker"""
+        slow = elapsed >= self.config["SLOW_CALL_SECONDS"]
+        try:
+            if probe:
+                self._record_probe(failed or slow)
+                return
+            window = self._window_key()
+            with self.redis.pipeline() as pipe:
+                pipe.hincrby(window, "calls", 1)
+                pipe.hincrby(window, "failures", int(failed))
+                pipe.hincrby(window, "slow", int(slow))
+                pipe.expire(window, self.config["WINDOW"] * 2)
+                calls, failures, slow_calls, _ = pipe.execute()
+            if self._should_trip(calls, failures, slow_calls):
+                self.trip(
+                    f"{failures} failed and {slow_calls} slow of {calls} calls"
+                )
+        except RedisError as e:
+            logger.warning(f"circuit {self.name} could not record a call: {e}")
+
+    def _should_trip(self, calls, failures, slow_calls):
+        config = self.config
+        if calls < config["MIN_CALLS"]:
+            return False
+        return (
+            failures / calls >= config["FAILURE_RATE"]
+            or slow_calls / calls >= config["SLOW_RATE"]
+        )
+
+    def _record_probe(self, failed):
+        if failed:
+            self.trip("half-open probe failed")
+            return
+        successes = self.redis.incr(self._key("successes"))
+        if successes >= self.config["CLOSE_AFTER"]:
+            self.reset()
+            logger.warning(f"circuit {self.name} closed after {successes} probes.")
+
+    def trip(self, reason=""):
+        """Open the breaker for OPEN_SECONDS, then probe"""
+        with self.redis.pipeline() as pipe:
+            pipe.set(self._key("open"), reason or "1", ex=self.config["OPEN_SECONDS"])
+            pipe.set(self._key("half_open"), reason or "1")
+            pipe.set(self._key("opened_at"), int(time.time()))
+            pipe.delete(self._key("probes"), self._key("successes"))
+            pipe.delete(self._window_key())
+            pipe.execute()
+        logger.warning(f"circuit {self.name} opened: {reason}")
+
+    def reset(self):
+        self.redis.delete(
+            self._key("open"),
+            self._key("half_open"),
+            self._key("probes"),
+            self._key("successes"),
+            self._window_key(),
+        )
+
+    def snapshot(self):
+        """State and current window counters, for monitoring"""
+        try:
+            state, retry_after = self.state()
+            window = self.redis.hgetall(self._window_key())
+            opened_at, reason = self.redis.mget(
+                self._key("opened_at"), self._key("half_open")
+            )
+        except RedisError as e:
+            return {"name": self.name, "state": "unknown", "error": str(e)}
+        counters = {
+            field: int(window.get(field.encode(), 0))
+            for field in ("calls", "failures", "slow")
+        }
+        return {
+            "name": self.name,
+            "state": state,
+            "retry_after": retry_after,
+            "reason": reason.decode() if reason else None,
+            "last_opened_at": int(opened_at) if opened_at else None,
+            "window": counters,
+            "config": self.config,
+        }
+
+    @contextmanager
+    def guard(self):
+        """
+        Run the body as one call through the breaker, raise
+        CircuitOpenError instead when the breaker is open.
+        """
+        probe = self.before_call()
+        started = time.monotonic()
+        try:
+            yield
+        except self.failures:
+            self.record(True, time.monotonic() - started, probe)
+            raise
+        except Exception:
+            # not an upstream failure, e.g. a missing field in the answer
+            self.record(False, time.monotonic() - started, probe)
+            raise
+        self.record(False, time.monotonic() - started, probe)
+
+    @asynccontextmanager
+    async def aguard(self):
+        """Async counterpart of guard, redis is used off the event loop"""
+        probe = await sync_to_async(self.before_call, thread_sensitive=False)()
+        record = sync_to_async(self.record, thread_sensitive=False)
+        started = time.monotonic()
+        try:
+            yield
+        except self.failures:
+            await record(True, time.monotonic() - started, probe)
+            raise
+        except Exception:
+            await record(False, time.monotonic() - started, probe)
+            raise
+        await record(False, time.monotonic() - started, probe)
@@ -4,17 +4,10 @@ from ..models import Transaction
 logger = logging.getLogger(__name__)
 
 
-def retrieve_transaction_for_update(**kwargs) -> Transaction | None:
-    """
-    Retrieve a copy of transaction with select_for_update,
-    to avoid race conditions"""
-    return Transaction.objects.select_for_update().filter(**kwargs).first()
-
-
 def bring_transaction(**kwargs) -> Transaction | None:
-    """Fetch transaction based on given kwargs"""
-    transaction = Transaction.objects.filter(**kwargs)
-    if not transaction.exists():
+    """Fetch transaction based on given kwargs, in a single query"""
+    transaction = Transaction.objects.filter(**kwargs).first()
+    if transaction is None:
         id = (
             kwargs.get("transaction_id")
             if kwargs.get("transaction_id")
@@ -24,4 +17,4 @@ def bring_transaction(**kwargs) -> Transaction | None:
             f"Transaction with id {id} doesn't exist.",
         )
         return None
-    return transaction.first()
+    return transaction
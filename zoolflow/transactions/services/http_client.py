@@ -1,19 +1,246 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+import httpx
 import requests
+from django.conf import settings
 from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-
-def get_session_with_retries():
-    max_retry = Retry(
-        total=3,
-        # backoff_seconds = backoff_factor * (2 ** (retry_number - 1))
-        backoff_factor=1,
-        status_forcelist=[500, 502, 503, 504, 429],
-        allowed_methods=["POST"],
-    )
-
-    adapter = HTTPAdapter(max_retries=max_retry)
-    session = requests.Session()
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRANSPORT = {
+    "POOL_CONNECTIONS": 4,  # host pools kept per upstream
+    "POOL_MAXSIZE": 10,  # keep-alive connections per host
+    "POOL_BLOCK": True,  # wait for a free connection instead of opening more
+    "POOL_TIMEOUT": 5,  # seconds to wait for a free connection
+    "TIMEOUT": (5, 15),  # (connect, read)
+}
+
+
+class _CountingPoolMixin:
+    """
+    Record per host pool usage so reuse and waiting can be reported.
+
+    urllib3 pre-fills the pool queue with ``None`` placeholders, a request
+    only waits when all ``maxsize`` connections are checked out.
+    """
+
+    pool_timeout = None
+
+    def _get_conn(self, timeout=None):
+        if timeout is None:
+            timeout = self.pool_timeout
+        must_wait = self.block and self.pool is not None and self.pool.empty()
+        started = time.monotonic()
+        try:
+            return super()._get_conn(timeout=timeout)
+        finally:
+            if must_wait:
+                self.num_waits = getattr(self, "num_waits", 0) + 1
+                self.wait_time = getattr(self, "wait_time", 0.0) + (
+                    time.monotonic() - started
+                )
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    def __init__(self, pool_timeout=None, **kwargs):
+        self.pool_timeout = pool_timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {"pool_timeout": getattr(self, "pool_timeout", None)}
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("HTTPPool", (CountingHTTPConnectionPool,), attrs),
+            "https": type("HTTPSPool", (CountingHTTPSConnectionPool,), attrs),
+        }
+
+    def send(self, request, *args, **kwargs):
+        try:
+            return super().send(request, *args, **kwargs)
+        except EmptyPoolError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+    def pool_stats(self):
+        """Usage of every host pool opened by this adapter"""
+        stats = {}
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_count = pool.num_requests
+            connections = pool.num_connections
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "requests": requests_count,
+                "connections": connections,
+                "reuse_ratio": (
+                    round(1 - connections / requests_count, 4)
+                    if requests_count
+                    else 0.0
+                ),
+                "waits": getattr(pool, "num_waits", 0),
+                "wait_time": round(getattr(pool, "wait_time", 0.0), 4),
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+            }
+        return stats
+
+
+class TransportRegistry:
+    """
+    Process-wide keep-alive sessions, one per upstream (paymob, mailgun...).
+
+    Each upstream session keeps one connection pool per host, sized by the
+    HTTP_TRANSPORT setting. Sessions are dropped in a forked child (gunicorn
+    and celery prefork) so sockets are never shared between processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sessions = {}
+        self._adapters = {}
+
+    def config(self, upstream):
+        transport = getattr(settings, "HTTP_TRANSPORT", {})
+        return {
+            **DEFAULT_TRANSPORT,
+            **transport.get("default", {}),
+            **transport.get(upstream, {}),
+        }
+
+    def timeout(self, upstream):
+        return self.config(upstream)["TIMEOUT"]
+
+    def session(self, upstream="default"):
+        if os.getpid() != self._pid:
+            self.reset()
+        session = self._sessions.get(upstream)
+        if session is not None:
+            return session
+        with self._lock:
+            session = self._sessions.get(upstream)
+            if session is None:
+                session = self._build_session(upstream)
+                self._sessions[upstream] = session
+        return session
+
+    def stats(self):
+        """Pool statistics (reuse ratio, waits) per upstream and host"""
+        return {
+            upstream: adapter.pool_stats()
+            for upstream, adapter in list(self._adapters.items())
+        }
+
+    def reset(self):
+        """
+        Forget inherited sessions without closing them, the sockets belong
+        to the parent process.
+        """
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sessions = {}
+        self._adapters = {}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+            self._adapters = {}
+
+    def _build_session(self, upstream):
+        config = self.config(upstream)
+        # no transport retries: PayMob calls retry within their deadline
+        # (services/retry.py), mail sending retries in its celery task
+        adapter = PooledHTTPAdapter(
+            pool_connections=config["POOL_CONNECTIONS"],
+            pool_maxsize=config["POOL_MAXSIZE"],
+            pool_block=config["POOL_BLOCK"],
+            pool_timeout=config["POOL_TIMEOUT"],
+            max_retries=0,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self._adapters[upstream] = adapter
+        logger.info(f"HTTP transport for {upstream} initialized.")
+        return session
+
+
+transport = TransportRegistry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=transport.reset)
+
+
+def get_session_with_retries(upstream="default"):
+    """
+    Return the shared keep-alive session of the given upstream, the name
+    predates services/retry.py: the session itself no longer retries.
+    """
+    return transport.session(upstream)
+
+
+def get_timeout(upstream="default"):
+    return transport.timeout(upstream)
+
+
+class AsyncTransportRegistry:
+    """
+    Keep-alive ``httpx.AsyncClient`` per upstream and event loop, sized by
+    the same HTTP_TRANSPORT setting as the blocking transport.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+
+    def client(self, upstream="default"):
+        loop = asyncio.get_running_loop()
+        clients = self._clients.setdefault(loop, {})
+        client = clients.get(upstream)
+        if client is None or client.is_closed:
+            client = clients[upstream] = self._build_client(upstream)
+        return client
+
+    async def aclose(self):
+        clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+    def _build_client(self, upstream):
+        config = transport.config(upstream)
+        connect, read = config["TIMEOUT"]
+        limits = httpx.Limits(
+            max_connections=config["POOL_MAXSIZE"],
+            max_keepalive_connections=config["POOL_MAXSIZE"],
+        )
+        timeout = httpx.Timeout(
+            connect=connect, read=read, write=read, pool=config["POOL_TIMEOUT"]
+        )
+        logger.info(f"Async HTTP transport for {upstream} initialized.")
+        return httpx.AsyncClient(
+            timeout=timeout,
+            # retried by acall_with_retries within the operation deadline
+            transport=httpx.AsyncHTTPTransport(limits=limits),
+        )
+
+
+async_transport = AsyncTransportRegistry()
+
+
+def get_async_client(upstream="default"):
+    """Return the keep-alive async client of the given upstream"""
+    return async_transport.client(upstream)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from redis.exceptions import LockError, RedisError
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_KEY = "idempotency:{scope}:{key}"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    # Raised when an Idempotency-Key can't be honoured, ``status`` is the
+    # HTTP status to answer with
+    def __init__(self, message, details=None, status=409):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status = status
+
+
+def request_fingerprint(data):
+    """Stable hash of a request body, a reused key must carry the same body"""
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def run_idempotent(scope, key, fingerprint, handler):
+    """
+    Run ``handler()`` once per ``(scope, key)`` and replay its response.
+
+    ``handler`` returns ``(status, data)``. The first non-5xx response is
+    stored for IDEMPOTENCY_KEY_TTL seconds. Concurrent requests with the same
+    key wait on a per-key lock for the in-flight response instead of running
+    the handler again.
+
+    Return ``(status, data, replayed)``. Raises IdempotencyError when the key
+    is invalid, reused with another body or still in flight after
+    IDEMPOTENCY_WAIT_TIMEOUT seconds. Redis being down runs the handler
+    without idempotency.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(
+            f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.",
+            details="Idempotency-Key",
+            status=400,
+        )
+    response_key = RESPONSE_KEY.format(scope=scope, key=key)
+    try:
+        stored = _replay(response_key, fingerprint)
+        if stored:
+            return stored
+        lock = cache.lock(
+            f"{response_key}:lock",
+            timeout=getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 60),
+            blocking_timeout=getattr(settings, "IDEMPOTENCY_WAIT_TIMEOUT", 10),
+        )
+        acquired = lock.acquire()
+    except RedisError as e:
+        logger.warning(f"idempotency store unavailable: {e}")
+        return (*handler(), False)
+
+    if not acquired:
+        raise IdempotencyError(
+            "A request with this Idempotency-Key is still in progress.",
+            details="Idempotency-Key",
+        )
+    try:
+        # the request we waited on may have finished meanwhile
+        stored = _replay(response_key, fingerprint)
+        if stored:
+            return stored
+        status, data = handler()
+        if status < 500:
+            cache.set(
+                response_key,
+                {"fingerprint": fingerprint, "status": status, "data": data},
+                timeout=getattr(settings, "IDEMPOTENCY_KEY_TTL", 60 * 60 * 24),
+            )
+        return status, data, False
+    finally:
+        try:
+            lock.release()
+        except (LockError, RedisError):
+            logger.warning(f"idempotency lock {response_key} expired before release.")
+
+
+def _replay(response_key, fingerprint):
+    stored = cache.get(response_key)
+    if not stored:
+        return None
+    if stored["fingerprint"] != fingerprint:
+        raise IdempotencyError(
+            "Idempotency-Key was already used with a different request.",
+            details="Idempotency-Key",
+            status=422,
+        )
+    logger.info(f"Replaying stored response for {response_key}.")
+    return stored["status"], stored["data"], True
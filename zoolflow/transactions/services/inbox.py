@@ -0,0 +1,196 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from redis.exceptions import LockError, RedisError
+from .orchestration import TransactionOrchestrationService
+from .paymob import ProviderServiceError
+from .state_machine import transition_many
+from ..models import Transaction, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+DRAIN_LOCK_KEY = "paymob:webhook:inbox:drain"
+DRAIN_SCHEDULED_KEY = "paymob:webhook:inbox:scheduled"
+DELIVERY_KEY = "paymob:webhook:seen:{transaction_id}:{signature}"
+
+
+def _delivery_key(transaction_id, received_hmac):
+    # a transaction id is re-sent when its flags change (pending -> success),
+    # the signature tells a new callback from a redelivery
+    return DELIVERY_KEY.format(
+        transaction_id=transaction_id, signature=str(received_hmac)[:32]
+    )
+
+
+def claim_webhook_delivery(transaction_id, received_hmac):
+    """
+    Return False when this exact callback was already accepted.
+
+    Atomic SET NX with a TTL, so duplicate deliveries are answered without
+    touching the database. Fails open when redis is unavailable, the drain
+    still ignores transactions that already left PENDING.
+    """
+    ttl = getattr(settings, "PAYMOB_WEBHOOK_DEDUPE_TTL", 60 * 60 * 24)
+    try:
+        return cache.add(_delivery_key(transaction_id, received_hmac), 1, timeout=ttl)
+    except RedisError as e:
+        logger.warning(f"webhook dedupe unavailable: {e}")
+        return True
+
+
+def release_webhook_delivery(transaction_id, received_hmac):
+    """Forget a claim whose event couldn't be stored, so PayMob can retry"""
+    try:
+        cache.delete(_delivery_key(transaction_id, received_hmac))
+    except RedisError as e:
+        logger.warning(f"webhook dedupe release failed: {e}")
+
+
+def append_webhook_event(data, merchant_id, transaction_id):
+    """
+    Persist a verified PayMob callback and schedule the inbox drain.
+    """
+    event = WebhookEvent.objects.create(
+        transaction_id=transaction_id,
+        merchant_order_id=merchant_id,
+        payload=data,
+    )
+    schedule_webhook_drain()
+    return event
+
+
+def schedule_webhook_drain():
+    """Queue a drain once the current DB transaction commits"""
+    from ..tasks import drain_webhook_inbox_task
+
+    # at most one queued drain per window, the drain takes the whole batch
+    countdown = getattr(settings, "PAYMOB_WEBHOOK_DRAIN_DELAY", 1)
+    if cache.add(DRAIN_SCHEDULED_KEY, 1, timeout=countdown + 1):
+        db_transaction.on_commit(
+            lambda: drain_webhook_inbox_task.apply_async(countdown=countdown)
+        )
+
+
+def drain_webhook_inbox(batch_size=None, max_batches=None, time_budget=None):
+    """
+    Process received webhook events in batches, return processed count.
+
+    Only one drain runs at a time so events are never applied twice. No
+    provider lookup starts once the time budget is spent, so the drain
+    ends well inside its lock TTL; events left over get a new drain.
+    """
+    batch_size = batch_size or getattr(settings, "PAYMOB_WEBHOOK_BATCH_SIZE", 100)
+    time_budget = time_budget or getattr(
+        settings, "PAYMOB_WEBHOOK_DRAIN_TIME_BUDGET", 30
+    )
+    # the last lookup may outlive the budget by its own deadline
+    lock = cache.lock(DRAIN_LOCK_KEY, timeout=time_budget + 60, blocking=False)
+    if not lock.acquire():
+        logger.info("webhook inbox drain already running.")
+        return 0
+    deadline = time.monotonic() + time_budget
+    processed = 0
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            events = list(
+                WebhookEvent.objects.filter(
+                    status=WebhookEvent.EventStatus.RECEIVED
+                ).order_by("id")[:batch_size]
+            )
+            if not events:
+                break
+            count = _process_batch(events, deadline)
+            processed += count
+            batches += 1
+            if time.monotonic() >= deadline:
+                logger.info("webhook inbox drain out of time, scheduling another.")
+                schedule_webhook_drain()
+                break
+            # a batch left only for retry waits for the next drain
+            if not count or len(events) < batch_size:
+                break
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("webhook inbox drain lock expired before release.")
+    return processed
+
+
+def _process_batch(events, deadline):
+    """
+    Apply one batch of events with a single conditional update.
+
+    Events are deduped per order, the latest one wins: a declined attempt
+    followed by a successful retry are two provider transactions of one
+    Transaction row. Events reached after the deadline are left received
+    for the next drain.
+    """
+    from zoolflow.notifications.tasks import transaction_state_email_task
+
+    latest = {}
+    for event in events:
+        latest[event.merchant_order_id] = event
+    superseded = [e.id for e in events if latest[e.merchant_order_id].id != e.id]
+
+    merchant_ids = {e.merchant_order_id for e in latest.values()}
+    transactions = Transaction.objects.in_bulk(
+        merchant_ids, field_name="merchant_order_id"
+    )
+
+    done, failed, retry = list(superseded), [], []
+    changes = []
+    for event in latest.values():
+        if time.monotonic() >= deadline:
+            break
+        tx = transactions.get(event.merchant_order_id)
+        if tx is None:
+            logger.warning(f"Transaction {event.merchant_order_id} doesn't exist.")
+            failed.append(event.id)
+            continue
+        # check if transaction is already processed
+        if tx.state != Transaction.TransactionState.PENDING:
+            logger.warning(f"Transaction {event.transaction_id} already processed")
+            done.append(event.id)
+            continue
+        try:
+            state = TransactionOrchestrationService.webhook_state(
+                event.payload, event.transaction_id
+            )
+        except ProviderServiceError as e:
+            logger.error(
+                f"Webhook {event.transaction_id} state lookup failed: {e.message}"
+            )
+            retry.append(event)
+            continue
+        changes.append((tx, state, {"transaction_id": event.transaction_id}))
+        done.append(event.id)
+
+    max_attempts = getattr(settings, "PAYMOB_WEBHOOK_MAX_ATTEMPTS", 5)
+    exhausted = [e.id for e in retry if e.attempts + 1 >= max_attempts]
+    now = timezone.now()
+    with db_transaction.atomic():
+        # conditional update, rows moved meanwhile by the sweeper are skipped
+        updated = transition_many(changes)
+        WebhookEvent.objects.filter(id__in=done).update(
+            status=WebhookEvent.EventStatus.PROCESSED, processed_at=now
+        )
+        WebhookEvent.objects.filter(id__in=failed + exhausted).update(
+            status=WebhookEvent.EventStatus.FAILED, processed_at=now
+        )
+        WebhookEvent.objects.filter(
+            id__in=[e.id for e in retry if e.id not in exhausted]
+        ).update(attempts=F("attempts") + 1)
+        for tx in updated:
+            logger.info(f"Transaction {tx.transaction_id} updated to {tx.state}.")
+            db_transaction.on_commit(
+                lambda transaction_id=tx.transaction_id: transaction_state_email_task.delay(
+                    transaction_id
+                )
+            )
+    return len(done) + len(failed) + len(exhausted)
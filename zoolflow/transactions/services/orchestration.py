@@ -1,44 +1,115 @@
 import logging
+import random
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.db import transaction as db_transaction
-from .paymob import PayMobClient, ProviderServiceError
+from django.utils import timezone
+from redis.exceptions import LockError
+from zoolflow.customers.services.helpers import SupportedCountryError, billing_snapshot
+from .paymob import (
+    PayMobClient,
+    ProviderServiceError,
+    ProviderUnavailableError,
+    ensure_provider_available,
+)
+from .paymob_async import AsyncPayMobClient
+from .rate_limit import LIVE
 from ..models import Transaction
-from .helpers import retrieve_transaction_for_update
+from .retry import Deadline
+from .rollups import record_deltas
+from .state_machine import transition
 
 logger = logging.getLogger(__name__)
 
+# provider flags read by state_from_flags
+STATE_FLAGS = (
+    "error_occured",
+    "is_refunded",
+    "is_voided",
+    "success",
+    "is_capture",
+    "is_auth",
+    "is_standalone_payment",
+    "pending",
+)
+
+
+def checkout_deadline():
+    """Budget of the token, order and payment key steps of one checkout"""
+    return Deadline(getattr(settings, "PAYMOB_CHECKOUT_DEADLINE", 8))
+
+
+def payment_token_expiry():
+    """Expiry of a payment key requested now, read before the request"""
+    return timezone.now() + timedelta(
+        seconds=getattr(settings, "PAYMOB_PAYMENT_KEY_EXPIRATION", 60 * 60)
+    )
+
+
+def payment_token_usable(transaction):
+    """
+    True when the stored payment key outlives PAYMOB_PAYMENT_KEY_MIN_LIFETIME,
+    keys of unknown expiry are reissued
+    """
+    if not transaction.payment_token or not transaction.payment_token_expires_at:
+        return False
+    min_lifetime = timedelta(
+        seconds=getattr(settings, "PAYMOB_PAYMENT_KEY_MIN_LIFETIME", 60 * 5)
+    )
+    return transaction.payment_token_expires_at > timezone.now() + min_lifetime
+
 
 class TransactionOrchestrationServiceError(Exception):
-    # Raised when orchestration handling fail or return invalid value
-    def __init__(self, message, details=None):
+    # Raised when orchestration handling fail or return invalid value,
+    # ``merchant_order_id`` names a transaction left to resume
+    def __init__(self, message, details=None, merchant_order_id=None):
         super().__init__(message)
         self.message = message
         self.details = details
+        self.merchant_order_id = merchant_order_id
 
 
 class TransactionOrchestrationService:
     def __init__(self, customer):
         self.customer = customer
 
-    def create_transaction(self, validated_data):
+    def create_transaction(self, validated_data, asynchronous=None):
         """
         Create transaction with approbiate filed,
         after interacting with payment provider
+
+        When asynchronous (default PROVIDER_ASYNC_ORCHESTRATION) the provider
+        steps are handed to the "provider" celery queue and the transaction
+        is returned while still INITIATED.
+
+        Raises ProviderUnavailableError, before any row is created, while
+        the PayMob circuit breaker is open.
         """
+        if asynchronous is None:
+            asynchronous = getattr(settings, "PROVIDER_ASYNC_ORCHESTRATION", False)
+        ensure_provider_available()
         logger.info(
             (
                 f"Initiate transaction for customer with ID {self.customer.id} amount {validated_data['amount']}"
             ).replace("\n", "")
         )
-        with db_transaction.atomic():
-            transaction = Transaction.objects.create(
-                customer=self.customer,
-                **validated_data,
-            )
+        transaction = self._create_row(validated_data)
         logger.info(
             (
                 f"Transaction {transaction.merchant_order_id} created successfully."
             ).replace("\n", "")
         )
+        if asynchronous:
+            from ..tasks import interact_with_provider_task
+
+            # Let the provider worker create order and payment token on commit
+            db_transaction.on_commit(
+                lambda: interact_with_provider_task.delay(transaction.id),
+            )
+            return transaction
+
         # Interact with provider to create order and payment token on commit
         db_transaction.on_commit(
             lambda: self._interact_with_provider(transaction),
@@ -46,60 +117,401 @@ class TransactionOrchestrationService:
         transaction.refresh_from_db()
         return transaction
 
+    def _create_row(self, validated_data):
+        """
+        Insert the INITIATED transaction with its billing snapshot and
+        rollup delta in one DB transaction
+        """
+        billing = self._resolve_billing()
+        with db_transaction.atomic():
+            transaction = Transaction.objects.create(
+                customer=self.customer,
+                billing_snapshot=billing,
+                **validated_data,
+            )
+            record_deltas([(transaction, None, transaction.state)])
+        return transaction
+
+    def _resolve_billing(self):
+        """
+        Resolve the customer billing data once, before the transaction exists
+        """
+        try:
+            return billing_snapshot(self.customer.id)
+        except SupportedCountryError as e:
+            raise TransactionOrchestrationServiceError(
+                details=e.details, message=e.message
+            )
+
+    def _transaction_billing(self, transaction):
+        """
+        Billing snapshot of the transaction, rows created before snapshots
+        existed get theirs stored on first use.
+        """
+        if not transaction.billing_snapshot:
+            transaction.billing_snapshot = billing_snapshot(self.customer.id)
+            Transaction.objects.filter(id=transaction.id).update(
+                billing_snapshot=transaction.billing_snapshot
+            )
+        return transaction.billing_snapshot
+
+    @staticmethod
+    def process_provider_steps(transaction_id):
+        """
+        Run or resume the provider steps of an INITIATED transaction, for
+        the provider task, the retry endpoint and the reconciler.
+
+        Other states are left alone. The unlocked state check only skips
+        finished work early, concurrent runs (a redelivered task, a client
+        retry, the reconciler) are kept from creating a second order by the
+        checkout lock, which re-reads state and checkpoint before any step.
+        Raises TransactionOrchestrationServiceError when a step failed and
+        the transaction is still resumable.
+        """
+        transaction = (
+            Transaction.objects.select_related("customer__user")
+            .filter(id=transaction_id)
+            .first()
+        )
+        if not transaction:
+            logger.warning(f"Transaction with id {transaction_id} doesn't exist.")
+            return None
+        if transaction.state != Transaction.TransactionState.INITIATED:
+            logger.warning(
+                f"Transaction {transaction.merchant_order_id} already processed."
+            )
+            return transaction.state
+        # the task retries later instead of failing the transaction
+        ensure_provider_available()
+
+        service = TransactionOrchestrationService(transaction.customer)
+        try:
+            service._interact_with_provider(transaction)
+        except TransactionOrchestrationServiceError:
+            transaction.refresh_from_db(fields=["state"])
+            if transaction.state == Transaction.TransactionState.FAILED:
+                return transaction.state
+            raise
+        return Transaction.TransactionState.PENDING
+
     def _interact_with_provider(self, transaction: Transaction):
         """
         Interact with PayMob to create order and payment keym
         and set them in transaction passed object
+
+        Each completed step is stored as the transaction checkpoint, a
+        retry skips the order when ``order_id`` is already known (the auth
+        token is shared through the token cache). A failed step leaves the
+        transaction INITIATED to be resumed, only an unsupported billing
+        country fails it.
         """
         merchant_id = transaction.merchant_order_id
-        amount_cents = int(transaction.amount * 100)
-        provider = PayMobClient(
-            customer=self.customer,
-            amount_cents=amount_cents,
-        )
+        lock = self._checkout_lock(transaction)
         try:
-            # Create order and payment key token with provider
-            # Return order id and payment token
-            order_id = provider.create_order(merchant_id=merchant_id)
+            if not self._refresh_checkpoint(transaction):
+                return
+            provider = PayMobClient(
+                customer=self.customer,
+                amount_cents=int(transaction.amount * 100),
+                billing=self._transaction_billing(transaction),
+                deadline=checkout_deadline(),
+            )
+            order_id = transaction.order_id
+            if not order_id:
+                order_id = provider.create_order(merchant_id=merchant_id)
+                TransactionOrchestrationService._save_order(transaction, order_id)
+            expires_at = payment_token_expiry()
             payment_token = provider.payment_key_token(order_id=order_id)
             # Update transaction fields with provider returned values
             TransactionOrchestrationService._define_provider_attribute(
-                transaction, order_id, payment_token
+                transaction, order_id, payment_token, expires_at
             )
+        except SupportedCountryError as e:
+            TransactionOrchestrationService._mark_failed(transaction)
+            raise self._provider_error(transaction, e)
         except ProviderServiceError as e:
-            with db_transaction.atomic():
-                tx = retrieve_transaction_for_update(id=transaction.id)
-                tx.state = Transaction.TransactionState.FAILED
-                tx.save(update_fields=["state"])
-                print("Transaction marked as FAILED due to provider error.")
-            logger.error(
-                f"Transaction {merchant_id} failed during provider interaction: {e.message}"
+            raise self._provider_error(transaction, e)
+        finally:
+            TransactionOrchestrationService._release(lock)
+
+    async def acreate_transaction(self, validated_data):
+        """
+        Async counterpart of create_transaction for ASGI deployments,
+        provider calls are awaited instead of blocking the worker.
+        """
+        await sync_to_async(ensure_provider_available, thread_sensitive=False)()
+        logger.info(
+            (
+                f"Initiate transaction for customer with ID {self.customer.id} amount {validated_data['amount']}"
+            ).replace("\n", "")
+        )
+        transaction = await sync_to_async(self._create_row)(validated_data)
+        logger.info(
+            (
+                f"Transaction {transaction.merchant_order_id} created successfully."
+            ).replace("\n", "")
+        )
+        await self._ainteract_with_provider(transaction)
+        await transaction.arefresh_from_db()
+        return transaction
+
+    async def _ainteract_with_provider(self, transaction: Transaction):
+        """
+        Async counterpart of _interact_with_provider
+        """
+        merchant_id = transaction.merchant_order_id
+        lock = await sync_to_async(self._checkout_lock)(transaction)
+        try:
+            if not await sync_to_async(self._refresh_checkpoint)(transaction):
+                return
+            provider = AsyncPayMobClient(
+                customer=self.customer,
+                amount_cents=int(transaction.amount * 100),
+                billing=await sync_to_async(self._transaction_billing)(transaction),
+                deadline=checkout_deadline(),
+            )
+            order_id = transaction.order_id
+            if not order_id:
+                order_id = await provider.create_order(merchant_id=merchant_id)
+                await sync_to_async(TransactionOrchestrationService._save_order)(
+                    transaction, order_id
+                )
+            expires_at = payment_token_expiry()
+            payment_token = await provider.payment_key_token(order_id=order_id)
+            await sync_to_async(
+                TransactionOrchestrationService._define_provider_attribute
+            )(transaction, order_id, payment_token, expires_at)
+        except SupportedCountryError as e:
+            await sync_to_async(TransactionOrchestrationService._mark_failed)(
+                transaction
             )
+            raise self._provider_error(transaction, e)
+        except ProviderServiceError as e:
+            raise self._provider_error(transaction, e)
+        finally:
+            await sync_to_async(TransactionOrchestrationService._release)(lock)
+
+    @staticmethod
+    def resume_payment(transaction):
+        """
+        Payment key of a PENDING transaction for a customer coming back to
+        pay. The stored key is returned while PayMob still accepts it, an
+        expired one is reissued for the stored order (never a new order).
+
+        Raises TransactionOrchestrationServiceError when the transaction
+        can't be paid and ProviderUnavailableError while PayMob's breaker
+        is open.
+        """
+        if transaction.state != Transaction.TransactionState.PENDING:
             raise TransactionOrchestrationServiceError(
-                details="Provider interaction failed", message=e.message
+                f"Transaction is {transaction.state}.",
+                details="Transaction state",
+                merchant_order_id=transaction.merchant_order_id,
             )
+        if payment_token_usable(transaction):
+            return transaction
+
+        ensure_provider_available()
+        lock = TransactionOrchestrationService._checkout_lock(transaction)
+        try:
+            transaction.refresh_from_db(
+                fields=[
+                    "state",
+                    "order_id",
+                    "payment_token",
+                    "payment_token_expires_at",
+                ]
+            )
+            # another request reissued it while we waited
+            if payment_token_usable(transaction):
+                return transaction
+            provider = PayMobClient(
+                customer=transaction.customer,
+                amount_cents=int(transaction.amount * 100),
+                billing=TransactionOrchestrationService(
+                    transaction.customer
+                )._transaction_billing(transaction),
+                deadline=checkout_deadline(),
+            )
+            expires_at = payment_token_expiry()
+            payment_token = provider.payment_key_token(order_id=transaction.order_id)
+        except ProviderUnavailableError:
+            raise
+        except (ProviderServiceError, SupportedCountryError) as e:
+            raise TransactionOrchestrationService._provider_error(transaction, e)
+        finally:
+            TransactionOrchestrationService._release(lock)
+
+        updated = Transaction.objects.filter(
+            id=transaction.id, state=Transaction.TransactionState.PENDING
+        ).update(
+            payment_token=payment_token,
+            payment_token_expires_at=expires_at,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            # a webhook settled it meanwhile
+            transaction.refresh_from_db()
+            raise TransactionOrchestrationServiceError(
+                f"Transaction is {transaction.state}.",
+                details="Transaction state",
+                merchant_order_id=transaction.merchant_order_id,
+            )
+        transaction.payment_token = payment_token
+        transaction.payment_token_expires_at = expires_at
+        logger.info(
+            f"Transaction {transaction.merchant_order_id} payment key reissued."
+        )
+        return transaction
+
+    @staticmethod
+    def _checkout_lock(transaction):
+        """
+        One checkout at a time per transaction, a client retry racing the
+        reconciler must not create two orders
+        """
+        lock = cache.lock(
+            f"transactions:checkout:{transaction.id}",
+            timeout=getattr(settings, "PAYMOB_CHECKOUT_DEADLINE", 8) + 30,
+            blocking=False,
+        )
+        if not lock.acquire():
+            raise TransactionOrchestrationServiceError(
+                "Provider steps of this transaction are already running.",
+                details="Provider interaction in progress",
+                merchant_order_id=transaction.merchant_order_id,
+            )
+        return lock
+
+    @staticmethod
+    def _release(lock):
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("checkout lock expired before release.")
 
     @staticmethod
-    def _define_provider_attribute(transaction, provider_id, payment_token):
+    def _refresh_checkpoint(transaction):
+        """
+        Re-read state and checkpoint under the checkout lock, False when
+        the transaction is no longer INITIATED
+        """
+        transaction.refresh_from_db(fields=["state", "order_id", "checkpoint"])
+        return transaction.state == Transaction.TransactionState.INITIATED
+
+    @staticmethod
+    def _provider_error(transaction, error):
+        logger.error(
+            f"Transaction {transaction.merchant_order_id} failed during provider "
+            f"interaction at checkpoint {transaction.checkpoint}: {error.message}"
+        )
+        return TransactionOrchestrationServiceError(
+            details="Provider interaction failed",
+            message=error.message,
+            merchant_order_id=transaction.merchant_order_id,
+        )
+
+    @staticmethod
+    def _save_order(transaction, order_id):
+        """Checkpoint the created order, a retry reuses it"""
+        transaction.order_id = str(order_id)
+        transaction.checkpoint = Transaction.Checkpoint.ORDER_CREATED
+        Transaction.objects.filter(
+            id=transaction.id, state=Transaction.TransactionState.INITIATED
+        ).update(
+            order_id=transaction.order_id,
+            checkpoint=transaction.checkpoint,
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def _mark_failed(transaction):
+        """
+        Mark transaction as FAILED after provider interaction fails
+        """
+        if transition(Transaction.TransactionState.FAILED, id=transaction.id):
+            logger.info("Transaction marked as FAILED due to provider error.")
+
+    @staticmethod
+    def _define_provider_attribute(
+        transaction, provider_id, payment_token, expires_at=None
+    ):
         """
         Set provider related fields in transaction instance
         """
-        with db_transaction.atomic():
-            tx = retrieve_transaction_for_update(id=transaction.id)
-            tx.order_id = provider_id
-            tx.payment_token = payment_token
-            tx.state = Transaction.TransactionState.PENDING
-            tx.save(update_fields=["order_id", "payment_token", "state"])
-            print("transaction updated with provider fields.")
-        logger.info(f"Transaction {tx.merchant_order_id} updated with provider fields.")
+        applied = transition(
+            Transaction.TransactionState.PENDING,
+            sources=[Transaction.TransactionState.INITIATED],
+            fields={
+                "order_id": provider_id,
+                "payment_token": payment_token,
+                "payment_token_expires_at": expires_at,
+                "checkpoint": Transaction.Checkpoint.KEY_ISSUED,
+            },
+            id=transaction.id,
+        )
+        if applied:
+            logger.info(
+                f"Transaction {transaction.merchant_order_id} updated with provider fields."
+            )
 
     @staticmethod
-    def transaction_current_state(transaction_id):
+    def transaction_current_state(transaction_id, priority=LIVE):
         """
         Update transaction state with current state and sign ID (Transaction_ID)
         """
 
-        current_data = PayMobClient().get_transaction_flags(transaction_id)
+        current_data = PayMobClient(priority=priority).get_transaction_flags(
+            transaction_id
+        )
+        return TransactionOrchestrationService.state_from_flags(current_data)
+
+    @staticmethod
+    async def atransaction_current_state(transaction_id):
+        """
+        Async counterpart of transaction_current_state
+        """
+        current_data = await AsyncPayMobClient().get_transaction_flags(transaction_id)
+        return TransactionOrchestrationService.state_from_flags(current_data)
+
+    @staticmethod
+    def webhook_state(data, transaction_id):
+        """
+        Return the state of an HMAC verified webhook payload (``obj``).
+
+        With PAYMOB_WEBHOOK_TRUST_PAYLOAD the verified flags are used as is,
+        the provider is only asked when a flag is missing or for the
+        PAYMOB_WEBHOOK_CROSS_CHECK_RATE share of callbacks.
+        """
+        trusted = getattr(settings, "PAYMOB_WEBHOOK_TRUST_PAYLOAD", True)
+        if not trusted or any(flag not in data for flag in STATE_FLAGS):
+            return TransactionOrchestrationService.transaction_current_state(
+                transaction_id
+            )
+
+        state = TransactionOrchestrationService.state_from_flags(data)
+        rate = getattr(settings, "PAYMOB_WEBHOOK_CROSS_CHECK_RATE", 0.0)
+        if rate <= 0 or random.random() >= rate:
+            return state
+        try:
+            remote = TransactionOrchestrationService.transaction_current_state(
+                transaction_id
+            )
+        except ProviderServiceError as e:
+            logger.warning(f"cross-check of {transaction_id} skipped: {e.message}")
+            return state
+        if remote != state:
+            # provider wins, a mismatch means the payload mapping drifted
+            logger.error(
+                f"Webhook state {state} of {transaction_id} differs from provider state {remote}."
+            )
+        return remote
+
+    @staticmethod
+    def state_from_flags(current_data):
+        """
+        Map provider transaction flags to our transaction state
+        """
         # check fail at gateway level
         error_occured = current_data["error_occured"]
         if error_occured:
@@ -136,18 +548,38 @@ class TransactionOrchestrationService:
         """
         Update transaction id, state and forward these update to the user email
         """
+        state = TransactionOrchestrationService.transaction_current_state(
+            transaction_id
+        )
+        TransactionOrchestrationService._save_and_mail_state(
+            merchant_id, transaction_id, state
+        )
 
+    @staticmethod
+    async def aupdate_and_mail_state(merchant_id, transaction_id):
+        """
+        Async counterpart of update_and_mail_state
+        """
+        state = await TransactionOrchestrationService.atransaction_current_state(
+            transaction_id
+        )
+        await sync_to_async(TransactionOrchestrationService._save_and_mail_state)(
+            merchant_id, transaction_id, state
+        )
+
+    @staticmethod
+    def _save_and_mail_state(merchant_id, transaction_id, state):
         from zoolflow.notifications.tasks import transaction_state_email_task
 
-        state = TransactionOrchestrationService.transaction_current_state(
-            transaction_id
+        applied = transition(
+            state,
+            fields={"transaction_id": transaction_id},
+            merchant_order_id=merchant_id,
         )
-        with db_transaction.atomic():
-            tx = retrieve_transaction_for_update(merchant_order_id=merchant_id)
-            tx.state = state
-            tx.transaction_id = transaction_id
-            tx.save(update_fields=["state", "transaction_id"])
-            logger.info(f"Transaction {tx.transaction_id} updated to {tx.state}.")
+        if not applied:
+            return False
+        logger.info(f"Transaction {transaction_id} updated to {state}.")
         db_transaction.on_commit(
             lambda: transaction_state_email_task.delay(transaction_id)
         )
+        return True
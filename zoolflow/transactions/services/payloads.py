@@ -1,51 +1,39 @@
 from django.conf import settings
-from zoolflow.customers.services.helpers import currency_and_address
 
 
-def order_payload(amount_cents, token, merchant_id, customer):
+def order_payload(amount_cents, token, merchant_id, billing):
     """
     Set payload for creating an order in provider
-    """
 
-    currency, _ = currency_and_address(customer)
+    ``billing`` is the transaction billing snapshot (see billing_snapshot)
+    """
     payload = {
         "auth_token": token,
         "delivery_needed": "false",
         "merchant_order_id": merchant_id,
         "amount_cents": amount_cents,
-        "currency": currency,
+        "currency": billing["currency"],
         "items": [],
     }
     return payload
 
 
-def payment_token_payload(amount_cents, token, order_id, customer):
+def payment_token_payload(amount_cents, token, order_id, billing):
     """
     Set payload for requesting the payment key token
     """
-
-    currency, address = currency_and_address(customer=customer)
     payload = {
         "auth_token": token,
         "amount_cents": amount_cents,
-        "currency": currency,
+        "currency": billing["currency"],
         "order_id": order_id,
         "billing_data": {
-            "apartment": address.apartment_number or "NA",
-            "email": customer.user.email or "Na",
-            "first_name": customer.first_name or "NA",
-            "last_name": customer.last_name or "un-known",
-            "street": address.line or "NA",
-            "building": address.building_number or "NA",
-            "phone_number": customer.phone_number or "NA",
-            "postal_code": address.postal_code or "NA",
-            "city": address.city or "NA",
-            "country": address.country.name or "NA",
-            "state": address.state or "NA",
+            **billing["billing_data"],
             "floor": "NA",
             "shipping_method": "PKG",
         },
         "integration_id": getattr(settings, "PAYMOB_PAYMENT_KEY"),
+        "expiration": getattr(settings, "PAYMOB_PAYMENT_KEY_EXPIRATION", 60 * 60),
     }
 
     return payload
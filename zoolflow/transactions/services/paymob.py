@@ -1,11 +1,15 @@
 import logging
+import httpx
 import requests
 import json
-import time
-from django.core.cache import cache
 from django.conf import settings
-from redis.exceptions import LockError
-from .http_client import get_session_with_retries
+from zoolflow.customers.services.helpers import billing_snapshot
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .http_client import get_session_with_retries, get_timeout
+from .rate_limit import LIVE, RateLimitedError, TokenBucketLimiter
+from .retry import Deadline, call_with_retries, retry_after
+from .single_flight import SingleFlight
+from .tokens import token_manager, TokenUnavailableError
 from .payloads import order_payload, payment_token_payload
 
 logger = logging.getLogger(__name__)
@@ -19,23 +23,136 @@ class ProviderServiceError(Exception):
         self.details = details
 
 
+class ProviderUnavailableError(ProviderServiceError):
+    # Raised without calling PayMob while its circuit breaker is open
+    def __init__(self, message, details=None, retry_after=None):
+        super().__init__(message, details)
+        self.retry_after = retry_after
+
+
+# transport errors and 5xx/429 answers, sync or async, count as failures
+paymob_breaker = CircuitBreaker(
+    "paymob", failures=(requests.RequestException, httpx.HTTPError)
+)
+# PAYMOB_RATE_LIMITS buckets shared by every worker
+paymob_limiter = TokenBucketLimiter("paymob")
+# concurrent state lookups of one transaction share a single request
+flags_flight = SingleFlight("paymob_flags")
+# rate limit bucket of each client operation
+RATE_LIMIT_BUCKETS = {
+    "authentication_token": "auth",
+    "order_ID": "order",
+    "payment_token": "payment_key",
+    "transaction_flags": "lookup",
+    "inquire_order": "lookup",
+}
+
+
+def raise_for_outage(response, bucket=None):
+    """
+    Raise the HTTP error of answers that mean PayMob itself is failing,
+    a 429 also pauses the rate limit ``bucket`` for every worker.
+    """
+    if response.status_code == 429 and bucket:
+        paymob_limiter.pause(bucket, retry_after(response) or 1)
+    if response.status_code >= 500 or response.status_code == 429:
+        response.raise_for_status()
+
+
+def ensure_provider_available():
+    """Fail fast with ProviderUnavailableError while PayMob's breaker is open"""
+    try:
+        paymob_breaker.ensure_closed()
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
+
+
+def provider_unavailable(error):
+    """ProviderUnavailableError for a CircuitOpenError"""
+    return ProviderUnavailableError(
+        "Payment provider is unavailable, try again later.",
+        details="Provider unavailable",
+        retry_after=error.retry_after,
+    )
+
+
+def provider_rate_limited(error):
+    """ProviderUnavailableError for a RateLimitedError"""
+    return ProviderUnavailableError(
+        "Payment provider is busy, try again later.",
+        details="Provider rate limited",
+        retry_after=error.retry_after,
+    )
+
+
 class PayMobClient:
     def __init__(self, *args, **kwargs):
         self.customer = kwargs.get("customer", None)
         self.amount_cents = kwargs.get("amount_cents", None)
-        self.session = get_session_with_retries()
+        # transaction billing snapshot, resolved from the customer when absent
+        self.billing = kwargs.get("billing", None)
+        # time budget shared by every call of this client, retries included,
+        # each call gets PAYMOB_CALL_DEADLINE seconds when absent
+        self.deadline = kwargs.get("deadline", None)
+        # BACKGROUND callers leave part of the rate limit to live checkouts
+        self.priority = kwargs.get("priority", LIVE)
+        self.session = get_session_with_retries("paymob")
 
-    def _request_field(self, payload, endpoint, requested_field, field_name):
+    def _billing(self):
+        if self.billing is None:
+            self.billing = billing_snapshot(self.customer.id)
+        return self.billing
+
+    def _deadline(self):
+        return self.deadline or Deadline(getattr(settings, "PAYMOB_CALL_DEADLINE", 10))
+
+    def _send(self, method, operation, idempotent, **kwargs):
+        """
+        Send one request, retried within the client deadline. Only
+        ``idempotent`` operations are retried after the request may have
+        reached PayMob. Every attempt takes a token of the operation's
+        rate limit bucket and goes through the circuit breaker.
+
+        Raises ProviderUnavailableError while the breaker is open or when
+        no token frees up in time.
+        """
+        deadline = self._deadline()
+        bucket = RATE_LIMIT_BUCKETS.get(operation)
+
+        def send():
+            if bucket:
+                paymob_limiter.acquire(bucket, self.priority, deadline)
+            with paymob_breaker.guard():
+                response = getattr(self.session, method)(
+                    timeout=deadline.timeout(get_timeout("paymob")), **kwargs
+                )
+                raise_for_outage(response, bucket)
+                return response
+
+        try:
+            return call_with_retries(send, f"paymob.{operation}", deadline, idempotent)
+        except CircuitOpenError as e:
+            logger.warning(f"PayMob call skipped: {e.message}")
+            raise provider_unavailable(e)
+        except RateLimitedError as e:
+            logger.warning(f"PayMob call skipped: {e.message}")
+            raise provider_rate_limited(e)
+
+    def _request_field(
+        self, payload, endpoint, requested_field, field_name, idempotent=True
+    ):
         """
         It's a POST request pattern.
 
         Return the requested field from the endpoint provided
         """
         try:
-            response = self.session.post(
+            response = self._send(
+                "post",
+                operation=field_name.replace(" ", "_"),
+                idempotent=idempotent,
                 url=endpoint,
                 json=payload,
-                timeout=getattr(settings, "CONNECTION_TIMEOUT", (5, 5)),
             )
             response.raise_for_status()
 
@@ -56,44 +173,31 @@ class PayMobClient:
             logger.error(f"Provider failed with error: {str(pe)}")
             raise ProviderServiceError("provider API fail", details=str(pe))
 
-    def _get_auth_token(self, retries):
+    def _fetch_auth_token(self):
         """
-        Return the authentication token to access the provider account using the API key
+        Request a new authentication token from the provider using the API key
         """
-        if retries < 1:
-            raise ProviderServiceError(
-                "redis is down or can't reach the provider, try again"
-            )
-        cache_key = getattr(settings, "PAYMOB_AUTH_CACH_KEY")
-        token = cache.get(cache_key)
-        if token:
-            logger.info("provider authentication token returned.")
-            return token
-        try:
-            # lock to prevent race condition with workers
-            with cache.lock(f"{cache_key}:lock", timeout=15, blocking_timeout=2):
-                # check if there a worker fetch the token yet
-                token = cache.get(cache_key)
-                if token:
-                    logger.info("provider authentication token returned.")
-                    return token
-                # request for the token
-                payload = {"api_key": getattr(settings, "PAYMOB_API_KEY")}
-                token = self._request_field(
-                    payload=payload,
-                    endpoint=getattr(settings, "AUTH_PAYMOB_TOKEN"),
-                    requested_field="token",
-                    field_name="authentication token",
-                )
+        payload = {"api_key": getattr(settings, "PAYMOB_API_KEY")}
+        return self._request_field(
+            payload=payload,
+            endpoint=getattr(settings, "AUTH_PAYMOB_TOKEN"),
+            requested_field="token",
+            field_name="authentication token",
+        )
 
-                timeout = getattr(settings, "CACHE_LIFETIME")
-                cache.set(cache_key, token, timeout=timeout)
-                return token
+    def _get_auth_token(self):
+        """
+        Return the authentication token to access the provider account.
 
-        except LockError:
-            time.sleep(0.5)
-            retries = retries - 1
-            return self._get_auth_token(retries)
+        The token manager keeps it warm in cache, so this only reaches the
+        provider when the cache is cold.
+        """
+        try:
+            token = token_manager.get_token(self._fetch_auth_token)
+        except TokenUnavailableError as e:
+            raise ProviderServiceError(e.message, details="Authentication token")
+        logger.info("provider authentication token returned.")
+        return token
 
     def create_order(self, merchant_id):
         """
@@ -103,12 +207,12 @@ class PayMobClient:
             ProviderServiceError if the API fails or returns no order ID.
         """
         try:
-            token = self._get_auth_token(retries=3)
+            token = self._get_auth_token()
             payload = order_payload(
                 self.amount_cents,
                 token,
                 merchant_id,
-                self.customer,
+                self._billing(),
             )
         except Exception as e:
             logger.error("failed on configure order payload")
@@ -119,6 +223,8 @@ class PayMobClient:
             endpoint=getattr(settings, "ORDER_PAYMOB_URL"),
             requested_field="id",
             field_name="order ID",
+            # a retried order could be a second order at PayMob
+            idempotent=False,
         )
         return order_id
 
@@ -127,12 +233,12 @@ class PayMobClient:
         Return the payment token specialized to who pay. Used to return an iframe
         """
         try:
-            token = self._get_auth_token(retries=3)
+            token = self._get_auth_token()
             payload = payment_token_payload(
                 self.amount_cents,
                 token,
                 order_id,
-                self.customer,
+                self._billing(),
             )
         except Exception as e:
             logger.error("failed on configure payment token payload")
@@ -143,6 +249,8 @@ class PayMobClient:
             endpoint=getattr(settings, "PAYMOB_PAYMENT_URL_KEY"),
             requested_field="token",
             field_name="payment token",
+            # a repeated key request only issues another key for the order
+            idempotent=True,
         )
 
         return payment_token
@@ -152,14 +260,31 @@ class PayMobClient:
         Return transaction status(flags) from paymob.
 
         By calling 'By Transacion ID' endpoint that take transaction id and Auth token
+
+        Callers looking the same transaction up meanwhile (webhook, reconciler,
+        status refresh) share one request, see ``flags_flight``.
         """
-        token = self._get_auth_token(retries=3)  # handle this with redis
+        return flags_flight.do(
+            str(transaction_id),
+            lambda: self._fetch_transaction_flags(transaction_id),
+        )
+
+    def _fetch_transaction_flags(self, transaction_id):
+        token = self._get_auth_token()
         header = {
             "Authorization": f"Bearer {token}",
         }
-        url = f"https://accept.paymob.com/api/acceptance/transactions/{transaction_id}"
+        url = getattr(settings, "PAYMOB_TRANSACTION_URL").format(
+            transaction_id=transaction_id
+        )
         try:
-            response = self.session.get(url=url, headers=header)
+            response = self._send(
+                "get",
+                operation="transaction_flags",
+                idempotent=True,
+                url=url,
+                headers=header,
+            )
             response.raise_for_status()
         except requests.RequestException as e:
             logger.error("Provider fail to return transaction current state")
@@ -168,3 +293,30 @@ class PayMobClient:
             )
         data = json.loads(response.content)
         return data
+
+    def inquire_order_transaction(self, order_id):
+        """
+        Return the latest transaction (flags) of a provider order,
+        or None when nothing was paid on that order yet.
+
+        Used for transactions that never received a webhook, so their
+        transaction id is unknown.
+        """
+        token = self._get_auth_token()
+        try:
+            response = self._send(
+                "post",
+                operation="inquire_order",
+                # read only despite the POST
+                idempotent=True,
+                url=getattr(settings, "PAYMOB_INQUIRY_URL"),
+                json={"auth_token": token, "order_id": order_id},
+            )
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Provider fail to inquire order {order_id}")
+            raise ProviderServiceError("Provider fail to inquire order", str(e))
+        return data if data.get("id") else None
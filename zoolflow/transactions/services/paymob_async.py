@@ -0,0 +1,213 @@
+import logging
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from zoolflow.customers.services.helpers import billing_snapshot
+from .circuit_breaker import CircuitOpenError
+from .http_client import get_async_client, get_timeout
+from .paymob import (
+    RATE_LIMIT_BUCKETS,
+    PayMobClient,
+    ProviderServiceError,
+    provider_rate_limited,
+    provider_unavailable,
+    flags_flight,
+    paymob_breaker,
+    paymob_limiter,
+    raise_for_outage,
+)
+from .rate_limit import LIVE, RateLimitedError
+from .payloads import order_payload, payment_token_payload
+from .retry import Deadline, DeadlineExceeded, acall_with_retries
+from .tokens import token_manager, TokenUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPayMobClient:
+    """
+    Asyncio counterpart of PayMobClient for ASGI deployments.
+
+    Same methods and ProviderServiceError semantics, requests go through the
+    keep-alive ``httpx.AsyncClient`` of the running event loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.customer = kwargs.get("customer", None)
+        self.amount_cents = kwargs.get("amount_cents", None)
+        self.billing = kwargs.get("billing", None)
+        self.deadline = kwargs.get("deadline", None)
+        self.priority = kwargs.get("priority", LIVE)
+        self.client = get_async_client("paymob")
+
+    async def _billing(self):
+        if self.billing is None:
+            self.billing = await sync_to_async(billing_snapshot)(self.customer.id)
+        return self.billing
+
+    async def _send(self, method, operation, idempotent, **kwargs):
+        """
+        Async counterpart of PayMobClient._send, same retries, rate limits
+        and circuit breaker
+        """
+        deadline = self.deadline or Deadline(
+            getattr(settings, "PAYMOB_CALL_DEADLINE", 10)
+        )
+        pool = self.client.timeout.pool
+        bucket = RATE_LIMIT_BUCKETS.get(operation)
+
+        async def send():
+            if bucket:
+                await paymob_limiter.aacquire(bucket, self.priority, deadline)
+            connect, read = deadline.timeout(get_timeout("paymob"))
+            timeout = httpx.Timeout(connect=connect, read=read, write=read, pool=pool)
+            async with paymob_breaker.aguard():
+                response = await getattr(self.client, method)(timeout=timeout, **kwargs)
+                raise_for_outage(response, bucket)
+                return response
+
+        try:
+            return await acall_with_retries(
+                send, f"paymob.{operation}", deadline, idempotent
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"PayMob call skipped: {e.message}")
+            raise provider_unavailable(e)
+        except RateLimitedError as e:
+            logger.warning(f"PayMob call skipped: {e.message}")
+            raise provider_rate_limited(e)
+
+    async def _request_field(
+        self, payload, endpoint, requested_field, field_name, idempotent=True
+    ):
+        """
+        It's a POST request pattern.
+
+        Return the requested field from the endpoint provided
+        """
+        try:
+            response = await self._send(
+                "post",
+                operation=field_name.replace(" ", "_"),
+                idempotent=idempotent,
+                url=endpoint,
+                json=payload,
+            )
+            response.raise_for_status()
+
+            data = response.json()
+            result = data.get(requested_field)
+
+            if not result:
+                logger.error(f"No {field_name} returned from provider.")
+                raise ProviderServiceError(
+                    f"The API did not return the {field_name}.",
+                    f"{field_name.capitalize()}",
+                )
+
+            logger.info(f"{field_name} has been successfully returned.")
+            return result
+
+        except (httpx.HTTPError, DeadlineExceeded, ValueError) as pe:
+            logger.error(f"Provider failed with error: {str(pe)}")
+            raise ProviderServiceError("provider API fail", details=str(pe))
+
+    async def _get_auth_token(self):
+        """
+        Return the authentication token to access the provider account.
+
+        Warm tokens come from the shared token manager. A cold cache is
+        filled off the event loop so the single-flight lock is honoured.
+        """
+        try:
+            token = await sync_to_async(token_manager.get_token, thread_sensitive=False)(
+                PayMobClient()._fetch_auth_token
+            )
+        except TokenUnavailableError as e:
+            raise ProviderServiceError(e.message, details="Authentication token")
+        logger.info("provider authentication token returned.")
+        return token
+
+    async def create_order(self, merchant_id):
+        """
+        Return order ID from provider.
+
+        Raises:
+            ProviderServiceError if the API fails or returns no order ID.
+        """
+        try:
+            token = await self._get_auth_token()
+            payload = order_payload(
+                self.amount_cents,
+                token,
+                merchant_id,
+                await self._billing(),
+            )
+        except Exception as e:
+            logger.error("failed on configure order payload")
+            raise ProviderServiceError("Failed to handle order payload", str(e))
+
+        return await self._request_field(
+            payload=payload,
+            endpoint=getattr(settings, "ORDER_PAYMOB_URL"),
+            requested_field="id",
+            field_name="order ID",
+            idempotent=False,
+        )
+
+    async def payment_key_token(self, order_id):
+        """
+        Return the payment token specialized to who pay. Used to return an iframe
+        """
+        try:
+            token = await self._get_auth_token()
+            payload = payment_token_payload(
+                self.amount_cents,
+                token,
+                order_id,
+                await self._billing(),
+            )
+        except Exception as e:
+            logger.error("failed on configure payment token payload")
+            raise ProviderServiceError("Failed to handle payment token payload", str(e))
+
+        return await self._request_field(
+            payload=payload,
+            endpoint=getattr(settings, "PAYMOB_PAYMENT_URL_KEY"),
+            requested_field="token",
+            field_name="payment token",
+        )
+
+    async def get_transaction_flags(self, transaction_id):
+        """
+        Return transaction status(flags) from paymob, shared with concurrent
+        lookups of the same transaction like PayMobClient's.
+        """
+        return await flags_flight.ado(
+            str(transaction_id),
+            lambda: self._fetch_transaction_flags(transaction_id),
+        )
+
+    async def _fetch_transaction_flags(self, transaction_id):
+        token = await self._get_auth_token()
+        header = {
+            "Authorization": f"Bearer {token}",
+        }
+        url = getattr(settings, "PAYMOB_TRANSACTION_URL").format(
+            transaction_id=transaction_id
+        )
+        try:
+            response = await self._send(
+                "get",
+                operation="transaction_flags",
+                idempotent=True,
+                url=url,
+                headers=header,
+            )
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, DeadlineExceeded, ValueError) as e:
+            logger.error("Provider fail to return transaction current state")
+            raise ProviderServiceError(
+                "Provider fail to return transaction current state", str(e)
+            )
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import math
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# live checkouts may empty a bucket, background jobs (reconciler, bulk)
+# leave a reserve for them
+LIVE = "live"
+BACKGROUND = "background"
+
+# Refill the bucket for the time elapsed since the last call and take one
+# token. Background callers only take a token above ``reserve``. Return the
+# seconds to wait before asking again ("0" when granted), as a string since
+# redis truncates lua numbers. The clock is redis TIME, the same for every
+# worker.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts", "blocked_until")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local blocked_until = tonumber(state[3]) or 0
+if blocked_until > now then
+    return tostring(blocked_until - now)
+end
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (reserve + 1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+# Hold every caller of the bucket off for ARGV[1] seconds (a 429 answer)
+PAUSE_SCRIPT = """
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local until_ = now + tonumber(ARGV[1])
+local current = tonumber(redis.call("HGET", KEYS[1], "blocked_until")) or 0
+if until_ > current then
+    redis.call("HSET", KEYS[1], "blocked_until", until_)
+end
+redis.call("EXPIRE", KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+return 1
+"""
+
+
+class RateLimitedError(Exception):
+    # Raised when no token frees up within the caller's wait budget,
+    # ``retry_after`` is the number of seconds before one should
+    def __init__(self, message, details=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """
+    Token buckets kept in redis and shared by every process, one per
+    endpoint class of ``name`` (``PAYMOB_RATE_LIMITS`` for "paymob").
+
+    Each bucket refills at RATE tokens per second up to BURST, refill and
+    take happen in one lua script so concurrent workers never overdraw it.
+    BACKGROUND callers only take tokens while more than
+    ``BACKGROUND_RESERVE * BURST`` are left. A caller waits for its token at
+    most MAX_WAIT seconds and never past its deadline.
+
+    Buckets missing from the settings are not limited. Redis errors never
+    block a call, the limiter just stops limiting.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.prefix = f"ratelimit:{name}"
+
+    @property
+    def settings_name(self):
+        return f"{self.name.upper()}_RATE_LIMITS"
+
+    @property
+    def redis(self):
+        return get_redis_connection("default")
+
+    def _key(self, bucket):
+        return f"{self.prefix}:{bucket}"
+
+    def _config(self, bucket):
+        config = getattr(settings, self.settings_name, {}).get(bucket)
+        if not config:
+            return None
+        return {"BACKGROUND_RESERVE": 0.5, "MAX_WAIT": 2, **config}
+
+    def _take(self, bucket, config, priority):
+        reserve = 0
+        if priority == BACKGROUND:
+            reserve = config["BURST"] * config["BACKGROUND_RESERVE"]
+        wait = self.redis.eval(
+            TOKEN_BUCKET_SCRIPT,
+            1,
+            self._key(bucket),
+            config["RATE"],
+            config["BURST"],
+            reserve,
+        )
+        return float(wait)
+
+    def _next_wait(self, bucket, config, priority, started, deadline):
+        """Seconds to sleep before asking again, 0 once the token is taken"""
+        try:
+            wait = self._take(bucket, config, priority)
+        except RedisError as e:
+            logger.warning(f"rate limit {self.name}.{bucket} unavailable: {e}")
+            return 0
+        if not wait:
+            return 0
+        budget = config["MAX_WAIT"] - (time.monotonic() - started)
+        if deadline is not None:
+            budget = min(budget, deadline.remaining())
+        if wait > budget:
+            raise RateLimitedError(
+                f"{self.name} {bucket} rate limit reached, retry later.",
+                details=priority,
+                retry_after=max(math.ceil(wait), 1),
+            )
+        return wait
+
+    def acquire(self, bucket, priority=LIVE, deadline=None):
+        """
+        Take one token of ``bucket``, waiting for it within MAX_WAIT and the
+        ``deadline``. Raises RateLimitedError when it won't come in time.
+        """
+        config = self._config(bucket)
+        if config is None:
+            return
+        started = time.monotonic()
+        while True:
+            wait = self._next_wait(bucket, config, priority, started, deadline)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, bucket, priority=LIVE, deadline=None):
+        """Async counterpart of acquire, redis is used off the event loop"""
+        config = self._config(bucket)
+        if config is None:
+            return
+        next_wait = sync_to_async(self._next_wait, thread_sensitive=False)
+        started = time.monotonic()
+        while True:
+            wait = await next_wait(bucket, config, priority, started, deadline)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, bucket, seconds):
+        """Hold every caller of ``bucket`` off, e.g. for a 429 Retry-After"""
+        if self._config(bucket) is None or not seconds:
+            return
+        try:
+            self.redis.eval(PAUSE_SCRIPT, 1, self._key(bucket), seconds)
+        except RedisError as e:
+            logger.warning(f"rate limit {self.name}.{bucket} unavailable: {e}")
+        logger.warning(f"rate limit {self.name}.{bucket} paused for {seconds}s.")
+
+    def reset(self):
+        buckets = getattr(settings, self.settings_name, {})
+        if buckets:
+            self.redis.delete(*[self._key(bucket) for bucket in buckets])
+
+    def snapshot(self):
+        """Tokens left and config per bucket, for monitoring"""
+        snapshot = {}
+        for bucket in getattr(settings, self.settings_name, {}):
+            try:
+                tokens, blocked_until = self.redis.hmget(
+                    self._key(bucket), "tokens", "blocked_until"
+                )
+            except RedisError as e:
+                snapshot[bucket] = {"error": str(e)}
+                continue
+            config = self._config(bucket)
+            snapshot[bucket] = {
+                # untouched buckets are full
+                "tokens": float(tokens) if tokens else float(config["BURST"]),
+                "blocked_until": float(blocked_until) if blocked_until else None,
+                "config": config,
+            }
+        return snapshot
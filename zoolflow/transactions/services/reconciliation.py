@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from redis.exceptions import LockError
+from .orchestration import (
+    TransactionOrchestrationService,
+    TransactionOrchestrationServiceError,
+)
+from .paymob import PayMobClient, ProviderServiceError
+from .rate_limit import BACKGROUND
+from .state_machine import transition_many
+from ..models import Transaction
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_LOCK_KEY = "paymob:reconcile:lock"
+RECONCILE_CURSOR_KEY = "paymob:reconcile:cursor"
+STUCK_STATES = (
+    Transaction.TransactionState.INITIATED,
+    Transaction.TransactionState.PENDING,
+)
+# returned for rows left for the next run once the time budget is spent
+_OUT_OF_BUDGET = object()
+# returned for INITIATED rows whose provider steps are resumed
+_RESUME = object()
+
+
+class RateLimiter:
+    """
+    Space provider calls ``1 / rate`` seconds apart across worker threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, deadline=None):
+        """Sleep until the next free slot, False if it falls after deadline"""
+        with self._lock:
+            slot = max(self._next, time.monotonic())
+            if deadline is not None and slot >= deadline:
+                return False
+            self._next = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+
+def reconcile_stuck_transactions(
+    stuck_after=None,
+    chunk_size=None,
+    concurrency=None,
+    rate=None,
+    time_budget=None,
+):
+    """
+    Revisit INITIATED/PENDING transactions that never received a webhook.
+
+    Rows older than ``stuck_after`` seconds are scanned in id keyset chunks,
+    looked up at PayMob by a bounded thread pool under a shared rate limit,
+    and written back with one conditional update per chunk. A run stops when its
+    time budget is spent and the next run resumes from the stored cursor.
+
+    Return a report dict, None when another run holds the lock.
+    """
+    stuck_after = stuck_after or getattr(settings, "RECONCILE_STUCK_AFTER", 60 * 30)
+    chunk_size = chunk_size or getattr(settings, "RECONCILE_CHUNK_SIZE", 200)
+    concurrency = concurrency or getattr(settings, "RECONCILE_CONCURRENCY", 8)
+    rate = rate or getattr(settings, "RECONCILE_RATE_LIMIT", 10)
+    time_budget = time_budget or getattr(settings, "RECONCILE_TIME_BUDGET", 60 * 4)
+
+    lock = cache.lock(RECONCILE_LOCK_KEY, timeout=time_budget + 60, blocking=False)
+    if not lock.acquire():
+        logger.info("reconciliation already running.")
+        return None
+
+    deadline = time.monotonic() + time_budget
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=stuck_after)
+    abandon_cutoff = now - timedelta(
+        seconds=getattr(settings, "RECONCILE_ABANDON_AFTER", 60 * 60 * 24)
+    )
+    resume_cutoff = now - timedelta(
+        seconds=getattr(settings, "RECONCILE_RESUME_WINDOW", 60 * 45)
+    )
+    limiter = RateLimiter(rate)
+    report = {"scanned": 0, "updated": 0, "errors": 0, "finished": False}
+    last_id = cache.get(RECONCILE_CURSOR_KEY) or 0
+
+    def resolve(tx):
+        return _resolve(tx, limiter, deadline, abandon_cutoff, resume_cutoff)
+
+    try:
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="paymob-reconcile"
+        ) as executor:
+            while time.monotonic() < deadline:
+                chunk = list(
+                    Transaction.objects.filter(
+                        state__in=STUCK_STATES, created_at__lt=cutoff, id__gt=last_id
+                    ).order_by("id")[:chunk_size]
+                )
+                if not chunk:
+                    report["finished"] = True
+                    last_id = 0
+                    break
+
+                results = [
+                    _resume(tx, limiter, deadline) if result is _RESUME else result
+                    for tx, result in zip(chunk, executor.map(resolve, chunk))
+                ]
+                skipped = [
+                    tx.id
+                    for tx, result in zip(chunk, results)
+                    if result is _OUT_OF_BUDGET
+                ]
+                resolved = [
+                    (tx, result)
+                    for tx, result in zip(chunk, results)
+                    if result is not _OUT_OF_BUDGET
+                ]
+                report["scanned"] += len(resolved)
+                report["errors"] += sum(1 for _, result in resolved if result is None)
+                report["updated"] += _apply(resolved)
+
+                last_id = min(skipped) - 1 if skipped else chunk[-1].id
+                if skipped:
+                    break
+    finally:
+        cache.set(RECONCILE_CURSOR_KEY, last_id, timeout=None)
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("reconciliation lock expired before release.")
+
+    logger.info(f"Reconciliation report: {report}")
+    return report
+
+
+def _resolve(tx, limiter, deadline, abandon_cutoff, resume_cutoff):
+    """
+    Return ``(state, transaction_id)`` of a stuck transaction, None when
+    the provider lookup failed.
+
+    INITIATED rows younger than ``resume_cutoff`` are left to _resume,
+    older ones are failed.
+    """
+    if tx.state == Transaction.TransactionState.INITIATED:
+        if tx.created_at < resume_cutoff:
+            # provider steps never completed, nothing to pay on
+            return Transaction.TransactionState.FAILED, tx.transaction_id
+        return _RESUME
+
+    if not tx.transaction_id and not tx.order_id:
+        return Transaction.TransactionState.FAILED, None
+
+    if not limiter.wait(deadline):
+        return _OUT_OF_BUDGET
+    try:
+        if tx.transaction_id:
+            state = TransactionOrchestrationService.transaction_current_state(
+                tx.transaction_id, priority=BACKGROUND
+            )
+            return state, tx.transaction_id
+
+        data = PayMobClient(priority=BACKGROUND).inquire_order_transaction(
+            tx.order_id
+        )
+    except ProviderServiceError as e:
+        logger.warning(f"Reconcile {tx.merchant_order_id} failed: {e.message}")
+        return None
+
+    if data:
+        state = TransactionOrchestrationService.state_from_flags(data)
+        return state, str(data["id"])
+    if tx.created_at < abandon_cutoff:
+        # payment key expired long ago without any payment
+        return Transaction.TransactionState.FAILED, None
+    return tx.state, None
+
+
+def _resume(tx, limiter, deadline):
+    """
+    Resume the provider steps from the stored checkpoint, on the scanning
+    thread so pool threads never write to the database.
+    """
+    if not limiter.wait(deadline):
+        return _OUT_OF_BUDGET
+    try:
+        TransactionOrchestrationService.process_provider_steps(tx.id)
+    except (TransactionOrchestrationServiceError, ProviderServiceError) as e:
+        logger.warning(f"Resume {tx.merchant_order_id} failed: {e.message}")
+        return None
+    # process_provider_steps already moved the row
+    return tx.state, None
+
+
+def _apply(resolved):
+    """
+    Write the changed rows in one conditional update, rows moved meanwhile
+    by a webhook are left alone. Return the number of updated transactions.
+    """
+    from zoolflow.notifications.tasks import transaction_state_email_task
+
+    changes = []
+    for tx, result in resolved:
+        if result is None:
+            continue
+        state, transaction_id = result
+        if state != tx.state:
+            fields = {"transaction_id": transaction_id} if transaction_id else {}
+            changes.append((tx, state, fields))
+    if not changes:
+        return 0
+
+    with db_transaction.atomic():
+        updated = transition_many(changes)
+        for tx in updated:
+            logger.info(f"Transaction {tx.merchant_order_id} reconciled to {tx.state}.")
+            if tx.transaction_id:
+                db_transaction.on_commit(
+                    lambda transaction_id=tx.transaction_id: transaction_state_email_task.delay(
+                        transaction_id
+                    )
+                )
+    return len(updated)
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+import requests
+from django.conf import settings
+from django.utils import timezone
+from urllib3.exceptions import EmptyPoolError, NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(requests.Timeout):
+    # Raised when the operation budget can't fit another attempt, a
+    # requests.Timeout so provider error handling stays the same
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class Deadline:
+    """
+    Time budget of one provider operation (e.g. a whole checkout), shared by
+    every request and retry made for it.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, timeout):
+        """``(connect, read)`` timeout capped by the time left"""
+        remaining = self.remaining()
+        connect, read = timeout
+        return min(connect, remaining), min(read, remaining)
+
+
+class RetryPolicy:
+    """
+    How often and how long to retry, from the PROVIDER_RETRY_* settings.
+
+    Backoff is "full jitter": a random wait between 0 and
+    ``min(backoff_cap, backoff * 2 ** retry)``. No attempt starts with less
+    than ``min_attempt`` seconds left on the deadline.
+    """
+
+    def __init__(
+        self, attempts=None, backoff=None, backoff_cap=None, min_attempt=None
+    ):
+        self.attempts = attempts or getattr(settings, "PROVIDER_RETRY_ATTEMPTS", 3)
+        self.backoff = backoff or getattr(settings, "PROVIDER_RETRY_BACKOFF", 0.2)
+        self.backoff_cap = backoff_cap or getattr(
+            settings, "PROVIDER_RETRY_BACKOFF_CAP", 2.0
+        )
+        self.min_attempt = min_attempt or getattr(
+            settings, "PROVIDER_RETRY_MIN_ATTEMPT", 0.5
+        )
+
+    def wait(self, retry):
+        return random.uniform(0, min(self.backoff_cap, self.backoff * 2**retry))
+
+
+class RetryStats:
+    """Process-wide attempt, retry and time counters per operation"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, operation, attempts, failed):
+        with self._lock:
+            stats = self._operations.setdefault(
+                operation,
+                {"calls": 0, "attempts": 0, "retries": 0, "failed": 0, "time": 0.0},
+            )
+            stats["calls"] += 1
+            stats["attempts"] += len(attempts)
+            stats["retries"] += max(len(attempts) - 1, 0)
+            stats["failed"] += int(failed)
+            stats["time"] += sum(attempt["elapsed"] for attempt in attempts)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                operation: {**stats, "time": round(stats["time"], 4)}
+                for operation, stats in self._operations.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+
+
+retry_stats = RetryStats()
+
+
+def retry_after(response):
+    """Seconds asked by a ``Retry-After`` header, None when absent or invalid"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return max(seconds, 0.0)
+
+
+def never_sent(error):
+    """True when the request surely never reached the provider"""
+    connect_errors = (requests.ConnectTimeout, httpx.ConnectError, httpx.PoolTimeout)
+    if isinstance(error, connect_errors):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)
+    return isinstance(reason, (NewConnectionError, EmptyPoolError))
+
+
+def should_retry(response, error, idempotent):
+    """
+    Idempotent steps retry any transport error and 429/5xx answer. Other
+    steps only retry what the provider surely didn't process: connection
+    failures before sending and 429 (rejected by rate limiting).
+    """
+    if response is None:
+        return never_sent(error) or idempotent
+    if response.status_code == 429:
+        return True
+    return idempotent and response.status_code in RETRY_STATUSES
+
+
+class _Attempts:
+    """Bookkeeping of one call_with_retries run"""
+
+    def __init__(self, operation, deadline, idempotent, policy):
+        self.operation = operation
+        self.deadline = deadline
+        self.idempotent = idempotent
+        self.policy = policy or RetryPolicy()
+        self.attempts = []
+
+    def check_budget(self):
+        if self.deadline.remaining() < self.policy.min_attempt:
+            raise DeadlineExceeded(
+                f"{self.operation}: no time left for another attempt.",
+                details=self.attempts,
+            )
+
+    def record(self, started, response, error):
+        self.attempts.append(
+            {
+                "attempt": len(self.attempts) + 1,
+                "status": response.status_code if response is not None else None,
+                "error": type(error).__name__ if error is not None else None,
+                "elapsed": round(time.monotonic() - started, 4),
+            }
+        )
+
+    def next_wait(self, response, error):
+        """Seconds to wait before the next attempt, None to stop"""
+        if len(self.attempts) >= self.policy.attempts:
+            return None
+        if not should_retry(response, error, self.idempotent):
+            return None
+        wait = retry_after(response)
+        if wait is None:
+            wait = self.policy.wait(len(self.attempts) - 1)
+        if wait + self.policy.min_attempt > self.deadline.remaining():
+            logger.warning(f"{self.operation}: deadline too close to retry.")
+            return None
+        return wait
+
+    def finish(self, response, error):
+        failed = error is not None or response.status_code >= 500
+        retry_stats.record(self.operation, self.attempts, failed)
+        if len(self.attempts) > 1:
+            logger.info(
+                f"{self.operation} took {len(self.attempts)} attempts: {self.attempts}"
+            )
+        if error is not None:
+            raise error
+        return response
+
+
+def call_with_retries(send, operation, deadline, idempotent, policy=None):
+    """
+    Call ``send()`` until it succeeds, can't be retried or the ``deadline``
+    leaves no room for another attempt.
+
+    ``send`` caps its timeouts with ``deadline.timeout()``. Waits honour ``Retry-After``, otherwise jittered
+    backoff. Return the last response (even a retryable 5xx), raise the
+    last transport error or DeadlineExceeded.
+    """
+    run = _Attempts(operation, deadline, idempotent, policy)
+    while True:
+        run.check_budget()
+        started, response, error = time.monotonic(), None, None
+        try:
+            response = send()
+        except (requests.RequestException, httpx.HTTPError) as e:
+            # raise_for_status errors still carry the answer
+            response, error = getattr(e, "response", None), e
+        run.record(started, response, error)
+        wait = run.next_wait(response, error)
+        if wait is None:
+            return run.finish(response, error)
+        time.sleep(wait)
+
+
+async def acall_with_retries(send, operation, deadline, idempotent, policy=None):
+    """Async counterpart of call_with_retries, ``send`` is a coroutine function"""
+    run = _Attempts(operation, deadline, idempotent, policy)
+    while True:
+        run.check_budget()
+        started, response, error = time.monotonic(), None, None
+        try:
+            response = await send()
+        except (requests.RequestException, httpx.HTTPError) as e:
+            # raise_for_status errors still carry the answer
+            response, error = getattr(e, "response", None), e
+        run.record(started, response, error)
+        wait = run.next_wait(response, error)
+        if wait is None:
+            return run.finish(response, error)
+        await asyncio.sleep(wait)
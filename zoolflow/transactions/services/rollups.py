@@ -0,0 +1,251 @@
+import logging
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction as db_transaction
+from django.db.models import CharField, Count, Sum, Value
+from django.db.models.fields.json import KT
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from redis.exceptions import LockError
+from ..models import (
+    ArchivedTransaction,
+    CustomerTransactionRollup,
+    DailyTransactionRollup,
+    Transaction,
+    TransactionRollupDelta,
+)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_LOCK_KEY = "transactions:rollup:lock"
+
+
+class RollupBusyError(Exception):
+    # Raised when a rebuild can't get the rollup lock in time
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+def record_deltas(changes):
+    """
+    Append ``(transaction, from_state, to_state)`` changes to the rollup
+    outbox, inside the caller's DB transaction. ``from_state`` is None for
+    new transactions.
+    """
+    deltas = [
+        TransactionRollupDelta(
+            day=timezone.localdate(tx.created_at),
+            currency=(tx.billing_snapshot or {}).get("currency", ""),
+            customer_id=tx.customer_id,
+            from_state=from_state,
+            to_state=to_state,
+            amount=tx.amount,
+        )
+        for tx, from_state, to_state in changes
+        if from_state != to_state
+    ]
+    if deltas:
+        TransactionRollupDelta.objects.bulk_create(deltas)
+
+
+def fold_rollup_deltas(batch_size=None):
+    """
+    Fold outbox rows into the rollup tables, one batch per DB transaction.
+
+    Deltas are summed per rollup key in memory, so a batch costs a few
+    queries per table however many transitions it holds. Return the number
+    of folded rows, None when another fold or rebuild holds the lock.
+    """
+    batch_size = batch_size or getattr(settings, "ROLLUP_FOLD_BATCH_SIZE", 5000)
+    lock = cache.lock(ROLLUP_LOCK_KEY, timeout=60 * 5, blocking=False)
+    if not lock.acquire():
+        logger.info("rollup fold already running.")
+        return None
+
+    folded = 0
+    try:
+        while True:
+            with db_transaction.atomic():
+                batch = list(
+                    TransactionRollupDelta.objects.values_list(
+                        "id",
+                        "day",
+                        "currency",
+                        "customer_id",
+                        "from_state",
+                        "to_state",
+                        "amount",
+                    )[:batch_size]
+                )
+                if not batch:
+                    break
+                daily, customers = {}, {}
+                for _, day, currency, customer_id, from_state, to_state, amount in batch:
+                    for state, sign in ((from_state, -1), (to_state, 1)):
+                        if state is None:
+                            continue
+                        _add(daily, (day, state, currency), sign, amount)
+                        _add(customers, (customer_id, state, currency), sign, amount)
+                _merge(DailyTransactionRollup, "day", daily)
+                _merge(CustomerTransactionRollup, "customer_id", customers)
+                # ids, not a range: a lower id may still be uncommitted
+                TransactionRollupDelta.objects.filter(
+                    id__in=[row[0] for row in batch]
+                ).delete()
+            folded += len(batch)
+            if len(batch) < batch_size:
+                break
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("rollup lock expired before release.")
+    return folded
+
+
+def _add(totals, key, sign, amount):
+    count, volume = totals.get(key, (0, Decimal(0)))
+    totals[key] = (count + sign, volume + sign * amount)
+
+
+def _sum(totals, key, count, amount):
+    total_count, total_amount = totals.get(key, (0, Decimal(0)))
+    totals[key] = (total_count + count, total_amount + amount)
+
+
+def _merge(model, lead, totals):
+    """
+    Add ``{(lead, state, currency): (count, amount)}`` to ``model`` with one
+    read, one bulk_update and one bulk_create.
+    """
+    totals = {key: value for key, value in totals.items() if value != (0, 0)}
+    if not totals:
+        return
+    existing = {
+        (getattr(row, lead), row.state, row.currency): row
+        for row in model.objects.filter(**{f"{lead}__in": {key[0] for key in totals}})
+    }
+    created, updated = [], []
+    for key, (count, amount) in totals.items():
+        row = existing.get(key)
+        if row is None:
+            created.append(
+                model(
+                    **{lead: key[0]},
+                    state=key[1],
+                    currency=key[2],
+                    count=count,
+                    amount=amount,
+                )
+            )
+        else:
+            row.count += count
+            row.amount += amount
+            updated.append(row)
+    model.objects.bulk_update(updated, ["count", "amount"])
+    model.objects.bulk_create(created)
+
+
+@contextmanager
+def _transaction_writes_paused():
+    """
+    DB transaction in which transaction writes (and the deltas they append)
+    wait: SHARE lock on PostgreSQL, LOCK TABLES on MySQL, released after the
+    commit. SQLite lets one writer at a time, the rebuild writes first.
+    """
+    vendor = connection.vendor
+    try:
+        with db_transaction.atomic():
+            with connection.cursor() as cursor:
+                if vendor == "postgresql":
+                    cursor.execute(
+                        f"LOCK TABLE {Transaction._meta.db_table} IN SHARE MODE"
+                    )
+                elif vendor == "mysql":
+                    # every table the rebuild touches must be listed
+                    read = (Transaction, ArchivedTransaction)
+                    write = (
+                        TransactionRollupDelta,
+                        DailyTransactionRollup,
+                        CustomerTransactionRollup,
+                    )
+                    tables = [f"{model._meta.db_table} READ" for model in read]
+                    tables += [f"{model._meta.db_table} WRITE" for model in write]
+                    cursor.execute(f"LOCK TABLES {', '.join(tables)}")
+            yield
+    finally:
+        if vendor == "mysql":
+            with connection.cursor() as cursor:
+                cursor.execute("UNLOCK TABLES")
+
+
+def rebuild_rollups():
+    """
+    Recompute both rollup tables from the live and archived transactions and
+    drop the outbox (the scan already includes it).
+
+    Transaction writes wait for the rebuild so no transition is counted
+    twice or dropped with the outbox. Return the number of daily and
+    customer rollup rows.
+    """
+    lock = cache.lock(ROLLUP_LOCK_KEY, timeout=60 * 30, blocking_timeout=60)
+    if not lock.acquire():
+        raise RollupBusyError("rollup fold still running, try again")
+    try:
+        with _transaction_writes_paused():
+            TransactionRollupDelta.objects.all().delete()
+            DailyTransactionRollup.objects.all().delete()
+            CustomerTransactionRollup.objects.all().delete()
+
+            daily_totals, customer_totals = {}, {}
+            # archived transactions keep counting in the rollups
+            for model in (Transaction, ArchivedTransaction):
+                rows = model.objects.annotate(
+                    rollup_currency=Coalesce(
+                        KT("billing_snapshot__currency"),
+                        Value(""),
+                        output_field=CharField(),
+                    )
+                ).order_by()
+                for row in (
+                    rows.annotate(day=TruncDate("created_at"))
+                    .values("day", "state", "rollup_currency")
+                    .annotate(total=Count("id"), volume=Sum("amount"))
+                ):
+                    key = (row["day"], row["state"], row["rollup_currency"])
+                    _sum(daily_totals, key, row["total"], row["volume"])
+                for row in rows.values("customer_id", "state", "rollup_currency").annotate(
+                    total=Count("id"), volume=Sum("amount")
+                ):
+                    key = (row["customer_id"], row["state"], row["rollup_currency"])
+                    _sum(customer_totals, key, row["total"], row["volume"])
+
+            daily = [
+                DailyTransactionRollup(
+                    day=day, state=state, currency=currency, count=count, amount=amount
+                )
+                for (day, state, currency), (count, amount) in daily_totals.items()
+            ]
+            customers = [
+                CustomerTransactionRollup(
+                    customer_id=customer_id,
+                    state=state,
+                    currency=currency,
+                    count=count,
+                    amount=amount,
+                )
+                for (customer_id, state, currency), (count, amount) in customer_totals.items()
+            ]
+            DailyTransactionRollup.objects.bulk_create(daily, batch_size=1000)
+            CustomerTransactionRollup.objects.bulk_create(customers, batch_size=1000)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            logger.warning("rollup lock expired before release.")
+    logger.info(f"Rollups rebuilt: {len(daily)} daily, {len(customers)} customer rows.")
+    return len(daily), len(customers)
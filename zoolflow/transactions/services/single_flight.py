@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import LockError, RedisError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SINGLE_FLIGHT = {
+    "RESULT_TTL": 1,  # seconds a result is shared with later callers
+    "LEASE": 11,  # upper bound of one upstream call, lease and wait timeout
+    "POLL_INTERVAL": 0.05,  # how often other processes look for the result
+}
+
+_MISSING = object()
+# cache calls raise ConnectionInterrupted, lock calls RedisError
+REDIS_ERRORS = (RedisError, ConnectionInterrupted)
+
+
+class _Flight:
+    """In-process waiters share the result of a single running call."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls made for the same key into one upstream call.
+
+    Threads of a process wait on the running call (asyncio tasks on a
+    future of their loop). Across processes the caller holding a short
+    redis lease makes the call and stores its result for RESULT_TTL
+    seconds, other processes poll for that result until the lease is gone.
+    Errors are only shared in-process, a failed lease holder lets the
+    next caller try.
+
+    Redis errors or a lease holder slower than LEASE make callers call
+    upstream themselves, coalescing never blocks a lookup.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.prefix = f"singleflight:{name}"
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "shared": 0, "upstream": 0}
+
+    @property
+    def config(self):
+        flights = getattr(settings, "SINGLE_FLIGHTS", {})
+        return {**DEFAULT_SINGLE_FLIGHT, **flights.get(self.name, {})}
+
+    def _key(self, key, suffix):
+        return f"{self.prefix}:{key}:{suffix}"
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def snapshot(self):
+        """Calls, in-process (coalesced) and cross-process (shared) reuses"""
+        with self._lock:
+            return dict(self._stats)
+
+    def do(self, key, call):
+        """Return ``call()``, or the result of the same call already running"""
+        self._count("calls")
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._count("coalesced")
+            if not flight.done.wait(self.config["LEASE"]):
+                logger.warning(f"{self.name} {key}: leader too slow, calling.")
+                self._count("upstream")
+                return call()
+            if flight.error:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call_or_wait(key, call)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def ado(self, key, call):
+        """Async counterpart of do, ``call`` is a coroutine function"""
+        self._count("calls")
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        future = self._async_flights.get(flight_key)
+        if future is not None:
+            self._count("coalesced")
+            return await asyncio.shield(future)
+
+        future = self._async_flights[flight_key] = loop.create_future()
+        try:
+            result = await self._acall_or_wait(key, call)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # nobody may be waiting on it
+            future.exception()
+            raise
+        finally:
+            self._async_flights.pop(flight_key, None)
+
+    def _call_or_wait(self, key, call):
+        started = time.monotonic()
+        while True:
+            found, result = self._read(key)
+            if found:
+                self._count("shared")
+                return result
+            lease = self._lease(key)
+            if lease is not None:
+                return self._call_as_leader(key, call, lease)
+            if time.monotonic() - started >= self.config["LEASE"]:
+                logger.warning(f"{self.name} {key}: no result in time, calling.")
+                self._count("upstream")
+                return call()
+            time.sleep(self.config["POLL_INTERVAL"])
+
+    async def _acall_or_wait(self, key, call):
+        started = time.monotonic()
+        while True:
+            found, result = await sync_to_async(self._read, thread_sensitive=False)(
+                key
+            )
+            if found:
+                self._count("shared")
+                return result
+            lease = await sync_to_async(self._lease, thread_sensitive=False)(key)
+            if lease is not None:
+                try:
+                    self._count("upstream")
+                    result = await call()
+                    await sync_to_async(self._store, thread_sensitive=False)(
+                        key, result
+                    )
+                    return result
+                finally:
+                    await sync_to_async(self._release, thread_sensitive=False)(
+                        lease
+                    )
+            if time.monotonic() - started >= self.config["LEASE"]:
+                logger.warning(f"{self.name} {key}: no result in time, calling.")
+                self._count("upstream")
+                return await call()
+            await asyncio.sleep(self.config["POLL_INTERVAL"])
+
+    def _call_as_leader(self, key, call, lease):
+        try:
+            self._count("upstream")
+            result = call()
+            self._store(key, result)
+            return result
+        finally:
+            self._release(lease)
+
+    def _read(self, key):
+        try:
+            result = cache.get(self._key(key, "result"), _MISSING)
+        except REDIS_ERRORS as e:
+            logger.warning(f"{self.name} result unavailable: {e}")
+            return False, None
+        return result is not _MISSING, result
+
+    def _lease(self, key):
+        """
+        The redis lock of ``key`` when taken, None when another process
+        holds it. Without redis every caller is its own leader.
+        """
+        # async leaders release from another thread than they acquired in
+        lease = cache.lock(
+            self._key(key, "lease"),
+            timeout=self.config["LEASE"],
+            blocking=False,
+            thread_local=False,
+        )
+        try:
+            if lease.acquire():
+                return lease
+        except REDIS_ERRORS as e:
+            logger.warning(f"{self.name} lease unavailable: {e}")
+            return _NoLease()
+        return None
+
+    def _store(self, key, result):
+        try:
+            cache.set(
+                self._key(key, "result"), result, timeout=self.config["RESULT_TTL"]
+            )
+        except REDIS_ERRORS as e:
+            logger.warning(f"{self.name} result not shared: {e}")
+
+    def _release(self, lease):
+        try:
+            lease.release()
+        except (LockError, *REDIS_ERRORS):
+            logger.warning(f"{self.name} lease expired before release.")
+
+
+class _NoLease:
+    """Stands for a lease when redis is down"""
+
+    def release(self):
+        pass
@@ -0,0 +1,143 @@
+import logging
+from django.db import transaction as db_transaction
+from django.db.models import Case, Q, Value, When
+from django.utils import timezone
+from .rollups import record_deltas
+from ..models import Transaction
+
+logger = logging.getLogger(__name__)
+
+S = Transaction.TransactionState
+
+# source state -> states it may move to
+TRANSITIONS = {
+    S.INITIATED: {S.PENDING, S.FAILED},
+    # pending callbacks only record the provider transaction id
+    S.PENDING: {
+        S.PENDING,
+        S.SUCCEEDED,
+        S.AUTHORIZED,
+        S.FAILED,
+        S.ERROR,
+        S.VOIDED,
+        S.REFUNDED,
+    },
+    S.AUTHORIZED: {S.SUCCEEDED, S.VOIDED, S.FAILED},
+    S.SUCCEEDED: {S.REFUNDED, S.VOIDED},
+    S.FAILED: set(),
+    S.ERROR: set(),
+    S.VOIDED: set(),
+    S.REFUNDED: set(),
+}
+
+
+def can_transition(source, target):
+    return target in TRANSITIONS.get(source, ())
+
+
+def allowed_sources(target):
+    """States a transaction may be in to move to ``target``"""
+    return [source for source, targets in TRANSITIONS.items() if target in targets]
+
+
+# columns a rollup delta needs
+ROLLUP_COLUMNS = ("id", "state", "created_at", "amount", "customer_id", "billing_snapshot")
+
+
+def transition(target, sources=None, fields=None, **lookup):
+    """
+    Move the transaction matching ``lookup`` to ``target`` with a conditional
+    ``UPDATE ... WHERE <lookup> AND state = <source>``, one per allowed
+    source state until one applies, so the rollup delta knows the state it
+    left without reading it first.
+
+    ``sources`` narrows the allowed source states, ``fields`` are written in
+    the same statement. The rollup delta is recorded in the same DB
+    transaction. Return True when the row was updated, False when it
+    doesn't exist or its current state doesn't allow the move.
+    """
+    allowed = allowed_sources(target)
+    if sources is not None:
+        allowed = [source for source in allowed if source in sources]
+    with db_transaction.atomic():
+        for source in allowed:
+            updated = Transaction.objects.filter(state=source, **lookup).update(
+                state=target, updated_at=timezone.now(), **(fields or {})
+            )
+            if updated:
+                # the UPDATE holds the row until commit, read what the delta needs
+                rows = Transaction.objects.filter(**lookup).only(*ROLLUP_COLUMNS)
+                record_deltas([(tx, source, target) for tx in rows])
+                return True
+    logger.warning(f"Transaction {lookup} can't move to {target}.")
+    return False
+
+
+def transition_many(changes):
+    """
+    Apply ``(transaction, target, fields)`` changes in one conditional
+    UPDATE. Each row only moves if it's still in the state it was read with
+    (``transaction.state``) and the table allows the move. A row may only
+    appear once.
+
+    Return the transactions that were updated, with their in-memory fields
+    set to the written values. Their rollup deltas go to the outbox in the
+    same DB transaction.
+    """
+    ids = [tx.id for tx, _, _ in changes]
+    if len(set(ids)) != len(ids):
+        # one CASE branch per row, a second change of a row would be dropped
+        raise ValueError("transition_many got more than one change per row.")
+    changes = [
+        (tx, target, fields or {})
+        for tx, target, fields in changes
+        if can_transition(tx.state, target)
+    ]
+    if not changes:
+        return []
+
+    now = timezone.now()
+    condition = Q()
+    for tx, _, _ in changes:
+        condition |= Q(id=tx.id, state=tx.state)
+    values = {
+        "state": Case(
+            *[When(id=tx.id, then=Value(target)) for tx, target, _ in changes],
+            default="state",
+            output_field=Transaction._meta.get_field("state"),
+        )
+    }
+    for name in {name for _, _, fields in changes for name in fields}:
+        values[name] = Case(
+            *[
+                When(id=tx.id, then=Value(fields[name]))
+                for tx, _, fields in changes
+                if name in fields
+            ],
+            default=name,
+            output_field=Transaction._meta.get_field(name),
+        )
+    with db_transaction.atomic():
+        count = Transaction.objects.filter(condition).update(updated_at=now, **values)
+        if count == len(changes):
+            applied = changes
+        else:
+            # another writer moved some rows first. The rows this UPDATE wrote
+            # stay locked by it until commit, so they still carry its stamp
+            written = Q()
+            for tx, target, _ in changes:
+                written |= Q(id=tx.id, state=target)
+            stamped = set(
+                Transaction.objects.filter(written, updated_at=now).values_list(
+                    "id", flat=True
+                )
+            )
+            applied = [change for change in changes if change[0].id in stamped]
+        record_deltas([(tx, tx.state, target) for tx, target, _ in applied])
+
+    for tx, target, fields in applied:
+        tx.state = target
+        tx.updated_at = now
+        for name, value in fields.items():
+            setattr(tx, name, value)
+    return [tx for tx, _, _ in applied]
@@ -0,0 +1,239 @@
+import logging
+import random
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import LockError, RedisError
+from .caching import provider_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenUnavailableError(Exception):
+    # Raised when no token could be fetched or awaited in time
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+
+
+class _Flight:
+    """In-process waiters share the result of a single running fetch."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+        self.error = None
+
+
+class PayMobTokenManager:
+    """
+    Keep the provider authentication token warm in the shared cache.
+
+    The cache entry is ``{"token": ..., "expires_at": ...}`` stored for
+    CACHE_LIFETIME seconds and read through the process-local tier of
+    ``provider_cache``. Readers never take a lock while the token is
+    valid. Inside the last PAYMOB_TOKEN_REFRESH_AHEAD seconds every read has
+    a growing chance to start a background refresh, so the entry is replaced
+    before it expires (the beat task does the same on a schedule).
+
+    Only a cold cache makes callers wait: one process fetches under the redis
+    lock, other threads of that process wait on an event and other processes
+    wait for a pub/sub notification instead of polling.
+    """
+
+    def __init__(self, cache_key=None):
+        self._cache_key = cache_key
+        self._flight = None
+        self._flight_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def cache_key(self):
+        return self._cache_key or getattr(settings, "PAYMOB_AUTH_CACH_KEY")
+
+    @property
+    def lock_key(self):
+        return f"{self.cache_key}:lock"
+
+    @property
+    def channel(self):
+        return f"{self.cache_key}:refreshed"
+
+    @property
+    def lifetime(self):
+        return getattr(settings, "CACHE_LIFETIME")
+
+    @property
+    def refresh_ahead(self):
+        return getattr(settings, "PAYMOB_TOKEN_REFRESH_AHEAD", 60 * 5)
+
+    @property
+    def wait_timeout(self):
+        return getattr(settings, "PAYMOB_TOKEN_WAIT_TIMEOUT", 5)
+
+    def get_token(self, fetch_token):
+        """
+        Return a valid token, fetching it with ``fetch_token()`` only when
+        the cache is cold.
+        """
+        entry = self._read()
+        if entry:
+            if self._should_refresh_early(entry):
+                self._refresh_in_background(fetch_token)
+            return entry["token"]
+        return self._single_flight(fetch_token)
+
+    def refresh(self, fetch_token, blocking_timeout=None):
+        """
+        Fetch a new token under the redis lock and publish it.
+
+        Return the new token, or None when another process holds the lock
+        (that process will publish its own token).
+        """
+        lock = cache.lock(
+            self.lock_key,
+            timeout=15,
+            blocking=blocking_timeout is not None,
+            blocking_timeout=blocking_timeout,
+        )
+        if not lock.acquire():
+            return None
+        try:
+            token = fetch_token()
+            self._store(token)
+            logger.info("provider authentication token refreshed.")
+            return token
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                logger.warning("provider token lock expired before release.")
+
+    def invalidate(self):
+        provider_cache.delete(self.cache_key)
+
+    def _read(self):
+        entry = provider_cache.get(self.cache_key)
+        if entry and entry["expires_at"] <= time.time():
+            # local copy outlived the redis entry
+            provider_cache.local.delete(self.cache_key)
+            entry = cache.get(self.cache_key)
+        if not isinstance(entry, dict) or not entry.get("token"):
+            return None
+        return entry
+
+    def _store(self, token):
+        entry = {"token": token, "expires_at": time.time() + self.lifetime}
+        provider_cache.set(self.cache_key, entry, timeout=self.lifetime)
+        self._notify()
+        return entry
+
+    def _should_refresh_early(self, entry):
+        """
+        Chance of refreshing grows linearly from 0 at the start of the
+        refresh window to 1 at expiry, spreading refreshes between readers.
+        """
+        remaining = entry["expires_at"] - time.time()
+        if remaining > self.refresh_ahead:
+            return False
+        if self.refresh_ahead <= 0 or remaining <= 0:
+            return True
+        return random.random() >= remaining / self.refresh_ahead
+
+    def _refresh_in_background(self, fetch_token):
+        # one refresh thread per process, readers keep the current token
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.refresh(fetch_token)
+            except Exception as e:
+                logger.warning(f"background token refresh failed: {e}")
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=run, name="paymob-token-refresh", daemon=True).start()
+
+    def _single_flight(self, fetch_token):
+        with self._flight_lock:
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TokenUnavailableError("timed out waiting for provider token")
+            if flight.error:
+                raise flight.error
+            return flight.token
+
+        try:
+            flight.token = self._fetch_or_wait(fetch_token)
+            return flight.token
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flight_lock:
+                self._flight = None
+            flight.done.set()
+
+    def _fetch_or_wait(self, fetch_token):
+        """
+        Fetch the token if this process wins the redis lock, otherwise wait
+        for the winner's notification.
+        """
+        pubsub = self._subscribe()
+        try:
+            token = self.refresh(fetch_token)
+            if token:
+                return token
+            # the winner may have stored the token before we subscribed
+            entry = self._read()
+            if entry:
+                return entry["token"]
+            return self._wait_for_token(pubsub)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+    def _wait_for_token(self, pubsub):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if pubsub is None:
+                # no pub/sub available, fall back to short sleeps
+                time.sleep(min(remaining, 0.25))
+            else:
+                pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            entry = self._read()
+            if entry:
+                return entry["token"]
+        raise TokenUnavailableError(
+            "redis is down or can't reach the provider, try again"
+        )
+
+    def _subscribe(self):
+        try:
+            pubsub = get_redis_connection("default").pubsub()
+            pubsub.subscribe(self.channel)
+            return pubsub
+        except (RedisError, NotImplementedError) as e:
+            logger.warning(f"token notifications unavailable: {e}")
+            return None
+
+    def _notify(self):
+        try:
+            get_redis_connection("default").publish(self.channel, "1")
+        except (RedisError, NotImplementedError) as e:
+            logger.warning(f"failed to notify token waiters: {e}")
+
+
+token_manager = PayMobTokenManager()
@@ -2,6 +2,7 @@ import logging
 import hashlib
 import hmac
 from django.conf import settings
+from django.utils.functional import cached_property
 from .helpers import bring_transaction
 
 logger = logging.getLogger(__name__)
@@ -16,37 +17,18 @@ class WebhookServiceError(Exception):
 
 
 class WebhookService:
-    def __init__(self, data, merchant_id, transaction_id):
+    def __init__(self, data, merchant_id=None, transaction_id=None):
         self.data = data
-        self.transaction = bring_transaction(merchant_order_id=merchant_id)
+        self.merchant_id = merchant_id
         self.transaction_id = transaction_id
 
+    @cached_property
+    def transaction(self):
+        # only looked up when needed, verification doesn't touch the db
+        return bring_transaction(merchant_order_id=self.merchant_id)
+
     def verify_paymob_hmac(self, received_hmac):
-        concatenate_fields = str.join(
-            "",
-            [
-                str(self.data["amount_cents"]),
-                str(self.data["created_at"]),
-                str(self.data["currency"]),
-                str(self.data["error_occured"]).lower(),
-                str(self.data["has_parent_transaction"]).lower(),
-                str(self.data["id"]),
-                str(self.data["integration_id"]),
-                str(self.data["is_3d_secure"]).lower(),
-                str(self.data["is_auth"]).lower(),
-                str(self.data["is_capture"]).lower(),
-                str(self.data["is_refunded"]).lower(),
-                str(self.data["is_standalone_payment"]).lower(),
-                str(self.data["is_voided"]).lower(),
-                str(self.data["order"]["id"]),
-                str(self.data["owner"]),
-                str(self.data["pending"]).lower(),
-                str(self.data["source_data"]["pan"]),
-                str(self.data["source_data"]["sub_type"]),
-                str(self.data["source_data"]["type"]),
-                str(self.data["success"]).lower(),
-            ],
-        )
+        concatenate_fields = WebhookService.concatenate_hmac_fields(self.data)
         secret_key = getattr(settings, "HMAC_SECRET_KEY")
         WebhookService.verify_signature(
             received_hmac=received_hmac,
@@ -57,6 +39,50 @@ class WebhookService:
             f"PayMob HMAC for transaction ({self.transaction_id}) verified successfully.",
         )
 
+    @staticmethod
+    def concatenate_hmac_fields(data):
+        """
+        Join the callback fields PayMob signs, in PayMob's order
+        """
+        return str.join(
+            "",
+            [
+                str(data["amount_cents"]),
+                str(data["created_at"]),
+                str(data["currency"]),
+                str(data["error_occured"]).lower(),
+                str(data["has_parent_transaction"]).lower(),
+                str(data["id"]),
+                str(data["integration_id"]),
+                str(data["is_3d_secure"]).lower(),
+                str(data["is_auth"]).lower(),
+                str(data["is_capture"]).lower(),
+                str(data["is_refunded"]).lower(),
+                str(data["is_standalone_payment"]).lower(),
+                str(data["is_voided"]).lower(),
+                str(data["order"]["id"]),
+                str(data["owner"]),
+                str(data["pending"]).lower(),
+                str(data["source_data"]["pan"]),
+                str(data["source_data"]["sub_type"]),
+                str(data["source_data"]["type"]),
+                str(data["success"]).lower(),
+            ],
+        )
+
+    @staticmethod
+    def sign(data, secret_key=None, digestmod=hashlib.sha512):
+        """
+        Return the hmac PayMob would send with this callback data
+        (used by the local emulator and tests)
+        """
+        secret_key = secret_key or getattr(settings, "HMAC_SECRET_KEY")
+        return hmac.new(
+            secret_key.encode("utf-8"),
+            WebhookService.concatenate_hmac_fields(data).encode("utf-8"),
+            digestmod=digestmod,
+        ).hexdigest()
+
     @staticmethod
     def verify_signature(**kwargs):
         """
@@ -0,0 +1,93 @@
+import logging
+from celery import shared_task
+from .services.archive import archive_transactions
+from .services.inbox import drain_webhook_inbox
+from .services.orchestration import (
+    TransactionOrchestrationService,
+    TransactionOrchestrationServiceError,
+)
+from .services.paymob import PayMobClient, ProviderUnavailableError
+from .services.reconciliation import reconcile_stuck_transactions
+from .services.rollups import fold_rollup_deltas
+from .services.tokens import token_manager
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, queue="provider", acks_late=True, max_retries=3)
+def interact_with_provider_task(self, transaction_id):
+    """
+    Background task for creating the provider order and payment key
+    of an INITIATED transaction, moving it to PENDING or FAILED.
+    A failed step is retried from the stored checkpoint.
+    """
+    logger.info(f"Start provider steps for transaction {transaction_id}...")
+    try:
+        state = TransactionOrchestrationService.process_provider_steps(transaction_id)
+    except ProviderUnavailableError as exc:
+        logger.warning(f"PayMob unavailable, transaction {transaction_id} waits.")
+        raise self.retry(exc=exc, countdown=exc.retry_after or 30)
+    except TransactionOrchestrationServiceError as exc:
+        logger.warning(f"Provider steps for transaction {transaction_id} failed.")
+        raise self.retry(exc=exc, countdown=30)
+    except Exception as exc:
+        logger.exception(f"Provider steps for transaction {transaction_id} crashed.")
+        raise self.retry(exc=exc, countdown=30)
+    logger.info(f"Transaction {transaction_id} provider steps ended with {state}.")
+    return state
+
+
+@shared_task(bind=True, queue="provider", max_retries=3)
+def refresh_paymob_token_task(self):
+    """
+    Periodic task that replaces the provider auth token before it expires,
+    so request threads always find a warm token.
+    """
+    try:
+        token = token_manager.refresh(
+            PayMobClient()._fetch_auth_token, blocking_timeout=5
+        )
+    except Exception as exc:
+        logger.warning("Provider token refresh failed retry in 30 seconds...")
+        raise self.retry(exc=exc, countdown=30)
+    if token:
+        logger.info("Provider token refreshed by beat.")
+
+
+@shared_task(queue="provider")
+def drain_webhook_inbox_task():
+    """
+    Background task for applying received PayMob webhooks in batches
+    """
+    processed = drain_webhook_inbox()
+    if processed:
+        logger.info(f"Webhook inbox drained {processed} events.")
+    return processed
+
+
+@shared_task(queue="provider")
+def reconcile_stuck_transactions_task():
+    """
+    Periodic task that resolves INITIATED/PENDING transactions
+    which never received a webhook.
+    """
+    return reconcile_stuck_transactions()
+
+
+@shared_task
+def fold_transaction_rollups_task():
+    """
+    Periodic task that folds the rollup outbox into the analytics tables
+    """
+    folded = fold_rollup_deltas()
+    if folded:
+        logger.info(f"Folded {folded} rollup deltas.")
+    return folded
+
+
+@shared_task
+def archive_transactions_task():
+    """
+    Periodic task that moves old terminal transactions to the archive table
+    """
+    return archive_transactions()
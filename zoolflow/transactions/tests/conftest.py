@@ -1,11 +1,34 @@
 import pytest
 from django.contrib.auth import get_user_model
-from ..services.paymob import PayMobClient
+from django.core.cache import cache
+from ..services.paymob import PayMobClient, paymob_breaker, paymob_limiter
 from customers.models import Customer, Address
 
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def closed_paymob_breaker():
+    # provider failures of one test must not open the breaker for the next
+    paymob_breaker.reset()
+    yield
+    paymob_breaker.reset()
+
+
+@pytest.fixture(autouse=True)
+def full_paymob_buckets():
+    # nor drain the rate limit buckets of the next
+    paymob_limiter.reset()
+    yield
+    paymob_limiter.reset()
+
+
+@pytest.fixture(autouse=True)
+def no_shared_lookups():
+    # nor hand it state lookups shared by single flights
+    cache.delete_pattern("singleflight:*")
+
+
 @pytest.fixture()
 def customer_factory(db):
     def create_customer(with_address=True, **kwargs):
@@ -15,7 +38,9 @@ def customer_factory(db):
             role_management=kwargs.get("role_management", User.Roles.CUSTOMER),
             email=kwargs.get("email", "example998@cloud.com"),
         )
-        customer = Customer.objects.create(user=user)
+        customer = Customer.objects.create(
+            user=user, is_verified=kwargs.get("is_verified", False)
+        )
 
         if with_address:
             Address.objects.create(
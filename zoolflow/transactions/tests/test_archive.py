@@ -0,0 +1,134 @@
+import pytest
+from datetime import timedelta
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from ..models import ArchivedTransaction, DailyTransactionRollup, Transaction
+from ..services.archive import TransactionHistory, archive_transactions
+from ..services.rollups import rebuild_rollups
+
+S = Transaction.TransactionState
+LIST_URL = reverse("transactions:transaction-list")
+
+
+def age(rows, days):
+    past = timezone.now() - timedelta(days=days)
+    Transaction.objects.filter(id__in=[tx.id for tx in rows]).update(
+        created_at=past, updated_at=past
+    )
+
+
+@pytest.fixture
+def history(customer_factory):
+    customer = customer_factory()
+    old = Transaction.objects.bulk_create(
+        [
+            Transaction(customer=customer, amount=10 + i, state=state, payment_token="tk")
+            for i, state in enumerate([S.SUCCEEDED] * 6 + [S.FAILED] * 6 + [S.PENDING] * 2)
+        ]
+    )
+    age(old, 120)
+    recent = Transaction.objects.bulk_create(
+        [Transaction(customer=customer, amount=50, state=S.SUCCEEDED) for _ in range(11)]
+    )
+    # another customer's archived rows never leak into the pages
+    stranger = customer_factory(username="other", email="other@cloud.com")
+    other = Transaction.objects.create(customer=stranger, amount=5, state=S.FAILED)
+    age([other], 120)
+    return customer
+
+
+@pytest.mark.django_db
+class TestArchive:
+    def test_moves_old_terminal_rows(self, history):
+        report = archive_transactions(batch_size=5)
+
+        assert report == {"archived": 13, "batches": 3, "finished": True}
+        assert ArchivedTransaction.objects.count() == 13
+        assert not ArchivedTransaction.objects.exclude(payment_token=None).exists()
+        # PENDING can still change, recent rows stay hot
+        assert set(Transaction.objects.values_list("state", flat=True)) == {
+            S.PENDING,
+            S.SUCCEEDED,
+        }
+        assert Transaction.objects.filter(customer=history).count() == 13
+
+    def test_second_run_is_a_noop(self, history):
+        archive_transactions()
+        assert archive_transactions()["archived"] == 0
+
+    def test_time_budget_stops_between_batches(self, history, mocker):
+        clock = iter([0, 0, 100])
+        mocker.patch(
+            "zoolflow.transactions.services.archive.time",
+            monotonic=lambda: next(clock),
+        )
+        report = archive_transactions(batch_size=5, time_budget=10)
+        assert report == {"archived": 5, "batches": 1, "finished": False}
+
+    def test_command(self, history):
+        call_command("archive_transactions", "--older-than-days", "200")
+        assert not ArchivedTransaction.objects.exists()
+        call_command("archive_transactions", "--older-than-days", "100")
+        assert ArchivedTransaction.objects.count() == 13
+
+
+@pytest.mark.django_db
+class TestHistory:
+    def test_union_ordering_and_count(self, history):
+        expected = list(
+            Transaction.objects.filter(customer=history)
+            .order_by("-created_at", "-id")
+            .values_list("merchant_order_id", flat=True)
+        )
+        archive_transactions()
+
+        rows = TransactionHistory().filter(customer=history).order_by("-created_at", "-id")
+        assert rows.count() == 25
+        assert [row["merchant_order_id"] for row in rows] == expected
+        assert [row["merchant_order_id"] for row in rows[10:20]] == expected[10:20]
+
+    def test_cursor_pages_cross_the_archive(
+        self, api_client, history, django_assert_max_num_queries
+    ):
+        archive_transactions()
+        api_client.force_authenticate(user=history.user)
+        url = LIST_URL + "?pagination=cursor"
+
+        seen = []
+        while url:
+            with django_assert_max_num_queries(4):
+                response = api_client.get(url)
+            assert response.status_code == 200
+            seen += [row["merchant_order_id"] for row in response.data["results"]]
+            url = response.data["next"]
+        assert len(seen) == len(set(seen)) == 25
+
+    def test_page_number_and_filter(self, api_client, history):
+        archive_transactions()
+        api_client.force_authenticate(user=history.user)
+
+        assert api_client.get(LIST_URL).data["count"] == 25
+        failed = api_client.get(LIST_URL, {"state": S.FAILED}).data
+        assert failed["count"] == 6
+
+    def test_retrieve_archived(self, api_client, history):
+        archive_transactions()
+        archived = ArchivedTransaction.objects.filter(customer=history).first()
+        api_client.force_authenticate(user=history.user)
+
+        for lookup in (archived.merchant_order_id, archived.id):
+            url = reverse("transactions:transaction-detail", args=[lookup])
+            response = api_client.get(url)
+            assert response.status_code == 200
+            assert response.data["merchant_order_id"] == str(archived.merchant_order_id)
+
+
+@pytest.mark.django_db
+def test_rebuild_counts_archived_rows(history):
+    rebuild_rollups()
+    before = set(DailyTransactionRollup.objects.values_list("state", "count", "amount"))
+    archive_transactions()
+    rebuild_rollups()
+    after = set(DailyTransactionRollup.objects.values_list("state", "count", "amount"))
+    assert before == after
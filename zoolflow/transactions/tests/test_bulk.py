@@ -0,0 +1,179 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from ..emulator import EmulatorServer
+from ..models import Transaction
+from ..services.paymob import ProviderServiceError
+from ..services.tokens import token_manager
+
+URL = reverse("transactions:transaction-bulk")
+
+
+@pytest.fixture
+def emulator(settings):
+    server = EmulatorServer(("127.0.0.1", 0), SEED=1)
+    server.start_in_thread()
+    for name, url in server.urls().items():
+        setattr(settings, name, url)
+    token_manager.invalidate()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def staff(db):
+    return get_user_model().objects.create_user(
+        username="bulkstaff",
+        password="Aliahmed091$",
+        email="bulkstaff@cloud.com",
+        role_management=get_user_model().Roles.STAFF,
+    )
+
+
+@pytest.mark.django_db
+class TestBulkCreate:
+    def test_customer_batch_against_emulator(
+        self, api_client, customer_factory, emulator, django_assert_max_num_queries
+    ):
+        customer = customer_factory(is_verified=True)
+        api_client.force_authenticate(user=customer.user)
+        items = [{"amount": f"{10 + n}.00"} for n in range(30)]
+
+        # user, billing, insert, one state update, rollup deltas, savepoints
+        with django_assert_max_num_queries(11):
+            response = api_client.post(URL, {"items": items}, format="json")
+
+        assert response.status_code == 201
+        assert response.data["succeeded"] == 30
+        results = response.data["results"]
+        assert [r["index"] for r in results] == list(range(30))
+        assert {r["state"] for r in results} == {"pending"}
+        assert all(r["order_id"] and r["payment_token"] for r in results)
+        pending = Transaction.objects.filter(customer=customer, state="pending")
+        assert pending.count() == 30
+        assert emulator.emulator.snapshot()["orders"] == 30
+
+    def test_staff_batch_reports_partial_failures(
+        self, api_client, customer_factory, staff, emulator
+    ):
+        good = customer_factory(is_verified=True)
+        unsupported = customer_factory(
+            username="unsupported",
+            email="unsupported@cloud.com",
+            country="SD",
+            is_verified=True,
+        )
+        unverified = customer_factory(
+            username="unverified", email="unverified@cloud.com", is_verified=False
+        )
+        api_client.force_authenticate(user=staff)
+        items = [
+            {"amount": "10.00", "customer": good.id},
+            {"amount": "11.00", "customer": unsupported.id},
+            {"amount": "12.00", "customer": unverified.id},
+            {"amount": "13.00"},
+        ]
+
+        response = api_client.post(URL, {"items": items}, format="json")
+
+        assert response.status_code == 207
+        assert response.data["succeeded"] == 1
+        first, second, third, fourth = response.data["results"]
+        assert first["state"] == "pending"
+        assert second["error"].startswith("Currency:")
+        assert third["error"] == fourth["error"] == (
+            "Customer:Customer not found or not verified."
+        )
+        assert Transaction.objects.count() == 1
+
+    def test_provider_failures_leave_rows_resumable(
+        self, api_client, customer_factory, mocker
+    ):
+        mocker.patch(
+            "zoolflow.transactions.services.bulk.PayMobClient.create_order",
+            return_value=77,
+        )
+        mocker.patch(
+            "zoolflow.transactions.services.bulk.PayMobClient.payment_key_token",
+            side_effect=ProviderServiceError("provider API fail"),
+        )
+        customer = customer_factory(is_verified=True)
+        api_client.force_authenticate(user=customer.user)
+
+        response = api_client.post(
+            URL, {"items": [{"amount": "10.00"}] * 3}, format="json"
+        )
+
+        assert response.status_code == 207
+        assert {r["state"] for r in response.data["results"]} == {"initiated"}
+        # the created orders are kept for the retry
+        assert Transaction.objects.filter(
+            state="initiated",
+            order_id="77",
+            checkpoint=Transaction.Checkpoint.ORDER_CREATED,
+        ).count() == 3
+
+    def test_backend_without_returned_ids(
+        self,
+        api_client,
+        customer_factory,
+        mocker,
+        settings,
+        django_capture_on_commit_callbacks,
+    ):
+        from django.db import connection
+
+        # MySQL doesn't return the ids of a bulk insert
+        mocker.patch.object(
+            type(connection.features), "can_return_rows_from_bulk_insert", False
+        )
+        mocker.patch(
+            "zoolflow.transactions.services.bulk.PayMobClient.create_order",
+            return_value=77,
+        )
+        mocker.patch(
+            "zoolflow.transactions.services.bulk.PayMobClient.payment_key_token",
+            side_effect=["tk", ProviderServiceError("provider API fail")],
+        )
+        customer = customer_factory(is_verified=True)
+        api_client.force_authenticate(user=customer.user)
+
+        response = api_client.post(
+            URL, {"items": [{"amount": "10.00"}] * 2}, format="json"
+        )
+
+        assert response.status_code == 207
+        states = Transaction.objects.values_list("state", "checkpoint")
+        assert sorted(states) == [
+            ("initiated", Transaction.Checkpoint.ORDER_CREATED),
+            ("pending", Transaction.Checkpoint.KEY_ISSUED),
+        ]
+
+        settings.PROVIDER_ASYNC_ORCHESTRATION = True
+        delay = mocker.patch(
+            "zoolflow.transactions.tasks.interact_with_provider_task.delay"
+        )
+        with django_capture_on_commit_callbacks(execute=True):
+            api_client.post(URL, {"items": [{"amount": "10.00"}]}, format="json")
+        (tx_id,) = delay.call_args.args
+        assert Transaction.objects.filter(id=tx_id, state="initiated").exists()
+
+    def test_customer_cannot_bill_others(self, api_client, customer_factory):
+        customer = customer_factory(is_verified=True)
+        other = customer_factory(
+            username="other", email="other@cloud.com", is_verified=True
+        )
+        api_client.force_authenticate(user=customer.user)
+        response = api_client.post(
+            URL, {"items": [{"amount": "10.00", "customer": other.id}]}, format="json"
+        )
+        assert response.status_code == 403
+
+    def test_batch_size_is_limited(self, api_client, customer_factory, settings):
+        settings.BULK_TRANSACTION_MAX_ITEMS = 2
+        api_client.force_authenticate(user=customer_factory(is_verified=True).user)
+        response = api_client.post(
+            URL, {"items": [{"amount": "10.00"}] * 3}, format="json"
+        )
+        assert response.status_code == 400
@@ -0,0 +1,62 @@
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from ..services.caching import TieredCache, LocalTTLCache
+
+
+@pytest.fixture
+def tiered():
+    cache.delete_many(["test:tiered", "test:tiered:version"])
+    yield TieredCache(max_entries=4)
+    cache.delete_many(["test:tiered", "test:tiered:version"])
+
+
+class TestTieredCache:
+    def test_local_tier_serves_repeated_reads(self, tiered, mocker):
+        cache.set("test:tiered", "value", timeout=60)
+        assert tiered.get("test:tiered") == "value"
+        redis_get = mocker.spy(cache, "get_many")
+        assert tiered.get("test:tiered") == "value"
+        assert not redis_get.called
+        stats = tiered.stats()
+        assert stats["local"]["hits"] == 1
+        assert stats["local"]["misses"] == 1
+        assert stats["redis"]["hits"] == 1
+
+    @override_settings(PROVIDER_CACHE_VERSION_CHECK=0)
+    def test_rotation_reaches_other_process(self, tiered):
+        other_process = TieredCache()
+        other_process.set("test:tiered", "old-token", timeout=60)
+        assert tiered.get("test:tiered") == "old-token"
+        other_process.set("test:tiered", "new-token", timeout=60)
+        assert tiered.get("test:tiered") == "new-token"
+
+    def test_rotation_waits_for_version_check(self, tiered):
+        other_process = TieredCache()
+        other_process.set("test:tiered", "old-token", timeout=60)
+        assert tiered.get("test:tiered") == "old-token"
+        other_process.set("test:tiered", "new-token", timeout=60)
+        # bounded staleness, served locally until the next version check
+        assert tiered.get("test:tiered") == "old-token"
+
+    def test_redis_miss_counted(self, tiered):
+        assert tiered.get("test:tiered") is None
+        assert tiered.stats()["redis"]["misses"] == 1
+
+
+def test_local_cache_bounded_size():
+    local = LocalTTLCache(max_entries=2)
+    local.set("a", 1, ttl=60)
+    local.set("b", 2, ttl=60)
+    local.get("a")
+    local.set("c", 3, ttl=60)
+    # least recently used entry evicted
+    assert local.get("b") is None
+    assert local.get("a")["value"] == 1
+    assert len(local) == 2
+
+
+def test_local_cache_expiry():
+    local = LocalTTLCache()
+    local.set("a", 1, ttl=0)
+    assert local.get("a") is None
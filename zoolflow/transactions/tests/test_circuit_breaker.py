@@ -0,0 +1,166 @@
+import pytest
+import requests
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from ..models import Transaction
+from ..services.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+from ..services.paymob import PayMobClient, ProviderUnavailableError, paymob_breaker
+
+CONFIG = {
+    "MIN_CALLS": 4,
+    "FAILURE_RATE": 0.5,
+    "SLOW_CALL_SECONDS": 1,
+    "SLOW_RATE": 0.75,
+    "OPEN_SECONDS": 30,
+    "PROBE_INTERVAL": 5,
+    "PROBE_CALLS": 2,
+    "CLOSE_AFTER": 2,
+}
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker(
+        "test", failures=(requests.RequestException,), config=CONFIG
+    )
+    breaker.reset()
+    yield breaker
+    breaker.reset()
+
+
+def call(breaker, error=None):
+    with breaker.guard():
+        if error:
+            raise error
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        with pytest.raises(requests.ConnectionError):
+            call(breaker, requests.ConnectionError("down"))
+
+
+def half_open(breaker):
+    # OPEN_SECONDS ran out
+    breaker.redis.delete(breaker._key("open"))
+
+
+class TestCircuitBreaker:
+    def test_trips_on_failure_rate(self, breaker):
+        call(breaker)
+        call(breaker)
+        fail(breaker)
+        assert breaker.state() == (CLOSED, 0)
+        fail(breaker)
+        state, retry_after = breaker.state()
+        assert state == OPEN and 0 < retry_after <= 30
+
+        with pytest.raises(CircuitOpenError) as e:
+            call(breaker)
+        assert e.value.retry_after == retry_after
+
+    def test_other_errors_are_not_failures(self, breaker):
+        for _ in range(4):
+            with pytest.raises(KeyError):
+                call(breaker, KeyError("order ID"))
+        assert breaker.state() == (CLOSED, 0)
+
+    def test_trips_on_slow_calls(self, breaker):
+        # every call is slower than 0 seconds
+        breaker._config = {**CONFIG, "SLOW_CALL_SECONDS": 0}
+        for _ in range(3):
+            call(breaker)
+        # below MIN_CALLS nothing trips
+        assert breaker.state()[0] == CLOSED
+        call(breaker)
+        assert breaker.state()[0] == OPEN
+
+    def test_half_open_trickle_then_close(self, breaker):
+        breaker.trip("test")
+        half_open(breaker)
+        assert breaker.state() == (HALF_OPEN, 0)
+
+        call(breaker)
+        # PROBE_CALLS per PROBE_INTERVAL, the rest still fails fast
+        with breaker.guard():
+            with pytest.raises(CircuitOpenError):
+                call(breaker)
+        assert breaker.state() == (CLOSED, 0)
+
+    def test_failed_probe_reopens(self, breaker):
+        breaker.trip("test")
+        half_open(breaker)
+        fail(breaker)
+        assert breaker.state()[0] == OPEN
+        assert breaker.snapshot()["reason"] == "half-open probe failed"
+
+    def test_ensure_closed(self, breaker):
+        breaker.ensure_closed()
+        breaker.trip("test")
+        with pytest.raises(CircuitOpenError):
+            breaker.ensure_closed()
+
+    def test_redis_down_lets_calls_through(self, breaker, mocker):
+        from redis.exceptions import ConnectionError
+
+        broken = mocker.Mock()
+        broken.mget.side_effect = ConnectionError("redis down")
+        broken.pipeline.side_effect = ConnectionError("redis down")
+        mocker.patch.object(CircuitBreaker, "redis", broken)
+        call(breaker)
+        fail(breaker)
+        breaker.ensure_closed()
+
+
+@pytest.mark.django_db
+class TestPayMobBreaker:
+    def test_open_breaker_skips_the_network(self, mocker):
+        paymob_breaker.trip("test")
+        session = mocker.patch.object(requests.Session, "post")
+        with pytest.raises(ProviderUnavailableError) as e:
+            PayMobClient()._request_field({}, "http://paymob.test", "id", "order ID")
+        assert not session.called
+        assert e.value.retry_after
+
+    def test_server_errors_are_counted(self, mocker):
+        response = mocker.Mock(status_code=503)
+        response.raise_for_status.side_effect = requests.HTTPError("503")
+        mocker.patch.object(requests.Session, "post", return_value=response)
+        for _ in range(10):
+            with pytest.raises(Exception):
+                PayMobClient()._request_field({}, "http://paymob.test", "id", "id")
+        assert paymob_breaker.state()[0] == OPEN
+
+    def test_checkout_fails_fast(self, api_client, customer_factory, mocker):
+        customer = customer_factory(is_verified=True)
+        provider = mocker.patch.object(PayMobClient, "create_order")
+        paymob_breaker.trip("test")
+
+        api_client.force_authenticate(user=customer.user)
+        response = api_client.post(
+            reverse("transactions:transaction-list"), {"amount": "10.00"}, format="json"
+        )
+        assert response.status_code == 503
+        assert int(response["Retry-After"]) > 0
+        assert not Transaction.objects.exists()
+        assert not provider.called
+
+    def test_health_view(self, api_client, customer_factory):
+        staff = customer_factory(role_management=get_user_model().Roles.STAFF).user
+        paymob_breaker.trip("test")
+
+        api_client.force_authenticate(user=staff)
+        response = api_client.get(reverse("transactions:provider_health"))
+        assert response.status_code == 200
+        assert response.data["paymob"]["circuit_breaker"]["state"] == OPEN
+
+    def test_health_view_is_staff_only(self, api_client, customer_factory):
+        api_client.force_authenticate(user=customer_factory().user)
+        response = api_client.get(reverse("transactions:provider_health"))
+        assert response.status_code == 403
@@ -0,0 +1,78 @@
+import pytest
+import requests
+from ..emulator import EmulatorServer, LatencyModel, build_transaction
+from ..services.orchestration import TransactionOrchestrationService
+from ..services.paymob import PayMobClient
+from ..services.tokens import token_manager
+from ..services.webhook import WebhookService
+
+
+@pytest.fixture
+def emulator(settings):
+    server = EmulatorServer(("127.0.0.1", 0), SEED=1)
+    server.start_in_thread()
+    for name, url in server.urls().items():
+        setattr(settings, name, url)
+    token_manager.invalidate()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.django_db
+def test_payment_path_offline(emulator, customer_factory):
+    client = PayMobClient(customer=customer_factory(), amount_cents=12345)
+    order_id = client.create_order(merchant_id="ORD-EMU-1")
+    assert client.payment_key_token(order_id=order_id)
+
+    _, paid = emulator.emulator.pay(order_id, "success")
+    state = TransactionOrchestrationService.transaction_current_state(paid["id"])
+    assert state == "succeeded"
+    assert client.inquire_order_transaction(order_id)["id"] == paid["id"]
+
+
+def test_faults(emulator):
+    base = emulator.base_url
+    emulator.emulator.config.update(TOKEN_TTL=0)
+    token = requests.post(f"{base}/api/auth/tokens", json={}).json()["token"]
+    expired = requests.post(f"{base}/api/ecommerce/orders", json={"auth_token": token})
+    assert expired.status_code == 401
+
+    emulator.emulator.config.update(ERROR_RATE=1.0)
+    assert requests.post(f"{base}/api/auth/tokens", json={}).status_code == 500
+
+    emulator.emulator.config.update(BURST_EVERY=60, BURST_LENGTH=60)
+    throttled = requests.post(f"{base}/api/auth/tokens", json={})
+    assert throttled.status_code == 429
+    assert throttled.headers["Retry-After"] == "1"
+    assert emulator.emulator.snapshot()["throttled"] == 1
+
+
+def test_latency_model():
+    assert LatencyModel("fixed:250").sample() == 0.25
+    assert 0.01 <= LatencyModel("uniform:10,20").sample() <= 0.02
+    with pytest.raises(ValueError):
+        LatencyModel("poisson:3")
+
+
+def test_signed_callback_verifies(settings):
+    settings.HMAC_SECRET_KEY = "emulator-secret"
+    order = {"id": 7, "merchant_order_id": "ORD-1", "amount_cents": 100}
+    data = build_transaction(order, "declined", transaction_id=99)
+    WebhookService(data).verify_paymob_hmac(WebhookService.sign(data))
+
+
+@pytest.mark.django_db
+def test_send_webhook_dry_run(customer_factory, settings):
+    import json
+    from io import StringIO
+    from django.core.management import call_command
+    from ..models import Transaction
+
+    settings.HMAC_SECRET_KEY = "emulator-secret"
+    tx = Transaction.objects.create(customer=customer_factory(), amount=10)
+    out = StringIO()
+    call_command("send_paymob_webhook", tx.merchant_order_id, dry_run=True, stdout=out)
+    printed = json.loads(out.getvalue())
+    assert printed["hmac"] == WebhookService.sign(printed["body"]["obj"])
+    assert printed["body"]["obj"]["order"]["merchant_order_id"] == tx.merchant_order_id
@@ -0,0 +1,93 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from django.test import override_settings
+from ..services.http_client import TransportRegistry
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestTransportRegistry:
+    def test_session_shared_per_upstream(self):
+        registry = TransportRegistry()
+        assert registry.session("paymob") is registry.session("paymob")
+        assert registry.session("paymob") is not registry.session("mailgun")
+
+    def test_forked_child_gets_new_session(self, mocker):
+        registry = TransportRegistry()
+        parent_session = registry.session("paymob")
+        mocker.patch("os.getpid", return_value=registry._pid + 1)
+        assert registry.session("paymob") is not parent_session
+
+    @override_settings(HTTP_TRANSPORT={"mailgun": {"TIMEOUT": (1, 2)}})
+    def test_upstream_config_overrides_default(self):
+        registry = TransportRegistry()
+        assert registry.timeout("mailgun") == (1, 2)
+        assert registry.config("mailgun")["POOL_MAXSIZE"] == 10
+
+    def test_connections_reused(self, local_server):
+        registry = TransportRegistry()
+        session = registry.session("paymob")
+        for _ in range(4):
+            assert session.get(local_server, timeout=2).status_code == 200
+        stats = registry.stats()["paymob"]
+        (host_stats,) = stats.values()
+        assert host_stats["requests"] == 4
+        assert host_stats["connections"] == 1
+        assert host_stats["reuse_ratio"] == 0.75
+        assert host_stats["waits"] == 0
+        registry.close()
+
+
+# the mail is sent on commit
+@pytest.mark.django_db(transaction=True)
+def test_state_email_retries_mailgun_failures(customer_factory, mocker):
+    from zoolflow.notifications.mailers.providers import (
+        MailGunProvider,
+        MailGunProviderError,
+    )
+    from zoolflow.notifications.models import EmailEvent
+    from zoolflow.notifications.tasks import transaction_state_email_task
+    from ..models import Transaction
+
+    Transaction.objects.create(
+        customer=customer_factory(), amount=10, transaction_id="81"
+    )
+    # the mailgun session has no transport retries, the task retries
+    send = mocker.patch.object(
+        MailGunProvider,
+        "send_email",
+        side_effect=[
+            MailGunProviderError("503 Server Error"),
+            {"message": "Queued. Thank you.", "id": "<mail-81>"},
+        ],
+    )
+
+    transaction_state_email_task.apply(args=["81"])
+
+    assert send.call_count == 2
+    event = EmailEvent.objects.get(idempotent_key="81")
+    assert event.status == EmailEvent.MessageStatus.QUEUED
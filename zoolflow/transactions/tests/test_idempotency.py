@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from ..models import Transaction
+from ..services.idempotency import IdempotencyError, run_idempotent
+
+
+@pytest.fixture
+def async_create(settings, mocker):
+    settings.PROVIDER_ASYNC_ORCHESTRATION = True
+    return mocker.patch("zoolflow.transactions.tasks.interact_with_provider_task.delay")
+
+
+@pytest.mark.django_db
+class TestIdempotentCreate:
+    url = reverse("transactions:transaction-list")
+
+    def test_retry_replays_first_response(
+        self, api_client, customer_factory, async_create
+    ):
+        customer = customer_factory(is_verified=True)
+        api_client.force_authenticate(user=customer.user)
+
+        first = api_client.post(
+            self.url, {"amount": "25.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-1"
+        )
+        retry = api_client.post(
+            self.url, {"amount": "25.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-1"
+        )
+        assert first.status_code == retry.status_code == 202
+        assert retry.data == first.data
+        assert retry["Idempotent-Replayed"] == "true"
+        assert Transaction.objects.filter(customer=customer).count() == 1
+
+    def test_key_reused_with_other_body(
+        self, api_client, customer_factory, async_create
+    ):
+        api_client.force_authenticate(user=customer_factory(is_verified=True).user)
+        api_client.post(
+            self.url, {"amount": "25.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-2"
+        )
+        response = api_client.post(
+            self.url, {"amount": "30.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-2"
+        )
+        assert response.status_code == 422
+
+    def test_keys_are_scoped_per_user(
+        self, api_client, customer_factory, async_create
+    ):
+        first = customer_factory(is_verified=True)
+        second = customer_factory(
+            username="second", email="second@cloud.com", is_verified=True
+        )
+        for customer in (first, second):
+            api_client.force_authenticate(user=customer.user)
+            response = api_client.post(
+                self.url, {"amount": "25.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-3"
+            )
+            assert response.status_code == 202
+        assert Transaction.objects.count() == 2
+
+    def test_in_flight_duplicate_times_out(
+        self, api_client, customer_factory, async_create, settings
+    ):
+        settings.IDEMPOTENCY_WAIT_TIMEOUT = 0.1
+        customer = customer_factory(is_verified=True)
+        api_client.force_authenticate(user=customer.user)
+        lock = cache.lock(f"idempotency:transaction:{customer.user.id}:k-4:lock")
+        lock.acquire()
+
+        response = api_client.post(
+            self.url, {"amount": "25.00"}, format="json", HTTP_IDEMPOTENCY_KEY="k-4"
+        )
+        lock.release()
+        assert response.status_code == 409
+        assert not Transaction.objects.exists()
+
+
+def test_concurrent_duplicates_share_one_run():
+    calls = []
+
+    def handler():
+        calls.append(1)
+        time.sleep(0.2)
+        return 201, {"merchant_order_id": "ORD-1"}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(run_idempotent("t", "k", "fp", handler))
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, _, replayed in results) == [False, True, True]
+
+
+def test_server_errors_are_not_stored():
+    assert run_idempotent("t", "k-5", "fp", lambda: (503, {}))[0] == 503
+    assert run_idempotent("t", "k-5", "fp", lambda: (201, {}))[:2] == (201, {})
+    with pytest.raises(IdempotencyError):
+        run_idempotent("t", "", "fp", lambda: (201, {}))
@@ -0,0 +1,213 @@
+import pytest
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.urls import reverse
+from ..models import Transaction, TransactionRollupDelta, WebhookEvent
+from ..services.inbox import (
+    DRAIN_SCHEDULED_KEY,
+    append_webhook_event,
+    drain_webhook_inbox,
+)
+
+
+@pytest.fixture
+def pending_transaction(customer_factory):
+    customer = customer_factory()
+
+    def create(**kwargs):
+        return Transaction.objects.create(
+            customer=customer,
+            amount=100,
+            order_id="order-1",
+            state=Transaction.TransactionState.PENDING,
+            **kwargs,
+        )
+
+    return create
+
+
+@pytest.fixture(autouse=True)
+def no_celery(mocker):
+    mocker.patch("zoolflow.transactions.tasks.drain_webhook_inbox_task.apply_async")
+    mocker.patch.object(db_transaction, "on_commit", lambda func: func())
+    return mocker.patch(
+        "zoolflow.notifications.tasks.transaction_state_email_task.delay"
+    )
+
+
+def _event(transaction, transaction_id, **flags):
+    return {"id": transaction_id, "success": True, **flags}
+
+
+@pytest.mark.django_db
+class TestWebhookInbox:
+    def test_append_only_persists(self, pending_transaction, mocker):
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state"
+        )
+        tx = pending_transaction()
+        append_webhook_event(_event(tx, 77), tx.merchant_order_id, 77)
+        assert WebhookEvent.objects.filter(transaction_id="77").exists()
+        assert not lookup.called
+        tx.refresh_from_db()
+        assert tx.state == Transaction.TransactionState.PENDING
+
+    def test_drain_dedupes_and_bulk_updates(self, pending_transaction, mocker, no_celery):
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state",
+            return_value=Transaction.TransactionState.SUCCEEDED,
+        )
+        first, second = pending_transaction(), pending_transaction()
+        # PayMob retried the first callback
+        append_webhook_event(_event(first, 11), first.merchant_order_id, 11)
+        append_webhook_event(_event(first, 11), first.merchant_order_id, 11)
+        append_webhook_event(_event(second, 12), second.merchant_order_id, 12)
+
+        assert drain_webhook_inbox() == 3
+        assert lookup.call_count == 2
+        first.refresh_from_db()
+        assert first.state == Transaction.TransactionState.SUCCEEDED
+        assert first.transaction_id == "11"
+        assert no_celery.call_count == 2
+        assert not WebhookEvent.objects.filter(
+            status=WebhookEvent.EventStatus.RECEIVED
+        ).exists()
+
+    def test_time_budget_leaves_the_rest_for_another_drain(
+        self, pending_transaction, mocker
+    ):
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state",
+            return_value=Transaction.TransactionState.SUCCEEDED,
+        )
+        first, second = pending_transaction(), pending_transaction()
+        append_webhook_event(_event(first, 51), first.merchant_order_id, 51)
+        append_webhook_event(_event(second, 52), second.merchant_order_id, 52)
+        cache.delete(DRAIN_SCHEDULED_KEY)
+        # deadline, first event, then the budget is spent
+        clock = iter([0, 0, 100, 100])
+        mocker.patch(
+            "zoolflow.transactions.services.inbox.time",
+            monotonic=lambda: next(clock),
+        )
+        schedule = mocker.patch(
+            "zoolflow.transactions.tasks.drain_webhook_inbox_task.apply_async"
+        )
+
+        assert drain_webhook_inbox(time_budget=10) == 1
+        assert lookup.call_count == 1
+        event = WebhookEvent.objects.get(transaction_id="52")
+        assert event.status == WebhookEvent.EventStatus.RECEIVED
+        assert event.attempts == 0
+        assert schedule.called
+
+    def test_provider_failure_kept_for_retry(self, pending_transaction, mocker):
+        from ..services.paymob import ProviderServiceError
+
+        mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state",
+            side_effect=ProviderServiceError("provider API fail"),
+        )
+        tx = pending_transaction()
+        append_webhook_event(_event(tx, 21), tx.merchant_order_id, 21)
+        assert drain_webhook_inbox() == 0
+        event = WebhookEvent.objects.get(transaction_id="21")
+        assert event.status == WebhookEvent.EventStatus.RECEIVED
+        assert event.attempts == 1
+
+
+def _flags(**overrides):
+    flags = {
+        "error_occured": False,
+        "is_refunded": False,
+        "is_voided": False,
+        "success": True,
+        "is_capture": False,
+        "is_auth": False,
+        "is_standalone_payment": True,
+        "pending": False,
+    }
+    return {**flags, **overrides}
+
+
+@pytest.mark.django_db
+class TestTrustedPayload:
+    def test_state_from_verified_payload(self, pending_transaction, mocker):
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state"
+        )
+        tx = pending_transaction()
+        append_webhook_event(_event(tx, 31, **_flags()), tx.merchant_order_id, 31)
+        assert drain_webhook_inbox() == 1
+        assert not lookup.called
+        tx.refresh_from_db()
+        assert tx.state == Transaction.TransactionState.SUCCEEDED
+
+    def test_retry_after_decline_in_one_batch(self, pending_transaction, no_celery):
+        tx = pending_transaction()
+        declined = _event(tx, 61, **_flags(success=False))
+        append_webhook_event(declined, tx.merchant_order_id, 61)
+        append_webhook_event(_event(tx, 62, **_flags()), tx.merchant_order_id, 62)
+
+        assert drain_webhook_inbox() == 2
+        tx.refresh_from_db()
+        assert (tx.state, tx.transaction_id) == (
+            Transaction.TransactionState.SUCCEEDED,
+            "62",
+        )
+        # one move of the row, counted once in the rollups
+        delta = TransactionRollupDelta.objects.get()
+        assert (delta.from_state, delta.to_state) == (
+            Transaction.TransactionState.PENDING,
+            Transaction.TransactionState.SUCCEEDED,
+        )
+        assert no_celery.call_count == 1
+
+    def test_cross_check_prefers_provider(self, pending_transaction, mocker, settings):
+        settings.PAYMOB_WEBHOOK_CROSS_CHECK_RATE = 1.0
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state",
+            return_value=Transaction.TransactionState.REFUNDED,
+        )
+        tx = pending_transaction()
+        append_webhook_event(_event(tx, 32, **_flags()), tx.merchant_order_id, 32)
+        drain_webhook_inbox()
+        assert lookup.called
+        tx.refresh_from_db()
+        assert tx.state == Transaction.TransactionState.REFUNDED
+
+    def test_untrusted_mode_fetches(self, pending_transaction, mocker, settings):
+        settings.PAYMOB_WEBHOOK_TRUST_PAYLOAD = False
+        lookup = mocker.patch(
+            "zoolflow.transactions.services.inbox.TransactionOrchestrationService.transaction_current_state",
+            return_value=Transaction.TransactionState.FAILED,
+        )
+        tx = pending_transaction()
+        append_webhook_event(_event(tx, 33, **_flags()), tx.merchant_order_id, 33)
+        drain_webhook_inbox()
+        lookup.assert_called_once_with("33")
+
+
+@pytest.mark.django_db
+class TestWebhookDedupe:
+    def test_redelivery_skips_database(self, pending_transaction, api_client, mocker):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        mocker.patch("zoolflow.transactions.views.WebhookService.verify_paymob_hmac")
+        tx = pending_transaction()
+        body = {
+            "obj": {"id": 41, "order": {"merchant_order_id": tx.merchant_order_id}}
+        }
+        url = reverse("transactions:transaction_webhook") + "?hmac=abc123"
+
+        assert api_client.post(url, body, format="json").status_code == 200
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.post(url, body, format="json")
+        assert response.data == {"Webhook": "Duplicate delivery ignored."}
+        assert len(queries) == 0
+        assert WebhookEvent.objects.filter(transaction_id="41").count() == 1
+
+        # same transaction with new flags is a new callback
+        api_client.post(url.replace("abc123", "def456"), body, format="json")
+        assert WebhookEvent.objects.filter(transaction_id="41").count() == 2
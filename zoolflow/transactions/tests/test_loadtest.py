@@ -0,0 +1,55 @@
+import json
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from zoolflow.users.signals import initiate_verification_code
+from ..loadtest import EndpointStats, LoadTest, percentile
+
+
+@pytest.fixture
+def verification_mail():
+    # sign-ups need their code mailed, fixtures of other apps may have
+    # left the signal disconnected
+    post_save.connect(initiate_verification_code, sender=get_user_model())
+
+
+def test_percentile_nearest_rank():
+    values = [float(n) for n in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 95) == 0.0
+
+
+def test_endpoint_stats_report():
+    stats = EndpointStats()
+    stats.record("sign-up", 0.010, 201, 8)
+    stats.record("sign-up", 0.030, 429, 2)
+
+    row = stats.report(elapsed=2)["sign-up"]
+    assert row["requests"] == 2
+    assert row["errors"] == 1
+    assert row["rps"] == 1.0
+    assert row["p99_ms"] == 30.0
+    assert row["queries_per_request"] == 5.0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_full_flow_against_emulators(verification_mail):
+    # sqlite test database, one writer at a time
+    report = LoadTest(users=2, concurrency=1).run()
+
+    assert report["failures"] == []
+    assert report["completed"] == 2
+    for endpoint in ("sign-up", "verify-code/validate", "kyc upload", "webhook"):
+        assert report["endpoints"][endpoint]["requests"] == 2
+        assert report["endpoints"][endpoint]["errors"] == 0
+    assert report["paymob_emulator"]["transactions"] == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_loadtest_command_writes_report(verification_mail, tmp_path):
+    path = tmp_path / "report.json"
+    call_command("loadtest", users=1, concurrency=1, json_path=str(path), stdout=None)
+
+    assert json.loads(path.read_text())["completed"] == 1
@@ -1,6 +1,16 @@
 import pytest
+from datetime import timedelta
 from django.db import transaction as db_transaction
-from ..services.orchestration import TransactionOrchestrationService as tos
+from django.urls import reverse
+from django.utils import timezone
+from zoolflow.customers.services.helpers import billing_snapshot
+from ..models import Transaction
+from ..services.orchestration import (
+    TransactionOrchestrationService as tos,
+    TransactionOrchestrationServiceError,
+)
+from ..services.payloads import order_payload, payment_token_payload
+from ..services.paymob import ProviderServiceError
 
 
 @pytest.mark.django_db
@@ -30,3 +40,231 @@ def test_orchestration_transaction(mocker, customer_factory):
     assert transaction.customer == customer
     assert transaction.order_id == "paymob-id2232"
     assert transaction.payment_token == "test-paymob-token-in-transaction-creation"
+
+
+@pytest.mark.django_db
+def test_orchestration_transaction_asynchronous(mocker, customer_factory):
+    customer = customer_factory()
+    mock_paymob = mocker.patch(
+        "zoolflow.transactions.services.orchestration.PayMobClient",
+    )
+    mock_task = mocker.patch(
+        "zoolflow.transactions.tasks.interact_with_provider_task.delay",
+    )
+    mocker.patch.object(
+        db_transaction,
+        "on_commit",
+        lambda func: func(),
+    )
+    # provider is not reached on the request thread
+    transaction = tos(customer=customer).create_transaction(
+        {"amount": 100.22}, asynchronous=True
+    )
+    assert not mock_paymob.called
+    mock_task.assert_called_once_with(transaction.id)
+    assert transaction.state == transaction.TransactionState.INITIATED
+
+    # the provider worker moves it to pending
+    instance = mock_paymob.return_value
+    instance.create_order.return_value = "paymob-id2232"
+    instance.payment_key_token.return_value = "async-payment-token"
+    state = tos.process_provider_steps(transaction.id)
+    transaction.refresh_from_db()
+    assert state == transaction.TransactionState.PENDING
+    assert transaction.payment_token == "async-payment-token"
+
+    # a redelivered task doesn't talk to the provider again
+    tos.process_provider_steps(transaction.id)
+    assert instance.create_order.call_count == 1
+
+
+@pytest.mark.django_db
+def test_billing_snapshot_frozen_on_transaction(
+    mocker, customer_factory, django_assert_num_queries
+):
+    customer = customer_factory()
+    mocker.patch("zoolflow.transactions.tasks.interact_with_provider_task.delay")
+    transaction = tos(customer=customer).create_transaction(
+        {"amount": 100.22}, asynchronous=True
+    )
+    assert transaction.billing_snapshot["currency"] == "EGP"
+
+    # later profile edits don't change what a retried provider call sends
+    customer.addresses.update(city="Alexandria")
+    transaction.refresh_from_db()
+    with django_assert_num_queries(0):
+        order = order_payload(10022, "token", "ORD-1", transaction.billing_snapshot)
+        key = payment_token_payload(
+            10022, "token", "order-1", transaction.billing_snapshot
+        )
+    assert order["currency"] == key["currency"] == "EGP"
+    assert key["billing_data"]["email"] == customer.user.email
+    assert key["billing_data"]["city"] == "NA"
+    assert key["billing_data"]["shipping_method"] == "PKG"
+
+
+@pytest.mark.django_db
+def test_billing_snapshot_single_query(customer_factory, django_assert_num_queries):
+    customer = customer_factory(username="Billing", email="billing009@gmail.com")
+    with django_assert_num_queries(1):
+        snapshot = billing_snapshot(customer.id)
+    assert snapshot["currency"] == "EGP"
+    assert snapshot["billing_data"]["email"] == "billing009@gmail.com"
+    assert snapshot["billing_data"]["country"] == "Egypt"
+
+
+@pytest.mark.django_db
+def test_unsupported_country_rejected_before_create(customer_factory):
+    customer = customer_factory(country="SD")
+    with pytest.raises(TransactionOrchestrationServiceError):
+        tos(customer=customer).create_transaction({"amount": 10}, asynchronous=True)
+    assert not customer.customer_transaction.exists()
+
+
+@pytest.fixture
+def failing_key(mocker):
+    """PayMob client whose order succeeds and payment key fails once"""
+    mocker.patch("zoolflow.transactions.tasks.interact_with_provider_task.delay")
+    instance = mocker.patch(
+        "zoolflow.transactions.services.orchestration.PayMobClient",
+    ).return_value
+    instance.create_order.return_value = 4242
+    instance.payment_key_token.side_effect = [
+        ProviderServiceError("provider API fail"),
+        "resumed-token",
+    ]
+    return instance
+
+
+@pytest.mark.django_db
+def test_failed_step_keeps_order_checkpoint(failing_key, customer_factory):
+    transaction = tos(customer=customer_factory()).create_transaction(
+        {"amount": 10}, asynchronous=True
+    )
+    with pytest.raises(TransactionOrchestrationServiceError) as e:
+        tos.process_provider_steps(transaction.id)
+    assert e.value.merchant_order_id == transaction.merchant_order_id
+
+    transaction.refresh_from_db()
+    assert transaction.state == transaction.TransactionState.INITIATED
+    assert transaction.order_id == "4242"
+    assert transaction.checkpoint == Transaction.Checkpoint.ORDER_CREATED
+
+    # the retry resumes at the payment key with the stored order
+    state = tos.process_provider_steps(transaction.id)
+    transaction.refresh_from_db()
+    assert state == transaction.TransactionState.PENDING
+    assert transaction.checkpoint == Transaction.Checkpoint.KEY_ISSUED
+    assert transaction.payment_token == "resumed-token"
+    assert transaction.payment_token_expires_at > timezone.now()
+    assert failing_key.create_order.call_count == 1
+    failing_key.payment_key_token.assert_called_with(order_id="4242")
+
+
+@pytest.mark.django_db
+def test_retry_endpoint(failing_key, api_client, customer_factory):
+    customer = customer_factory(is_verified=True)
+    transaction = tos(customer=customer).create_transaction(
+        {"amount": 10}, asynchronous=True
+    )
+    api_client.force_authenticate(user=customer.user)
+    url = reverse(
+        "transactions:transaction-retry", args=[transaction.merchant_order_id]
+    )
+
+    response = api_client.post(url)
+    assert response.status_code == 400
+    assert response.data["merchant_order_id"] == transaction.merchant_order_id
+
+    response = api_client.post(url)
+    assert response.status_code == 200
+    assert response.data["state"] == transaction.TransactionState.PENDING
+    assert failing_key.create_order.call_count == 1
+
+    # nothing left to resume
+    assert api_client.post(url).status_code == 409
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("route", ["transaction-detail", "transaction-status"])
+def test_detail_routes_take_id_or_merchant_order_id(
+    api_client, customer_factory, route
+):
+    customer = customer_factory(is_verified=True)
+    transaction = Transaction.objects.create(customer=customer, amount=10)
+    api_client.force_authenticate(user=customer.user)
+
+    for lookup in (transaction.id, transaction.merchant_order_id):
+        response = api_client.get(reverse(f"transactions:{route}", args=[lookup]))
+        assert response.status_code == 200
+        assert response.data["merchant_order_id"] == transaction.merchant_order_id
+    missing = reverse(f"transactions:{route}", args=[transaction.id + 1])
+    assert api_client.get(missing).status_code == 404
+
+
+@pytest.fixture
+def pending_transaction(customer_factory):
+    def create(expires_in, **kwargs):
+        return Transaction.objects.create(
+            customer=customer_factory(is_verified=True),
+            amount=10,
+            state=Transaction.TransactionState.PENDING,
+            order_id="4242",
+            payment_token="stored-token",
+            payment_token_expires_at=timezone.now() + timedelta(seconds=expires_in),
+            **kwargs,
+        )
+
+    return create
+
+
+def pay(api_client, transaction):
+    api_client.force_authenticate(user=transaction.customer.user)
+    return api_client.post(
+        reverse("transactions:transaction-pay", args=[transaction.merchant_order_id])
+    )
+
+
+@pytest.mark.django_db
+class TestResumePayment:
+    @pytest.fixture
+    def provider(self, mocker):
+        provider = mocker.patch(
+            "zoolflow.transactions.services.orchestration.PayMobClient",
+        ).return_value
+        provider.payment_key_token.return_value = "reissued-token"
+        return provider
+
+    def test_valid_key_is_reused(self, api_client, pending_transaction, provider):
+        transaction = pending_transaction(60 * 30)
+
+        response = pay(api_client, transaction)
+
+        assert response.status_code == 200
+        assert response.data["payment_token"] == "stored-token"
+        assert not provider.payment_key_token.called
+
+    def test_expired_key_is_reissued_for_the_order(
+        self, api_client, pending_transaction, provider
+    ):
+        # inside PAYMOB_PAYMENT_KEY_MIN_LIFETIME counts as expired
+        transaction = pending_transaction(60)
+
+        response = pay(api_client, transaction)
+
+        assert response.status_code == 200
+        assert response.data["payment_token"] == "reissued-token"
+        provider.payment_key_token.assert_called_once_with(order_id="4242")
+        assert not provider.create_order.called
+        transaction.refresh_from_db()
+        assert transaction.payment_token == "reissued-token"
+        assert transaction.payment_token_expires_at > timezone.now() + timedelta(
+            minutes=30
+        )
+
+    def test_only_pending_transactions(self, api_client, pending_transaction):
+        transaction = pending_transaction(60 * 30, transaction_id="77")
+        Transaction.objects.filter(id=transaction.id).update(
+            state=Transaction.TransactionState.SUCCEEDED
+        )
+        assert pay(api_client, transaction).status_code == 409
@@ -0,0 +1,56 @@
+import pytest
+from django.urls import reverse
+from ..models import Transaction
+
+
+@pytest.fixture
+def customer_with_transactions(customer_factory):
+    customer = customer_factory()
+    Transaction.objects.bulk_create(
+        [Transaction(customer=customer, amount=10 + i) for i in range(25)]
+    )
+    # another customer's rows never leak into the pages
+    other = customer_factory(username="other", email="other@cloud.com")
+    Transaction.objects.create(customer=other, amount=5)
+    return customer
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+    def test_walk_forward_and_back(
+        self, api_client, customer_with_transactions, django_assert_max_num_queries
+    ):
+        api_client.force_authenticate(user=customer_with_transactions.user)
+        url = reverse("transactions:transaction-list") + "?pagination=cursor"
+
+        seen, pages = [], []
+        while url:
+            with django_assert_max_num_queries(4):
+                response = api_client.get(url)
+            assert response.status_code == 200
+            assert "count" not in response.data
+            pages.append(response.data)
+            seen += [row["merchant_order_id"] for row in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(
+            Transaction.objects.filter(customer=customer_with_transactions)
+            .order_by("-created_at", "-id")
+            .values_list("merchant_order_id", flat=True)
+        )
+        assert seen == expected
+        assert [len(page["results"]) for page in pages] == [10, 10, 5]
+        assert pages[0]["previous"] is None
+
+        back = api_client.get(pages[2]["previous"]).data
+        assert back["results"] == pages[1]["results"]
+
+    def test_invalid_cursor(self, api_client, customer_with_transactions):
+        api_client.force_authenticate(user=customer_with_transactions.user)
+        url = reverse("transactions:transaction-list") + "?cursor=not-a-cursor"
+        assert api_client.get(url).status_code == 404
+
+    def test_page_number_stays_default(self, api_client, customer_with_transactions):
+        api_client.force_authenticate(user=customer_with_transactions.user)
+        response = api_client.get(reverse("transactions:transaction-list"))
+        assert response.data["count"] == 25
@@ -0,0 +1,65 @@
+import asyncio
+import httpx
+import pytest
+from ..services.paymob import ProviderServiceError
+from ..services.paymob_async import AsyncPayMobClient
+from ..services.orchestration import TransactionOrchestrationService as tos
+
+
+def _client_with(handler):
+    async def build():
+        paymob = AsyncPayMobClient()
+        paymob.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return paymob
+
+    return asyncio.run(build())
+
+
+class TestAsyncPayMobClient:
+    def test_request_field(self):
+        paymob = _client_with(
+            lambda request: httpx.Response(200, json={"request_field": "success"})
+        )
+        result = asyncio.run(
+            paymob._request_field(
+                payload={"fake": "data"},
+                endpoint="http://fake.paymob/api",
+                requested_field="request_field",
+                field_name="testcase",
+            )
+        )
+        assert result == "success"
+
+    @pytest.mark.parametrize(
+        "status_code,body",
+        [(200, {}), (400, {"detail": "bad request"})],
+    )
+    def test_request_field_fail(self, status_code, body):
+        paymob = _client_with(lambda request: httpx.Response(status_code, json=body))
+        with pytest.raises(ProviderServiceError):
+            asyncio.run(
+                paymob._request_field(
+                    payload={"fake": "data"},
+                    endpoint="http://fake.paymob/api",
+                    requested_field="not_found",
+                    field_name="testfield",
+                )
+            )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_orchestration_transaction(mocker, customer_factory):
+    customer = customer_factory()
+    mock_paymob = mocker.patch(
+        "zoolflow.transactions.services.orchestration.AsyncPayMobClient",
+    )
+    instance = mock_paymob.return_value
+    instance.create_order = mocker.AsyncMock(return_value="paymob-async-id")
+    instance.payment_key_token = mocker.AsyncMock(return_value="async-token")
+
+    transaction = asyncio.run(
+        tos(customer=customer).acreate_transaction({"amount": 100.22})
+    )
+    assert transaction.order_id == "paymob-async-id"
+    assert transaction.payment_token == "async-token"
+    assert transaction.state == transaction.TransactionState.PENDING
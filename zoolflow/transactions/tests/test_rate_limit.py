@@ -0,0 +1,126 @@
+import pytest
+import requests
+from ..services.paymob import (
+    PayMobClient,
+    ProviderServiceError,
+    ProviderUnavailableError,
+    paymob_limiter,
+)
+from ..services.rate_limit import (
+    BACKGROUND,
+    LIVE,
+    RateLimitedError,
+    TokenBucketLimiter,
+)
+from ..services.retry import Deadline
+
+LIMITS = {
+    "test": {"RATE": 0.1, "BURST": 4, "BACKGROUND_RESERVE": 0.5, "MAX_WAIT": 1},
+    "fast": {"RATE": 50, "BURST": 1, "MAX_WAIT": 1},
+}
+
+
+@pytest.fixture
+def limiter(settings):
+    settings.TEST_RATE_LIMITS = LIMITS
+    limiter = TokenBucketLimiter("test")
+    limiter.reset()
+    yield limiter
+    limiter.reset()
+
+
+def drain(limiter, bucket, priority=LIVE):
+    """Number of tokens taken before the bucket refuses"""
+    taken = 0
+    while True:
+        try:
+            limiter.acquire(bucket, priority)
+        except RateLimitedError as e:
+            return taken, e
+        taken += 1
+
+
+class TestTokenBucketLimiter:
+    def test_burst_then_refuse(self, limiter):
+        taken, error = drain(limiter, "test")
+        assert taken == 4
+        # one token every 10 seconds, more than MAX_WAIT
+        assert 1 <= error.retry_after <= 10
+
+    def test_background_leaves_a_reserve(self, limiter):
+        taken, _ = drain(limiter, "test", BACKGROUND)
+        assert taken == 2
+        # live checkouts still get the rest
+        taken, _ = drain(limiter, "test", LIVE)
+        assert taken == 2
+
+    def test_waits_for_a_token(self, limiter):
+        limiter.acquire("fast")
+        # the next token comes within 20ms
+        limiter.acquire("fast")
+
+    def test_wait_is_capped_by_the_deadline(self, limiter):
+        limiter.acquire("fast")
+        with pytest.raises(RateLimitedError):
+            limiter.acquire("fast", deadline=Deadline(0))
+
+    def test_pause(self, limiter):
+        limiter.pause("fast", 5)
+        with pytest.raises(RateLimitedError) as e:
+            limiter.acquire("fast")
+        assert e.value.retry_after == 5
+
+    def test_unconfigured_buckets_are_not_limited(self, limiter):
+        for _ in range(10):
+            limiter.acquire("other")
+
+    def test_redis_down_lets_calls_through(self, limiter, mocker):
+        from redis.exceptions import ConnectionError
+
+        broken = mocker.Mock()
+        broken.eval.side_effect = ConnectionError("redis down")
+        mocker.patch.object(TokenBucketLimiter, "redis", broken)
+        for _ in range(10):
+            limiter.acquire("test")
+
+
+@pytest.mark.django_db
+class TestPayMobRateLimit:
+    @pytest.fixture(autouse=True)
+    def limits(self, settings):
+        settings.PAYMOB_RATE_LIMITS = {
+            "lookup": {"RATE": 0.1, "BURST": 1, "MAX_WAIT": 0.5},
+        }
+        paymob_limiter.reset()
+        yield
+        paymob_limiter.reset()
+
+    def test_limited_call_skips_the_network(self, mocker):
+        mocker.patch.object(PayMobClient, "_get_auth_token", return_value="tk")
+        get = mocker.patch.object(requests.Session, "get")
+        get.return_value.status_code = 200
+        get.return_value.content = b"{}"
+        PayMobClient().get_transaction_flags(1)
+
+        with pytest.raises(ProviderUnavailableError) as e:
+            PayMobClient().get_transaction_flags(2)
+        assert get.call_count == 1
+        assert e.value.details == "Provider rate limited"
+        assert e.value.retry_after
+
+    def test_too_many_requests_pauses_every_worker(self, mocker, settings):
+        settings.PAYMOB_RATE_LIMITS = {
+            "lookup": {"RATE": 100, "BURST": 100, "MAX_WAIT": 0.5},
+        }
+        mocker.patch.object(PayMobClient, "_get_auth_token", return_value="tk")
+        answer = requests.Response()
+        answer.status_code = 429
+        answer.headers["Retry-After"] = "30"
+        post = mocker.patch.object(requests.Session, "post", return_value=answer)
+
+        with pytest.raises(ProviderServiceError):
+            PayMobClient().inquire_order_transaction("order-1")
+        # the Retry-After is past the deadline, nobody asks again meanwhile
+        with pytest.raises(ProviderUnavailableError):
+            PayMobClient().inquire_order_transaction("order-2")
+        assert post.call_count == 1
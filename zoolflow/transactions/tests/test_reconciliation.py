@@ -0,0 +1,122 @@
+import pytest
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from ..models import Transaction
+from ..services.reconciliation import (
+    RECONCILE_CURSOR_KEY,
+    reconcile_stuck_transactions,
+)
+
+STATE = Transaction.TransactionState
+LOOKUP = "zoolflow.transactions.services.reconciliation.TransactionOrchestrationService.transaction_current_state"
+INQUIRY = "zoolflow.transactions.services.reconciliation.PayMobClient.inquire_order_transaction"
+
+
+@pytest.fixture
+def stuck_transaction(customer_factory):
+    customer = customer_factory()
+
+    def create(age, **kwargs):
+        tx = Transaction.objects.create(customer=customer, amount=100, **kwargs)
+        Transaction.objects.filter(id=tx.id).update(
+            created_at=timezone.now() - timedelta(seconds=age)
+        )
+        tx.refresh_from_db()
+        return tx
+
+    return create
+
+
+@pytest.fixture(autouse=True)
+def no_mail(mocker):
+    mocker.patch.object(db_transaction, "on_commit", lambda func: func())
+    return mocker.patch(
+        "zoolflow.notifications.tasks.transaction_state_email_task.delay"
+    )
+
+
+def _flags(success):
+    return {
+        "id": 9001,
+        "error_occured": False,
+        "is_refunded": False,
+        "is_voided": False,
+        "success": success,
+        "is_capture": False,
+        "is_auth": False,
+        "is_standalone_payment": True,
+        "pending": False,
+    }
+
+
+@pytest.mark.django_db
+class TestReconciliation:
+    def test_resolves_stuck_rows(self, stuck_transaction, mocker, no_mail):
+        mocker.patch(LOOKUP, return_value=STATE.SUCCEEDED)
+        orders = {"paid-order": _flags(True), "open-order": None, "old-order": None}
+        mocker.patch(INQUIRY, side_effect=orders.get)
+        hour, day = 60 * 60, 60 * 60 * 24
+        with_id = stuck_transaction(hour, state=STATE.PENDING, transaction_id="77")
+        paid = stuck_transaction(hour, state=STATE.PENDING, order_id="paid-order")
+        still_open = stuck_transaction(
+            hour, state=STATE.PENDING, order_id="open-order"
+        )
+        abandoned = stuck_transaction(
+            2 * day, state=STATE.PENDING, order_id="old-order"
+        )
+        initiated = stuck_transaction(hour, state=STATE.INITIATED)
+        fresh = stuck_transaction(60, state=STATE.PENDING, transaction_id="78")
+
+        report = reconcile_stuck_transactions(chunk_size=2, rate=1000)
+
+        assert report == {"scanned": 5, "updated": 4, "errors": 0, "finished": True}
+        states = dict(Transaction.objects.values_list("id", "state"))
+        assert states[with_id.id] == STATE.SUCCEEDED
+        assert states[paid.id] == STATE.SUCCEEDED
+        assert states[still_open.id] == STATE.PENDING
+        assert states[abandoned.id] == STATE.FAILED
+        assert states[initiated.id] == STATE.FAILED
+        assert states[fresh.id] == STATE.PENDING
+        paid.refresh_from_db()
+        assert paid.transaction_id == "9001"
+        # only rows with a provider transaction get mailed
+        assert no_mail.call_count == 2
+
+    def test_time_budget_resumes_from_cursor(self, stuck_transaction, mocker):
+        lookup = mocker.patch(LOOKUP, return_value=STATE.FAILED)
+        rows = [
+            stuck_transaction(3600, state=STATE.PENDING, transaction_id=str(i))
+            for i in range(4)
+        ]
+        # one provider call per 0.2s, budget for the first two only
+        report = reconcile_stuck_transactions(rate=5, time_budget=0.3, concurrency=2)
+        assert report["finished"] is False
+        assert report["scanned"] == 2
+        assert cache.get(RECONCILE_CURSOR_KEY) == rows[1].id
+
+        report = reconcile_stuck_transactions(rate=1000)
+        assert report["finished"] is True
+        assert lookup.call_count == 4
+        assert cache.get(RECONCILE_CURSOR_KEY) == 0
+
+    def test_resumes_recent_initiated_rows(self, stuck_transaction, mocker):
+        provider = mocker.patch(
+            "zoolflow.transactions.services.orchestration.PayMobClient"
+        ).return_value
+        provider.payment_key_token.return_value = "resumed-token"
+        tx = stuck_transaction(
+            60 * 35,
+            state=STATE.INITIATED,
+            order_id="4242",
+            checkpoint=Transaction.Checkpoint.ORDER_CREATED,
+        )
+
+        report = reconcile_stuck_transactions(rate=1000)
+
+        assert report["errors"] == 0
+        tx.refresh_from_db()
+        assert tx.state == STATE.PENDING
+        assert tx.payment_token == "resumed-token"
+        assert not provider.create_order.called
@@ -0,0 +1,127 @@
+import pytest
+import requests
+from ..services import retry
+from ..services.paymob import PayMobClient, ProviderServiceError
+from ..services.retry import (
+    Deadline,
+    DeadlineExceeded,
+    RetryPolicy,
+    call_with_retries,
+    retry_stats,
+)
+
+POLICY = RetryPolicy(attempts=3, backoff=0.1, backoff_cap=1, min_attempt=0.1)
+
+
+def answer(status, headers=None, body=b'{"id": 7, "token": "tk"}'):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return response
+
+
+def sender(*outcomes):
+    """send() returning or raising ``outcomes`` in turn"""
+    outcomes = list(outcomes)
+
+    def send():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if outcome.status_code >= 500 or outcome.status_code == 429:
+            outcome.raise_for_status()
+        return outcome
+
+    return send
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    retry_stats.reset()
+    return mocker.patch.object(retry.time, "sleep")
+
+
+class TestCallWithRetries:
+    def test_idempotent_retries_server_errors(self, no_sleep):
+        send = sender(answer(503), requests.ReadTimeout("slow"), answer(200))
+        response = call_with_retries(send, "op", Deadline(5), True, POLICY)
+
+        assert response.status_code == 200
+        assert no_sleep.call_count == 2
+        stats = retry_stats.snapshot()["op"]
+        assert stats["attempts"] == 3 and stats["retries"] == 2
+        assert stats["failed"] == 0
+
+    def test_non_idempotent_keeps_ambiguous_failures(self):
+        with pytest.raises(requests.HTTPError):
+            call_with_retries(sender(answer(503)), "op", Deadline(5), False, POLICY)
+        with pytest.raises(requests.ReadTimeout):
+            call_with_retries(
+                sender(requests.ReadTimeout("slow")), "op", Deadline(5), False, POLICY
+            )
+        stats = retry_stats.snapshot()["op"]
+        assert (stats["attempts"], stats["retries"], stats["failed"]) == (2, 0, 2)
+
+    def test_non_idempotent_retries_what_never_arrived(self):
+        send = sender(requests.ConnectTimeout("connect"), answer(429), answer(201))
+        response = call_with_retries(send, "op", Deadline(5), False, POLICY)
+        assert response.status_code == 201
+
+    def test_retry_after_is_honoured(self, no_sleep):
+        send = sender(answer(429, {"Retry-After": "0.5"}), answer(200))
+        call_with_retries(send, "op", Deadline(5), False, POLICY)
+        no_sleep.assert_called_once_with(0.5)
+
+    def test_retry_after_past_the_deadline_gives_up(self, no_sleep):
+        send = sender(answer(503, {"Retry-After": "30"}), answer(200))
+        with pytest.raises(requests.HTTPError):
+            call_with_retries(send, "op", Deadline(5), True, POLICY)
+        assert not no_sleep.called
+
+    def test_attempts_are_bounded(self):
+        send = sender(answer(502), answer(502), answer(502), answer(200))
+        with pytest.raises(requests.HTTPError):
+            call_with_retries(send, "op", Deadline(5), True, POLICY)
+
+    def test_spent_deadline(self):
+        with pytest.raises(DeadlineExceeded):
+            call_with_retries(sender(answer(200)), "op", Deadline(0), True, POLICY)
+
+    def test_backoff_is_jittered_and_capped(self):
+        waits = [POLICY.wait(retry) for retry in range(10) for _ in range(20)]
+        assert all(0 <= wait <= 1 for wait in waits)
+        assert len(set(waits)) > 1
+
+    def test_timeouts_capped_by_deadline(self):
+        connect, read = Deadline(2).timeout((5, 15))
+        assert connect <= 2 and read <= 2
+        assert Deadline(30).timeout((5, 15)) == (5, 15)
+
+
+@pytest.mark.django_db
+class TestPayMobRetries:
+    @pytest.fixture
+    def post(self, mocker):
+        return mocker.patch.object(requests.Session, "post")
+
+    def client(self):
+        return PayMobClient(amount_cents=100, billing={}, deadline=Deadline(5))
+
+    def test_order_is_not_retried(self, post, mocker):
+        mocker.patch.object(PayMobClient, "_get_auth_token", return_value="tk")
+        mocker.patch("zoolflow.transactions.services.paymob.order_payload")
+        post.side_effect = [answer(503), answer(200)]
+        with pytest.raises(ProviderServiceError):
+            self.client().create_order(merchant_id="ORD-1")
+        assert post.call_count == 1
+
+    def test_payment_key_is_retried(self, post, mocker):
+        mocker.patch.object(PayMobClient, "_get_auth_token", return_value="tk")
+        mocker.patch("zoolflow.transactions.services.paymob.payment_token_payload")
+        post.side_effect = [answer(500), answer(200)]
+        assert self.client().payment_key_token(order_id=7) == "tk"
+        assert post.call_count == 2
+        # the request timeout never outlives the checkout deadline
+        connect, read = post.call_args.kwargs["timeout"]
+        assert read <= 5
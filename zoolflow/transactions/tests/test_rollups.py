@@ -0,0 +1,149 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from ..models import (
+    CustomerTransactionRollup,
+    DailyTransactionRollup,
+    Transaction,
+    TransactionRollupDelta,
+)
+from ..services.orchestration import TransactionOrchestrationService as tos
+from ..services.rollups import (
+    _transaction_writes_paused,
+    fold_rollup_deltas,
+    rebuild_rollups,
+)
+from ..services.state_machine import transition, transition_many
+
+S = Transaction.TransactionState
+URL = reverse("transactions:transaction_analytics")
+
+
+def snapshot():
+    daily = set(
+        DailyTransactionRollup.objects.filter(count__gt=0).values_list(
+            "day", "state", "currency", "count", "amount"
+        )
+    )
+    customers = set(
+        CustomerTransactionRollup.objects.filter(count__gt=0).values_list(
+            "customer_id", "state", "currency", "count", "amount"
+        )
+    )
+    return daily, customers
+
+
+@pytest.fixture
+def transactions(customer_factory, mocker):
+    mocker.patch("zoolflow.transactions.tasks.interact_with_provider_task.delay")
+    first = customer_factory()
+    second = customer_factory(username="second", email="second@cloud.com")
+    rows = [
+        tos(customer=customer).create_transaction(
+            {"amount": amount}, asynchronous=True
+        )
+        for customer, amount in [(first, 10), (first, 20), (second, 30), (second, 5)]
+    ]
+    transition(S.PENDING, id=rows[0].id)
+    transition(S.SUCCEEDED, id=rows[0].id)
+    transition(S.FAILED, id=rows[1].id)
+    pending = Transaction.objects.get(id=rows[2].id)
+    transition_many([(pending, S.PENDING, {})])
+    return rows
+
+
+@pytest.mark.django_db
+class TestRollups:
+    def test_incremental_matches_rebuild(self, transactions):
+        assert TransactionRollupDelta.objects.count() == 8
+        assert fold_rollup_deltas(batch_size=3) == 8
+        assert not TransactionRollupDelta.objects.exists()
+        incremental = snapshot()
+
+        daily, customers = incremental
+        assert {(state, count) for _, state, _, count, _ in daily} == {
+            (S.SUCCEEDED, 1),
+            (S.FAILED, 1),
+            (S.PENDING, 1),
+            (S.INITIATED, 1),
+        }
+        rebuild_rollups()
+        assert snapshot() == incremental
+
+    def test_rejected_transition_records_nothing(self, transactions):
+        fold_rollup_deltas()
+        assert not transition(S.PENDING, id=transactions[0].id)
+        assert not TransactionRollupDelta.objects.exists()
+
+    def test_rebuild_command(self, transactions):
+        call_command("rebuild_transaction_rollups", stdout=None)
+        assert not TransactionRollupDelta.objects.exists()
+        assert DailyTransactionRollup.objects.filter(count__gt=0).count() == 4
+
+    def test_rebuild_locks_tables_on_mysql(self, mocker):
+        connection = mocker.patch(
+            "zoolflow.transactions.services.rollups.connection", vendor="mysql"
+        )
+        with _transaction_writes_paused():
+            pass
+        cursor = connection.cursor.return_value.__enter__.return_value
+        lock, unlock = [call.args[0] for call in cursor.execute.call_args_list]
+        assert lock.startswith("LOCK TABLES transactions_transaction READ")
+        assert "transactions_transactionrollupdelta WRITE" in lock
+        assert unlock == "UNLOCK TABLES"
+
+
+@pytest.mark.django_db
+class TestAnalyticsView:
+    @pytest.fixture
+    def staff_client(self, api_client):
+        staff = get_user_model().objects.create_user(
+            username="analytics",
+            password="Aliahmed091$",
+            email="analytics@cloud.com",
+            role_management=get_user_model().Roles.STAFF,
+        )
+        api_client.force_authenticate(user=staff)
+        return api_client
+
+    def test_totals_per_state(
+        self, staff_client, transactions, django_assert_max_num_queries
+    ):
+        fold_rollup_deltas()
+        with django_assert_max_num_queries(3):
+            response = staff_client.get(URL, {"group_by": "state,currency"})
+        assert response.status_code == 200
+        totals = {row["state"]: row for row in response.data["results"]}
+        assert totals[S.SUCCEEDED]["volume"] == "10.00"
+        assert totals[S.INITIATED]["transactions"] == 1
+        assert {row["currency"] for row in response.data["results"]} == {"EGP"}
+
+    def test_totals_per_customer(self, staff_client, transactions):
+        fold_rollup_deltas()
+        response = staff_client.get(
+            URL, {"group_by": "customer", "state": S.PENDING}
+        )
+        assert response.data["results"] == [
+            {
+                "customer": transactions[2].customer_id,
+                "transactions": 1,
+                "volume": "30.00",
+            }
+        ]
+
+    def test_invalid_grouping(self, staff_client):
+        response = staff_client.get(URL, {"group_by": "day,customer"})
+        assert response.status_code == 400
+
+    def test_date_range_with_customer_grouping(self, staff_client):
+        # the customer rollup has no day, the range can't be applied
+        response = staff_client.get(
+            URL, {"group_by": "customer,state", "date_from": "2026-01-01"}
+        )
+        assert response.status_code == 400
+        assert "Date filters" in str(response.data["non_field_errors"])
+
+    def test_customers_are_refused(self, api_client, customer_factory):
+        api_client.force_authenticate(user=customer_factory().user)
+        assert api_client.get(URL).status_code == 403
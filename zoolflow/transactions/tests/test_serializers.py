@@ -0,0 +1,41 @@
+import pytest
+from rest_framework.renderers import JSONRenderer
+from ..models import Transaction
+from ..serializers import TransactionListSerializer, TransactionSerializer
+
+
+@pytest.mark.django_db
+def test_list_serializer_output_is_identical(customer_factory):
+    customer = customer_factory()
+    states = Transaction.TransactionState.values
+    Transaction.objects.bulk_create(
+        [
+            Transaction(
+                customer=customer,
+                amount=f"{i}.{i % 10}5",
+                state=states[i % len(states)],
+                order_id=str(i) if i % 2 else None,
+                payment_token="token" if i % 3 else None,
+                transaction_id=str(i * 7) if i % 4 else None,
+            )
+            for i in range(1, 20)
+        ]
+    )
+    queryset = Transaction.objects.all()
+    renderer = JSONRenderer()
+
+    expected = renderer.render(TransactionSerializer(queryset, many=True).data)
+    rows = queryset.values(*TransactionListSerializer.columns())
+    assert renderer.render(TransactionListSerializer(rows).data) == expected
+
+
+@pytest.mark.django_db
+def test_benchmark_command(customer_factory):
+    from io import StringIO
+    from django.core.management import call_command
+
+    customer_factory()
+    out = StringIO()
+    call_command("benchmark_list_serializer", rows=50, repeat=1, stdout=out)
+    assert "identical output" in out.getvalue()
+    assert not Transaction.objects.exists()
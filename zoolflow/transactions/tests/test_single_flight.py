@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from django.core.cache import cache
+from ..services.paymob import PayMobClient, flags_flight
+from ..services.single_flight import SingleFlight
+
+
+@pytest.fixture
+def flight(settings):
+    settings.SINGLE_FLIGHTS = {
+        "test": {"RESULT_TTL": 5, "LEASE": 2, "POLL_INTERVAL": 0.01}
+    }
+    return SingleFlight("test")
+
+
+def counted(result=None, delay=0.1, error=None):
+    """Upstream call counting its invocations"""
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(delay)
+        if error:
+            raise error
+        return result
+
+    return call, calls
+
+
+class TestSingleFlight:
+    def test_threads_share_one_call(self, flight):
+        call, calls = counted({"id": 1})
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: flight.do("k", call), range(8)))
+        assert results == [{"id": 1}] * 8
+        assert len(calls) == 1
+        assert flight.snapshot()["upstream"] == 1
+
+    def test_result_is_reused_for_its_ttl(self, flight):
+        call, calls = counted({"id": 1}, delay=0)
+        flight.do("k", call)
+        flight.do("k", call)
+        assert len(calls) == 1
+        assert flight.snapshot()["shared"] == 1
+
+    def test_errors_are_not_kept(self, flight):
+        call, calls = counted(error=ValueError("down"), delay=0)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                flight.do("k", call)
+        assert len(calls) == 2
+
+    def test_waits_for_another_process(self, flight):
+        # another process holds the lease and stores its answer later
+        lease = cache.lock("singleflight:test:k:lease", timeout=2, thread_local=False)
+        assert lease.acquire(blocking=False)
+
+        def other_process():
+            time.sleep(0.1)
+            flight._store("k", {"id": "remote"})
+            lease.release()
+
+        threading.Thread(target=other_process).start()
+        call, calls = counted({"id": "local"})
+        assert flight.do("k", call) == {"id": "remote"}
+        assert not calls
+
+    def test_failed_lease_holder_lets_the_next_call(self, flight):
+        lease = cache.lock("singleflight:test:k:lease", timeout=2, thread_local=False)
+        assert lease.acquire(blocking=False)
+        threading.Timer(0.1, lease.release).start()
+
+        call, calls = counted({"id": "local"}, delay=0)
+        assert flight.do("k", call) == {"id": "local"}
+        assert len(calls) == 1
+
+    def test_async_tasks_share_one_call(self, flight):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return {"id": 1}
+
+        async def main():
+            return await asyncio.gather(*[flight.ado("k", call) for _ in range(5)])
+
+        assert asyncio.run(main()) == [{"id": 1}] * 5
+        assert len(calls) == 1
+
+
+@pytest.mark.django_db
+def test_concurrent_state_lookups_make_one_request(mocker):
+    mocker.patch.object(PayMobClient, "_get_auth_token", return_value="tk")
+    answer = requests.Response()
+    answer.status_code = 200
+    answer._content = b'{"id": 42, "success": true}'
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.1)
+        return answer
+
+    get = mocker.patch.object(requests.Session, "get", side_effect=slow_get)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(lambda _: PayMobClient().get_transaction_flags(42), range(4))
+        )
+    assert all(result["success"] for result in results)
+    assert get.call_count == 1
+    assert flags_flight.snapshot()["calls"] >= 4
@@ -0,0 +1,95 @@
+import pytest
+from ..models import Transaction, TransactionRollupDelta
+from ..services.state_machine import (
+    allowed_sources,
+    can_transition,
+    transition,
+    transition_many,
+)
+
+STATE = Transaction.TransactionState
+
+
+@pytest.fixture
+def make_transaction(customer_factory):
+    customer = customer_factory()
+
+    def create(state, **kwargs):
+        return Transaction.objects.create(
+            customer=customer, amount=100, state=state, **kwargs
+        )
+
+    return create
+
+
+def test_table():
+    assert can_transition(STATE.PENDING, STATE.SUCCEEDED)
+    assert can_transition(STATE.SUCCEEDED, STATE.REFUNDED)
+    assert not can_transition(STATE.FAILED, STATE.SUCCEEDED)
+    assert STATE.INITIATED in allowed_sources(STATE.PENDING)
+    assert STATE.SUCCEEDED not in allowed_sources(STATE.PENDING)
+
+
+@pytest.mark.django_db
+class TestTransition:
+    def test_single_conditional_update(
+        self, make_transaction, django_assert_max_num_queries
+    ):
+        tx = make_transaction(STATE.PENDING)
+        # conditional update, then rollup delta in one savepoint
+        with django_assert_max_num_queries(5) as captured:
+            applied = transition(
+                STATE.SUCCEEDED, fields={"transaction_id": "55"}, id=tx.id
+            )
+        assert applied
+        updates = [q["sql"] for q in captured if q["sql"].startswith("UPDATE")]
+        assert len(updates) == 1 and '"state" = ' in updates[0].split("WHERE")[1]
+        tx.refresh_from_db()
+        assert (tx.state, tx.transaction_id) == (STATE.SUCCEEDED, "55")
+
+    def test_refused_from_terminal_state(self, make_transaction):
+        tx = make_transaction(STATE.FAILED)
+        assert not transition(STATE.SUCCEEDED, id=tx.id)
+        tx.refresh_from_db()
+        assert tx.state == STATE.FAILED
+
+    def test_later_source_states_are_tried(self, make_transaction):
+        tx = make_transaction(STATE.AUTHORIZED)
+        assert transition(STATE.SUCCEEDED, id=tx.id)
+        delta = TransactionRollupDelta.objects.get()
+        assert (delta.from_state, delta.to_state) == (STATE.AUTHORIZED, STATE.SUCCEEDED)
+
+    def test_sources_narrow_the_table(self, make_transaction):
+        tx = make_transaction(STATE.PENDING, order_id="first")
+        assert not transition(
+            STATE.PENDING,
+            sources=[STATE.INITIATED],
+            fields={"order_id": "second"},
+            id=tx.id,
+        )
+        tx.refresh_from_db()
+        assert tx.order_id == "first"
+
+    def test_many_skips_rows_moved_meanwhile(self, make_transaction):
+        first = make_transaction(STATE.PENDING)
+        second = make_transaction(STATE.PENDING)
+        # a webhook wins the race on the second row
+        transition(STATE.SUCCEEDED, id=second.id)
+
+        updated = transition_many(
+            [
+                (first, STATE.FAILED, {"transaction_id": "1"}),
+                (second, STATE.FAILED, {"transaction_id": "2"}),
+            ]
+        )
+        assert updated == [first]
+        assert first.state == STATE.FAILED
+        states = dict(Transaction.objects.values_list("id", "state"))
+        assert states == {first.id: STATE.FAILED, second.id: STATE.SUCCEEDED}
+
+    def test_many_refuses_two_changes_of_one_row(self, make_transaction):
+        tx = make_transaction(STATE.PENDING)
+        with pytest.raises(ValueError):
+            transition_many([(tx, STATE.FAILED, {}), (tx, STATE.SUCCEEDED, {})])
+        tx.refresh_from_db()
+        assert tx.state == STATE.PENDING
@@ -0,0 +1,78 @@
+import threading
+import time
+import pytest
+from django.core.cache import cache
+from ..services.caching import provider_cache
+from ..services.tokens import PayMobTokenManager
+
+
+@pytest.fixture
+def manager():
+    manager = PayMobTokenManager(cache_key="test:paymob:token")
+    manager.invalidate()
+    yield manager
+    manager.invalidate()
+
+
+class TestPayMobTokenManager:
+    def test_warm_token_skips_provider(self, manager, mocker):
+        manager._store("warm-token")
+        fetch = mocker.Mock(return_value="new-token")
+        assert manager.get_token(fetch) == "warm-token"
+        assert not fetch.called
+
+    def test_cold_cache_fetch_once(self, manager, mocker):
+        fetch = mocker.Mock(return_value="cold-token")
+        assert manager.get_token(fetch) == "cold-token"
+        assert manager.get_token(fetch) == "cold-token"
+        assert fetch.call_count == 1
+
+    def test_refresh_ahead_of_expiry(self, manager, mocker):
+        entry = manager._store("old-token")
+        provider_cache.set(
+            manager.cache_key,
+            entry | {"expires_at": time.time() + 1},
+            timeout=manager.lifetime,
+        )
+        background = mocker.patch.object(manager, "_refresh_in_background")
+        # the caller still gets the valid token while refresh starts aside
+        assert manager.get_token(mocker.Mock()) == "old-token"
+        assert background.called
+
+    def test_concurrent_cold_callers_single_flight(self, manager):
+        calls = []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "shared-token"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(manager.get_token(slow_fetch)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ["shared-token"] * 5
+        assert len(calls) == 1
+
+    def test_lock_loser_notified_by_winner(self, manager, mocker):
+        # another process holds the lock and publishes its token
+        other = PayMobTokenManager(cache_key=manager.cache_key)
+        lock = cache.lock(other.lock_key, timeout=15)
+        lock.acquire()
+
+        def winner():
+            time.sleep(0.2)
+            other._store("winner-token")
+            lock.release()
+
+        fetch = mocker.Mock(return_value="loser-token")
+        thread = threading.Thread(target=winner)
+        thread.start()
+        assert manager.get_token(fetch) == "winner-token"
+        thread.join()
+        assert not fetch.called
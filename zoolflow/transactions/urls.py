@@ -1,6 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TransactionViewSet, TransactionView, PayMobWebHookView
+from .views import (
+    PayMobWebHookView,
+    ProviderHealthView,
+    TransactionAnalyticsView,
+    TransactionView,
+    TransactionViewSet,
+)
 
 app_name = "transactions"
 register = DefaultRouter()
@@ -9,5 +15,11 @@ register.register(r"transaction", TransactionViewSet, basename="transaction")
 urlpatterns = [
     path("", include(register.urls)),
     path("webhook/", PayMobWebHookView.as_view(), name="transaction_webhook"),
+    path(
+        "analytics/",
+        TransactionAnalyticsView.as_view(),
+        name="transaction_analytics",
+    ),
+    path("provider-health/", ProviderHealthView.as_view(), name="provider_health"),
     path("testpay-view/", TransactionView.as_view(), name="checkout_view"),
 ]
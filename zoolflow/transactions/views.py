@@ -1,29 +1,85 @@
 import logging
+from django.conf import settings
 from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.response import Response
-from .pagination import TransactionPagination
-from .serializers import TransactionSerializer
-from .models import Transaction
+from .pagination import TransactionCursorPagination, TransactionPagination
+from zoolflow.customers.models import Customer
+from zoolflow.users.permissions import IsAdminOrStaff
+from .serializers import (
+    BulkTransactionSerializer,
+    TransactionAnalyticsQuerySerializer,
+    TransactionListSerializer,
+    TransactionSerializer,
+    TransactionStatusSerializer,
+)
+from .models import (
+    ArchivedTransaction,
+    CustomerTransactionRollup,
+    DailyTransactionRollup,
+    Transaction,
+)
 from .permissions import IsVerifiedCustomer
 from .services.orchestration import (
     TransactionOrchestrationService,
     TransactionOrchestrationServiceError,
 )
-from .services.helpers import bring_transaction
+from .services.archive import TransactionHistory
+from .services.bulk import create_transactions_bulk
+from .services.http_client import transport
+from .services.idempotency import (
+    IdempotencyError,
+    request_fingerprint,
+    run_idempotent,
+)
+from .services.inbox import (
+    append_webhook_event,
+    claim_webhook_delivery,
+    release_webhook_delivery,
+)
+from .services.paymob import (
+    ProviderUnavailableError,
+    flags_flight,
+    paymob_breaker,
+    paymob_limiter,
+)
+from .services.retry import retry_stats
 from .services.webhook import WebhookServiceError, WebhookService
 
 user = get_user_model()
 logger = logging.getLogger(__name__)
 
 
+def provider_unavailable_response(error):
+    """503 with Retry-After while the PayMob circuit breaker is open"""
+    response = Response(
+        {"non_field_errors": [f"{error.details}:{error.message}"]},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    if error.retry_after:
+        response["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def orchestration_error_response(error):
+    """400 naming the transaction left INITIATED, when one was created"""
+    data = {"non_field_errors": [f"{error.details}:{error.message}"]}
+    if error.merchant_order_id:
+        data["merchant_order_id"] = error.merchant_order_id
+    return Response(data, status=status.HTTP_400_BAD_REQUEST)
+
+
 # Create your views here.
 class TransactionViewSet(ModelViewSet):
     http_method_names = ["get", "post"]
@@ -32,42 +88,238 @@ class TransactionViewSet(ModelViewSet):
     pagination_class = TransactionPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["state", "created_at"]
+    # the looked up field depends on the value, see get_object
+    lookup_url_kwarg = "pk"
+
+    @property
+    def paginator(self):
+        """keyset pages with ?pagination=cursor, numbered pages otherwise"""
+        if not hasattr(self, "_paginator") and self.request is not None:
+            params = self.request.query_params
+            if params.get("pagination") == "cursor" or "cursor" in params:
+                self._paginator = TransactionCursorPagination()
+        return super().paginator
 
-    def get_queryset(self):
+    def get_queryset(self, model=Transaction):
         """filter transactions based on user role"""
         role = self.request.user.role_management
         if role == user.Roles.CUSTOMER:
-            return bring_transaction(
+            return model.objects.filter(
                 customer=self.request.user.customer_profile,
             )
-        return Transaction.objects.all()
+        return model.objects.all()
+
+    def get_object(self):
+        """
+        Detail routes take the transaction id or its merchant_order_id
+        (what async clients get back), transactions moved to the archive
+        are still found.
+        """
+        value = self.kwargs[self.lookup_url_kwarg]
+        # merchant order ids are never all digits
+        self.lookup_field = "pk" if value.isdigit() else "merchant_order_id"
+        try:
+            return super().get_object()
+        except Http404:
+            archived = self.get_queryset(ArchivedTransaction).filter(
+                **{self.lookup_field: value}
+            )
+            return get_object_or_404(archived)
+
+    def list(self, request, *args, **kwargs):
+        """
+        List live and archived transactions through the read-only values()
+        fast path, same output as TransactionSerializer.
+        """
+        history = TransactionHistory(
+            live=self.filter_queryset(self.get_queryset()),
+            archived=self.filter_queryset(self.get_queryset(ArchivedTransaction)),
+        ).order_by("-created_at", "-id")
+        rows = history.values(*TransactionListSerializer.columns())
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(TransactionListSerializer(page).data)
+        return Response(TransactionListSerializer(rows).data)
 
     @method_decorator(csrf_protect)
     def create(self, request, *args, **kwargs):
         """
         Create a new transaction with PayMob orchestration.
         CSRF protection for browser clients.
+
+        With an ``Idempotency-Key`` header retries of the same request get
+        the first response back instead of a new transaction.
         """
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            return self._create_transaction(request)
+
+        def handler():
+            response = self._create_transaction(request)
+            return response.status_code, response.data
+
+        try:
+            status_code, data, replayed = run_idempotent(
+                scope=f"transaction:{request.user.id}",
+                key=key,
+                fingerprint=request_fingerprint(request.data),
+                handler=handler,
+            )
+        except IdempotencyError as e:
+            return Response(
+                {"non_field_errors": [f"{e.details}:{e.message}"]},
+                status=e.status,
+            )
+        response = Response(data, status=status_code)
+        if replayed:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+    def _create_transaction(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         customer = request.user.customer_profile
         validated_data = serializer.validated_data
 
+        asynchronous = getattr(settings, "PROVIDER_ASYNC_ORCHESTRATION", False)
         try:
             orchestration_service = TransactionOrchestrationService(customer)
             transaction = orchestration_service.create_transaction(
                 validated_data,
+                asynchronous=asynchronous,
             )
         except TransactionOrchestrationServiceError as e:
-            return Response(
-                {"non_field_errors": [f"{e.details}:{e.message}"]},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+            return orchestration_error_response(e)
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
 
         output_serializer = self.get_serializer(transaction)
+        if asynchronous:
+            # provider steps still running, client polls the status endpoint
+            return Response(output_serializer.data, status=status.HTTP_202_ACCEPTED)
         return Response(output_serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(
+        detail=False,
+        methods=["POST"],
+        url_path="bulk",
+        url_name="bulk",
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_create(self, request, *args, **kwargs):
+        """
+        Create up to BULK_TRANSACTION_MAX_ITEMS transactions in one request.
+
+        Customers create for themselves, staff name the customer of every
+        item. Answers 201 when every item succeeded, 207 with per-item
+        errors otherwise.
+        """
+        serializer = BulkTransactionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["items"]
+
+        if request.user.role_management == user.Roles.CUSTOMER:
+            profile = request.user.customer_profile
+            if not profile.is_verified or any(
+                item.get("customer", profile.id) != profile.id for item in items
+            ):
+                return Response(
+                    {"detail": "Customer profile is not verified."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+            allowed = {profile.id}
+            customer_ids = [profile.id] * len(items)
+        else:
+            customer_ids = [item.get("customer") for item in items]
+            allowed = set(
+                Customer.objects.filter(
+                    id__in=customer_ids, is_verified=True
+                ).values_list("id", flat=True)
+            )
+
+        accepted = [
+            (index, {"customer_id": customer_id, "amount": item["amount"]})
+            for index, (customer_id, item) in enumerate(zip(customer_ids, items))
+            if customer_id in allowed
+        ]
+        results = [
+            {
+                "index": index,
+                "state": None,
+                "error": "Customer:Customer not found or not verified.",
+            }
+            for index in range(len(items))
+        ]
+        try:
+            created = create_transactions_bulk([item for _, item in accepted])
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+        for (index, _), result in zip(accepted, created):
+            result["index"] = index
+            results[index] = result
+
+        failed = sum(1 for result in results if "error" in result)
+        return Response(
+            {"succeeded": len(items) - failed, "failed": failed, "results": results},
+            status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED,
+        )
+
+    @action(detail=True, methods=["POST"], url_path="retry", url_name="retry")
+    def retry(self, request, *args, **kwargs):
+        """
+        Resume the provider steps of an INITIATED transaction from its
+        stored checkpoint, an order created before is reused.
+        """
+        transaction = self.get_object()
+        if transaction.state != Transaction.TransactionState.INITIATED:
+            return Response(
+                {"non_field_errors": [f"Transaction is {transaction.state}."]},
+                status=status.HTTP_409_CONFLICT,
+            )
+        try:
+            TransactionOrchestrationService.process_provider_steps(transaction.id)
+        except TransactionOrchestrationServiceError as e:
+            return orchestration_error_response(e)
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
+        transaction.refresh_from_db()
+        serializer = self.get_serializer(transaction)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["POST"], url_path="pay", url_name="pay")
+    def resume_payment(self, request, *args, **kwargs):
+        """
+        Payment key for a customer returning to pay a PENDING transaction,
+        the stored key while still valid, a reissued one otherwise.
+        """
+        transaction = self.get_object()
+        if transaction.state != Transaction.TransactionState.PENDING:
+            return Response(
+                {"non_field_errors": [f"Transaction is {transaction.state}."]},
+                status=status.HTTP_409_CONFLICT,
+            )
+        try:
+            transaction = TransactionOrchestrationService.resume_payment(transaction)
+        except TransactionOrchestrationServiceError as e:
+            return orchestration_error_response(e)
+        except ProviderUnavailableError as e:
+            return provider_unavailable_response(e)
+
+        serializer = TransactionStatusSerializer(transaction)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=["GET"], url_path="status", url_name="status")
+    def provider_status(self, request, *args, **kwargs):
+        """
+        Return the transaction state and payment token once the provider
+        steps are done (used after an asynchronous create).
+        """
+        transaction = self.get_object()
+        serializer = TransactionStatusSerializer(transaction)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
 
 class PayMobWebHookView(APIView):
     def post(self, request):
@@ -78,31 +330,25 @@ class PayMobWebHookView(APIView):
                     {"Webhook": "Invalid webhook data received."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            # check idempotency based on transaction id
             transaction_id = data.get("id")
-            # None indicate new webhook return after process a transaction
-            transaction = bring_transaction(transaction_id=transaction_id)
-
-            if transaction:
-                # check if transaction is already processed
-                if transaction.state != transaction.TransactionState.PENDING:
-                    logger.warning(
-                        f"Transaction {transaction_id} already processed",
-                    )
-                    return Response(
-                        {"Webhook": "Transaction already processed."},
-                        status=status.HTTP_200_OK,
-                    )
             merchant_id = data.get("order", {}).get("merchant_order_id")
             # Check incoming HMAC signature with computed one internally
             w_service = WebhookService(data, merchant_id, transaction_id)
             received_hmac = request.GET.get("hmac")
             w_service.verify_paymob_hmac(received_hmac)
 
-            # Update transaction and mail this updates
-            TransactionOrchestrationService.update_and_mail_state(
-                merchant_id, transaction_id
-            )
+            # Redelivered callbacks are answered before any db work
+            if not claim_webhook_delivery(transaction_id, received_hmac):
+                return Response(
+                    {"Webhook": "Duplicate delivery ignored."},
+                    status=status.HTTP_200_OK,
+                )
+            # Persist the event, the inbox worker updates and mails the state
+            try:
+                append_webhook_event(data, merchant_id, transaction_id)
+            except Exception:
+                release_webhook_delivery(transaction_id, received_hmac)
+                raise
 
             return Response(
                 {"Webhook": "HMAC successfully verified."},
@@ -116,5 +362,82 @@ class PayMobWebHookView(APIView):
             )
 
 
+class ProviderHealthView(APIView):
+    """
+    Staff view of the PayMob circuit breaker (state, current window
+    counters) and rate limit buckets, and of the PayMob connection pools,
+    retry and state lookup counters of this process.
+    """
+
+    permission_classes = [IsAuthenticated, IsAdminOrStaff]
+
+    def get(self, request):
+        return Response(
+            {
+                "paymob": {
+                    "circuit_breaker": paymob_breaker.snapshot(),
+                    "rate_limits": paymob_limiter.snapshot(),
+                    "pools": transport.stats().get("paymob", {}),
+                    "retries": retry_stats.snapshot(),
+                    "state_lookups": flags_flight.snapshot(),
+                }
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class TransactionAnalyticsView(APIView):
+    """
+    Staff totals read from the rollup tables, cost grows with the number of
+    days/customers asked for, not with the number of transactions.
+
+    ``?group_by=day,state,currency`` (default ``day``) or
+    ``customer,state,currency``, filters ``date_from``, ``date_to``, ``state``
+    and ``currency``. Customer totals have no day, a date range with them
+    answers 400. Totals lag the transactions by one rollup fold.
+    """
+
+    permission_classes = [IsAuthenticated, IsAdminOrStaff]
+
+    def get(self, request):
+        query = TransactionAnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        group_by = params["group_by"]
+
+        if "customer" in group_by:
+            # date filters were refused by the query serializer
+            rows = CustomerTransactionRollup.objects.all()
+        else:
+            rows = DailyTransactionRollup.objects.all()
+            if params.get("date_from"):
+                rows = rows.filter(day__gte=params["date_from"])
+            if params.get("date_to"):
+                rows = rows.filter(day__lte=params["date_to"])
+        if params.get("state"):
+            rows = rows.filter(state=params["state"])
+        if "currency" in params:
+            rows = rows.filter(currency=params["currency"])
+
+        columns = ["customer_id" if name == "customer" else name for name in group_by]
+        totals = (
+            rows.values(*columns)
+            .annotate(transactions=Sum("count"), volume=Sum("amount"))
+            .filter(transactions__gt=0)
+            .order_by(*columns)
+        )
+        results = [
+            {
+                **{name: row[column] for name, column in zip(group_by, columns)},
+                "transactions": row["transactions"],
+                "volume": f"{row['volume']:.2f}",
+            }
+            for row in totals
+        ]
+        return Response(
+            {"group_by": group_by, "results": results}, status=status.HTTP_200_OK
+        )
+
+
 class TransactionView(TemplateView):
     template_name = "zoolflow/transactions/templates/pay.html"